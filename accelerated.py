@@ -0,0 +1,192 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Compiled (Numba) loops filtering and fusing NumPy arrays, used if Numba is
+installed, instead of their NumPy equivalents in `box_filter` and `fusion`.
+
+The NumPy implementations create several temporary arrays of the size of a
+tile: cumulative sums, their differences, the scaled center term and each
+weighted term. The loops below keep a few rows of running sums only and
+write each result once, in place. Fusing, `add_high_pass` adds each filtered
+cell, weighted, to the fused tile as soon as it is computed: the filtered
+tile is never stored. They add and multiply in the same order
+as the NumPy implementations (i.e. the one of `numpy.cumsum`), hence their
+results are bit-identical.
+
+`BACKEND` names the implementation in use, 'numba' or 'numpy'.
+"""
+
+import numpy
+
+try:
+    import numba
+except ImportError:
+    numba = None
+
+BACKEND = 'numba' if numba else 'numpy'
+
+
+def jit(function):
+    """Compile `function` with Numba, if installed. The Python function
+    remains available as the `py_func` attribute, as for Numba's
+    dispatchers."""
+    if numba is None:
+        function.py_func = function
+        return function
+    return numba.njit(cache=True, nogil=True)(function)
+
+
+@jit
+def _high_pass(array, size, centers, weights, out, row_offset, col_offset,
+               accumulate):
+    """
+    Loop filtering `array`, as in `box_filter.high_pass_centers`, within the
+    window of `out` starting at row `row_offset` and column `col_offset`.
+    Unless `accumulate`, filtered values are written in `out`, of shape
+    (centers, rows, cols), a copy of the window per center. Otherwise, they
+    are multiplied by the `weights` of their centers and added to the single
+    array of `out`, of shape (1, rows, cols). Running column sums are kept in
+    a ring of `size` + 1 rows, running row sums in a single row.
+    """
+    rows, cols = array.shape
+    out_rows, out_cols = out.shape[1], out.shape[2]
+    half = size // 2
+    ring = size + 1
+    column_sums = numpy.zeros((ring, cols))
+    column_nulls = numpy.zeros((ring, cols), dtype=numpy.int64)
+    vertical = numpy.empty(cols)
+    vertical_nulls = numpy.empty(cols, dtype=numpy.int64)
+    row_sums = numpy.zeros(cols + 1)
+    row_nulls = numpy.zeros(cols + 1, dtype=numpy.int64)
+
+    for row in range(rows):
+        current = (row + 1) % ring
+        previous = row % ring
+        for col in range(cols):
+            value = array[row, col]
+            null = 0
+            if numpy.isnan(value):
+                value = 0.0
+                null = 1
+            if row == 0:  # as numpy.cumsum, which copies the first value
+                column_sums[current, col] = value
+                column_nulls[current, col] = null
+            else:
+                column_sums[current, col] = column_sums[previous, col] + value
+                column_nulls[current, col] = column_nulls[previous, col] + null
+
+        center_row = row - half
+        out_row = center_row - row_offset
+        if row < size - 1 or out_row < 0 or out_row >= out_rows:
+            continue
+
+        # sums of the `size` rows ending at this one
+        top = (row + 1 - size) % ring
+        for col in range(cols):
+            vertical[col] = column_sums[current, col] - column_sums[top, col]
+            vertical_nulls[col] = (column_nulls[current, col] -
+                                   column_nulls[top, col])
+        row_sums[1] = vertical[0]
+        row_nulls[1] = vertical_nulls[0]
+        for col in range(1, cols):
+            row_sums[col + 1] = row_sums[col] + vertical[col]
+            row_nulls[col + 1] = row_nulls[col] + vertical_nulls[col]
+
+        for col in range(cols - size + 1):
+            out_col = col + half - col_offset
+            if out_col < 0 or out_col >= out_cols:
+                continue
+            window = row_sums[col + size] - row_sums[col]
+            nulls = row_nulls[col + size] - row_nulls[col]
+            value = array[center_row, col + half]
+            if numpy.isnan(value):
+                value = 0.0
+            for index in range(len(centers)):
+                if nulls > 0:
+                    filtered = numpy.nan
+                else:
+                    filtered = (centers[index] + 1) * value - window
+                if accumulate:
+                    out[0, out_row, out_col] = (out[0, out_row, out_col] +
+                                                filtered * weights[index])
+                else:
+                    out[index, out_row, out_col] = filtered
+
+
+@jit
+def _add_unfiltered(array, half, weights, out, row_offset, col_offset):
+    """Loop adding the cells of `array` lacking a full window of `2 * half +
+    1` cells, which the filter copies, times each of the `weights`, to the
+    window of `out` starting at row `row_offset` and column `col_offset`"""
+    rows, cols = array.shape
+    for out_row in range(out.shape[0]):
+        row = out_row + row_offset
+        edge = row < half or row >= rows - half
+        for out_col in range(out.shape[1]):
+            col = out_col + col_offset
+            if edge or col < half or col >= cols - half:
+                for index in range(len(weights)):
+                    out[out_row, out_col] = (out[out_row, out_col] +
+                                             array[row, col] * weights[index])
+
+
+def high_pass_centers(array, size, centers):
+    """
+    Compiled equivalent of `box_filter.high_pass_centers`, for an `array` of
+    float64 values, at least `size` x `size` cells large.
+    """
+    filtered = numpy.empty((len(centers),) + array.shape)
+    filtered[:] = array
+    _high_pass(numpy.ascontiguousarray(array), size,
+               numpy.array(centers, dtype=numpy.int64), numpy.empty(0),
+               filtered, 0, 0, False)
+    return list(filtered)
+
+
+def add_high_pass(out, array, size, centers, weights, offset=(0, 0)):
+    """
+    Add `array`, High Pass Filtered as in `box_filter.high_pass_centers`,
+    with the kernel of each of the `centers` times its weight, to `out`, in
+    place, without storing the filtered array. `out`, a 2D array of float64
+    values, is the window of `array` starting at the (row, column) `offset`.
+    """
+    array = numpy.ascontiguousarray(array, dtype=numpy.float64)
+    weights = numpy.array(weights, dtype=numpy.float64)
+    _add_unfiltered(array, size // 2, weights, out, offset[0], offset[1])
+    _high_pass(array, size, numpy.array(centers, dtype=numpy.int64),
+               weights, out[numpy.newaxis], offset[0], offset[1], True)
+    return out
+
+
+@jit
+def _scale(array, weight, out):
+    """Loop computing `array * weight` in `out`"""
+    rows, cols = array.shape
+    for row in range(rows):
+        for col in range(cols):
+            out[row, col] = array[row, col] * weight
+
+
+@jit
+def _accumulate(array, weight, out):
+    """Loop adding `array * weight` to `out`, in place"""
+    rows, cols = array.shape
+    for row in range(rows):
+        for col in range(cols):
+            out[row, col] = out[row, col] + array[row, col] * weight
+
+
+def add_weighted(terms):
+    """
+    Compiled equivalent of `fusion.add_weighted`, for 2D arrays of float64
+    values, writing the sum in a single array.
+    """
+    fused = None
+    for array, weight in terms:
+        if fused is None:
+            fused = numpy.empty(array.shape)
+            _scale(array, float(weight), fused)
+        else:
+            _accumulate(array, float(weight), fused)
+    return fused
@@ -0,0 +1,201 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Benchmark the stages of the HPFA Image Fusion Technique on synthetic scenes.
+
+Times each stage for one ratio per range in `RATIO_RANGES` and flags stages
+slower than a saved baseline.
+
+Usage:
+
+    python benchmark.py --save benchmark.json       # record a baseline
+    python benchmark.py --baseline benchmark.json   # compare against it
+"""
+
+from __future__ import division
+from __future__ import print_function
+
+import argparse
+import json
+import math
+import platform
+import sys
+import timeit
+
+import numpy
+
+from constants import RATIO_RANGES
+from high_pass_filter import get_kernel_size, get_center_cell
+from high_pass_filter import get_modulator_factor, get_high_pass_filter
+from box_filter import high_pass
+from fusion import add_weighted, match_linear
+from moments import Moments
+from upsample import upsample_bilinear
+
+SIZES = (512, 1024)  # rows and columns of the synthetic Panchromatic arrays
+REPEAT = 3  # timings per stage, the fastest one is kept
+TOLERANCE = 0.25  # slowdown, relative to the baseline, flagged as regression
+RESOLUTION = 0.001  # slowdowns shorter than this (seconds) are timing noise
+SEED = 2008
+
+
+def representative_ratios():
+    """Return the smallest integer ratio of each range in `RATIO_RANGES`"""
+    return [int(math.floor(low)) + 1 for low, _ in RATIO_RANGES]
+
+
+def synthetic_scene(size, ratio, seed=SEED):
+    """Return a synthetic 11-bit (pan, msx) pair, msx at `ratio`"""
+    random = numpy.random.RandomState(seed)
+    rows, cols = numpy.mgrid[0:size, 0:size] / size
+    pan = 600 + 400 * numpy.sin(4 * rows) * numpy.cos(3 * cols)
+    for _ in range(32):
+        row, col = random.randint(0, size - 16, 2)
+        height, width = random.randint(4, 16, 2)
+        pan[row:row + height, col:col + width] += random.uniform(-300, 300)
+    pan += random.normal(0, 20, pan.shape)
+    pan = numpy.clip(numpy.round(pan), 0, 2047)
+
+    low = int(math.ceil(size / ratio))
+    index = numpy.minimum((numpy.arange(low) * ratio).astype(int), size - 1)
+    sums = numpy.add.reduceat(numpy.add.reduceat(pan, index, axis=0),
+                              index, axis=1)
+    counts = numpy.outer(numpy.diff(numpy.append(index, size)),
+                         numpy.diff(numpy.append(index, size)))
+    msx = sums / counts
+    return pan, msx
+
+
+def timed(function, repeat=REPEAT):
+    """Return the result of `function()` and its fastest run, in seconds"""
+    timings = []
+    for _ in range(repeat):
+        start = timeit.default_timer()
+        result = function()
+        timings.append(timeit.default_timer() - start)
+    return result, min(timings)
+
+
+def benchmark_scene(size, ratio, level='Low', modulation='Mid'):
+    """Return the timings of each stage of fusing a synthetic scene"""
+    pan, msx = synthetic_scene(size, ratio)
+    timings = {}
+
+    def kernel():
+        kernel_size = get_kernel_size(ratio)
+        center = get_center_cell(level, kernel_size)
+        get_high_pass_filter(ratio, level)
+        return kernel_size, center
+    (kernel_size, center), timings['kernel'] = timed(kernel)
+
+    hpf, timings['filtering'] = timed(
+        lambda: high_pass(pan, kernel_size, center))
+
+    upsampled, timings['upsampling'] = timed(
+        lambda: upsample_bilinear(msx, ratio, *pan.shape))
+
+    def statistics():
+        return Moments.from_array(msx), Moments.from_array(hpf)
+    (msx_moments, hpf_moments), timings['statistics'] = timed(statistics)
+
+    weighting = (msx_moments.stddev / hpf_moments.stddev *
+                 get_modulator_factor(modulation, ratio))
+
+    def fusion():
+        fused = add_weighted([(upsampled, 1), (hpf, weighting)])
+        fused_moments = Moments.from_array(fused)
+        return match_linear(fused, fused_moments.mean, fused_moments.stddev,
+                            msx_moments.mean, msx_moments.stddev)
+    _, timings['fusion'] = timed(fusion)
+
+    megapixels = pan.size / 1e6
+    return {
+        'size': size,
+        'ratio': ratio,
+        'kernel_size': kernel_size,
+        'megapixels': megapixels,
+        'timings': timings,
+        'throughput': dict((stage, megapixels / seconds if seconds else None)
+                           for stage, seconds in timings.items()),
+    }
+
+
+def scene_key(result):
+    return '{size}x{size}@{ratio:g}'.format(**result)
+
+
+def run(sizes=SIZES):
+    """Benchmark all synthetic scenes, for every size and ratio range"""
+    results = {}
+    for size in sizes:
+        for ratio in representative_ratios():
+            result = benchmark_scene(size, ratio)
+            results[scene_key(result)] = result
+    return {
+        'python': platform.python_version(),
+        'numpy': numpy.__version__,
+        'machine': platform.machine(),
+        'scenes': results,
+    }
+
+
+def regressions(report, baseline, tolerance=TOLERANCE):
+    """Return the (scene, stage, before, after) stages slower than baseline"""
+    slower = []
+    for key, result in sorted(report['scenes'].items()):
+        reference = baseline['scenes'].get(key)
+        if reference is None:
+            continue
+        for stage, seconds in sorted(result['timings'].items()):
+            before = reference['timings'].get(stage)
+            if (before and seconds > before * (1 + tolerance) and
+                    seconds - before > RESOLUTION):
+                slower.append((key, stage, before, seconds))
+    return slower
+
+
+def print_report(report):
+    stages = ('kernel', 'filtering', 'upsampling', 'statistics', 'fusion')
+    print('{0:<16}{1:>6}'.format('scene', 'size') +
+          ''.join('{0:>12}'.format(stage) for stage in stages))
+    for key, result in sorted(report['scenes'].items(),
+                              key=lambda item: (item[1]['size'],
+                                                item[1]['ratio'])):
+        print('{0:<16}{1:>6}'.format(key, result['kernel_size']) +
+              ''.join('{0:>12.4f}'.format(result['timings'][stage])
+                      for stage in stages))
+
+
+def main(arguments=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--sizes', type=int, nargs='+', default=SIZES,
+                        help='rows (and columns) of the Panchromatic arrays')
+    parser.add_argument('--save', metavar='JSON',
+                        help='write the results to this file')
+    parser.add_argument('--baseline', metavar='JSON',
+                        help='flag regressions against this baseline')
+    parser.add_argument('--tolerance', type=float, default=TOLERANCE,
+                        help='relative slowdown flagged as regression')
+    arguments = parser.parse_args(arguments)
+
+    report = run(arguments.sizes)
+    print_report(report)
+
+    if arguments.save:
+        with open(arguments.save, 'w') as output:
+            json.dump(report, output, indent=2, sort_keys=True)
+
+    if arguments.baseline:
+        with open(arguments.baseline) as baseline:
+            slower = regressions(report, json.load(baseline),
+                                 arguments.tolerance)
+        for key, stage, before, seconds in slower:
+            print('REGRESSION {k} {s}: {b:.4f}s -> {t:.4f}s'.format(
+                k=key, s=stage, b=before, t=seconds))
+        return 1 if slower else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
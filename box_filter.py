@@ -0,0 +1,260 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+High Pass Filtering of NumPy arrays based on box sums.
+
+Every kernel returned by `high_pass_filter.get_kernel` consists of -1 except
+for its center cell. Convolving an image with such a kernel equals
+
+    (center + 1) * pixel - sum(window)
+
+where `sum(window)` is the sum of all cells in the `size` x `size` window
+around the pixel. Window sums are derived from running (cumulative) sums,
+hence the cost per pixel does not depend on the kernel size. Kernels of the
+same size, i.e. of the first and second pass, differ only in their center
+cell: they share the window sums of a single read of the image.
+
+Tiles are filtered within the range of columns holding valid cells only:
+cells outside of it are NULL, as their window contains a NULL cell.
+"""
+
+import numpy
+
+import accelerated
+from null_index import valid_columns, null_tile, expand
+from tiling import tiles, halo_range
+
+
+def box_sum(array, size):
+    """
+    Return the sum of every `size` x `size` window of a 2D `array`.
+
+    Only windows that fit entirely inside `array` are summed, i.e. the
+    returned array's shape is `(rows - size + 1, cols - size + 1)`.
+
+    Parameters
+    ----------
+    array: numpy.ndarray
+        Two-dimensional array free of NaN values.
+    size: int
+        Number of rows and columns of the window.
+
+    Returns
+    -------
+    sums: numpy.ndarray
+    """
+    rows, cols = array.shape
+    if rows < size or cols < size:
+        return numpy.empty((max(rows - size + 1, 0), max(cols - size + 1, 0)))
+
+    column_sums = numpy.zeros((rows + 1, cols))
+    numpy.cumsum(array, axis=0, out=column_sums[1:])
+    vertical = column_sums[size:] - column_sums[:-size]
+
+    row_sums = numpy.zeros((vertical.shape[0], cols + 1))
+    numpy.cumsum(vertical, axis=1, out=row_sums[:, 1:])
+    return row_sums[:, size:] - row_sums[:, :-size]
+
+
+def high_pass(array, size, center):
+    """
+    High Pass Filter a 2D `array` with a `size` x `size` kernel of -1 whose
+    center cell equals `center`.
+
+    The result replicates `r.mfilter` (divisor 1): cells whose window
+    contains a NULL (NaN) cell are NULL and the border cells, `size // 2`
+    rows and columns wide, for which the window does not fit inside `array`
+    are copied unfiltered.
+
+    Parameters
+    ----------
+    array: numpy.ndarray
+        Two-dimensional array, NULL cells expressed as NaN.
+    size: int
+        An odd integer, the kernel's number of rows and columns.
+    center: int
+        The kernel's center cell value.
+
+    Returns
+    -------
+    filtered: numpy.ndarray
+        Array of the same shape as `array`.
+
+    Raises
+    ------
+    ValueError: If `size` is not an odd integer.
+    """
+    return high_pass_centers(array, size, [center])[0]
+
+
+def high_pass_centers(array, size, centers):
+    """
+    High Pass Filter a 2D `array`, as in `high_pass`, with several `size` x
+    `size` kernels of -1 whose center cells equal `centers`, computing the
+    window sums once.
+
+    Returns
+    -------
+    filtered: list of numpy.ndarray
+        One array per center, identical to `high_pass(array, size, center)`.
+    """
+    if size % 2 != 1:
+        raise ValueError("Size must be an odd integer, not <%r>" % size)
+
+    array = numpy.asarray(array, dtype=numpy.float64)
+    rows, cols = array.shape
+    if rows < size or cols < size:
+        return [array.copy() for center in centers]
+
+    if accelerated.BACKEND == 'numba':
+        return accelerated.high_pass_centers(array, size, centers)
+
+    half = size // 2
+    inner = (slice(half, rows - half), slice(half, cols - half))
+
+    nulls = numpy.isnan(array)
+    if nulls.any():
+        values = numpy.where(nulls, 0, array)
+        windows = box_sum(values, size)
+        null_windows = box_sum(nulls.astype(numpy.float64), size) > 0
+    else:
+        values = array
+        windows = box_sum(values, size)
+        null_windows = None
+
+    results = []
+    for center in centers:
+        filtered = array.copy()
+        filtered[inner] = (center + 1) * values[inner] - windows
+        if null_windows is not None:
+            filtered[inner][null_windows] = numpy.nan
+        results.append(filtered)
+    return results
+
+
+def high_pass_rows(read, rows, start, stop, size, center):
+    """
+    High Pass Filter rows `start` to `stop` (exclusive) of an image.
+
+    The rows are read along with a halo of `size // 2` rows above and below
+    them, so that the result is identical to the corresponding rows of the
+    entire image filtered at once.
+
+    Parameters
+    ----------
+    read: callable
+        `read(first, last)` returns rows `first` to `last` (exclusive) of the
+        image as a 2D array.
+    rows: int
+        Number of rows of the image.
+    start, stop: int
+        Range of rows to filter.
+    size: int
+        An odd integer, the kernel's number of rows and columns.
+    center: int
+        The kernel's center cell value.
+
+    Returns
+    -------
+    filtered: numpy.ndarray
+    """
+    return high_pass_centers_rows(read, rows, start, stop, size, [center])[0]
+
+
+def high_pass_centers_rows(read, rows, start, stop, size, centers):
+    """
+    High Pass Filter rows `start` to `stop` (exclusive) of an image, as in
+    `high_pass_rows`, with several kernels differing in their `centers`,
+    reading the rows once. Returns a list of arrays, one per center.
+    """
+    half = size // 2
+    first, last = halo_range(start, stop, half, rows)
+    block = read(first, last)
+    cols = block.shape[1]
+    span = valid_columns(block[start - first:stop - first])
+    if span is None:
+        return [null_tile(stop - start, cols) for center in centers]
+
+    # columns holding valid cells, along with a halo
+    left, right = max(span[0] - half, 0), min(span[1] + half, cols)
+    return [expand(filtered[start - first:stop - first,
+                            span[0] - left:span[1] - left], span[0], cols)
+            for filtered in high_pass_centers(block[:, left:right], size,
+                                              centers)]
+
+
+def add_high_pass_rows(out, read, rows, start, stop, size, centers, weights,
+                       columns=None):
+    """
+    Add rows `start` to `stop` (exclusive) of an image, High Pass Filtered
+    as in `high_pass_centers_rows`, with the kernel of each of the `centers`
+    times its weight, to `out`, in place, within the (first, last) range of
+    `columns`, if given. The compiled loops add each filtered cell as soon
+    as it is computed, without storing the filtered rows.
+
+    Returns
+    -------
+    out: numpy.ndarray
+        The 2D array of float64 values of `stop - start` rows and of the
+        columns of `columns`, or of the image, the filtered rows are added to.
+    """
+    first_col, last_col = columns or (0, out.shape[1])
+    if accelerated.BACKEND != 'numba':
+        for filtered, weight in zip(high_pass_centers_rows(read, rows, start,
+                                                           stop, size,
+                                                           centers),
+                                    weights):
+            out += filtered[:, first_col:last_col] * weight
+        return out
+
+    half = size // 2
+    first, last = halo_range(start, stop, half, rows)
+    block = read(first, last)
+    span = valid_columns(block[start - first:stop - first])
+    if span is not None:
+        # columns of `out` holding valid cells, filtered along with a halo
+        left, right = max(span[0] - half, 0), min(span[1] + half,
+                                                  block.shape[1])
+        valid = max(span[0], first_col), min(span[1], last_col)
+    if span is None or valid[0] >= valid[1]:
+        valid = (first_col, first_col)
+    for weight in weights:
+        out[:, :valid[0] - first_col] += numpy.nan * weight
+        out[:, valid[1] - first_col:] += numpy.nan * weight
+    if valid[0] < valid[1]:
+        accelerated.add_high_pass(
+            out[:, valid[0] - first_col:valid[1] - first_col],
+            block[:, left:right], size, centers, weights,
+            offset=(start - first, valid[0] - left))
+    return out
+
+
+def high_pass_tiles(read, rows, size, center, tile_rows):
+    """
+    High Pass Filter an image tile by tile, as in `high_pass_rows`.
+
+    Yields
+    ------
+    start, stop, filtered:
+        The range of rows of a tile and the filtered tile.
+    """
+    for start, stop in tiles(rows, tile_rows):
+        yield start, stop, high_pass_rows(read, rows, start, stop, size,
+                                          center)
+
+
+def high_pass_centers_tiles(read, rows, size, centers, tile_rows):
+    """
+    High Pass Filter an image tile by tile with several kernels differing in
+    their `centers`, as in `high_pass_centers_rows`.
+
+    Yields
+    ------
+    start, stop, filtered:
+        The range of rows of a tile and a list of the tile filtered by each
+        kernel.
+    """
+    for start, stop in tiles(rows, tile_rows):
+        yield start, stop, high_pass_centers_rows(read, rows, start, stop,
+                                                  size, centers)
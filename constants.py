@@ -29,7 +29,10 @@ RATIO_RANGES = (
 
 KERNEL_SIZES = (5, 7, 9, 11, 13, 15)
 
-MATRIX_PROPERTIES = zip(RATIO_RANGES, KERNEL_SIZES)
+MATRIX_PROPERTIES = tuple(zip(RATIO_RANGES, KERNEL_SIZES))
+
+# Upper bounds of all but the last ratio range, for bisecting ratios
+RATIO_BOUNDS = tuple(hi for (lo, hi) in RATIO_RANGES[:-1])
 
 
 # Replicating ERDAS' Imagine parameters -------------------------------------
@@ -58,6 +61,10 @@ MODULATOR = {
 
 MODULATOR_2 = {'Min': 0.25, 'Mid': 0.35, 'Max': 0.50}
 
+SECOND_PASS_RATIO = 5.5  # lowest ratio for which the 2nd pass applies
+
+LEVELS = ('Low', 'Mid', 'High')  # of center cell values
+
 FILTER_TEMPLATE = """\
 MATRIX    {size}
 {kernel}
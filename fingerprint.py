@@ -0,0 +1,60 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Fingerprints of fused images, recorded in their history, identifying the
+inputs and parameters an image was fused from. An image whose fingerprint
+matches the one of a new request need not be fused again.
+
+The history also records the parameters of the fusion (i.e. the weights of
+the HPF images), so that part of an image can be fused again consistently.
+"""
+
+import hashlib
+import json
+import re
+
+VERSION = 1  # increased whenever the fused values change for same parameters
+FINGERPRINT = 'Fingerprint: '  # prefix of the history entry
+PATTERN = re.compile(re.escape(FINGERPRINT) + r'([0-9a-f]{40})')
+PARAMETERS = 'Fusion parameters: '  # prefix of the history entry
+
+
+def fingerprint(properties):
+    """
+    Return the fingerprint, a hexadecimal SHA-1 digest, of `properties`, a
+    JSON serialisable dictionary of the inputs and parameters of a fusion.
+    """
+    properties = dict(properties, version=VERSION)
+    text = json.dumps(properties, sort_keys=True)
+    return hashlib.sha1(text.encode('utf-8')).hexdigest()
+
+
+def history_entry(digest):
+    """Return the history entry recording a fingerprint"""
+    return FINGERPRINT + digest
+
+
+def find_fingerprint(history):
+    """Return the last fingerprint recorded in the `history` text of an
+    image, or None"""
+    found = PATTERN.findall(history)
+    return found[-1] if found else None
+
+
+def parameters_entry(parameters):
+    """Return the history entry recording the `parameters` of a fusion, a
+    JSON serialisable dictionary, free of whitespace"""
+    return PARAMETERS + json.dumps(parameters, sort_keys=True,
+                                   separators=(',', ':'))
+
+
+def find_parameters(history):
+    """Return the last parameters of a fusion recorded in the `history` text
+    of an image, or None. `r.support` splits long entries in several lines
+    of the history, hence whitespace is ignored."""
+    position = history.rfind(PARAMETERS)
+    if position < 0:
+        return None
+    text = ''.join(history[position + len(PARAMETERS):].split())
+    return json.JSONDecoder().raw_decode(text)[0]
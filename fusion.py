@@ -0,0 +1,77 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Fusing NumPy arrays: adding weighted High Pass Filtered images to an
+upsampled Multi-Spectral image and, optionally, matching linearly the
+result's mean and standard deviation to the ones of the Multi-Spectral image,
+or its histogram via a lookup table (see `histogram.matching_table`).
+
+The arithmetic follows the order of the equivalent r.mapcalc expressions.
+"""
+
+import numpy
+
+import accelerated
+
+
+def add_weighted(terms):
+    """
+    Return the sum of weighted arrays, given as (array, weight) pairs.
+    """
+    if accelerated.BACKEND == 'numba':
+        return accelerated.add_weighted(terms)
+    fused = None
+    for array, weight in terms:
+        weighted = array * weight
+        fused = weighted if fused is None else fused + weighted
+    return fused
+
+
+def match_linear(array, mean, sd, target_mean, target_sd):
+    """
+    Stretch linearly an `array` of known `mean` and standard deviation `sd`
+    to match `target_mean` and `target_sd`.
+    """
+    return (array - mean) / sd * target_sd + target_mean
+
+
+def match_histogram(array, low, high, table):
+    """
+    Match the histogram of an `array` via a lookup `table` of the values of
+    evenly spaced values from `low` to `high`, interpolated linearly, as in
+    the `graph()` function of r.mapcalc. Values beyond the range are mapped
+    to the ones of its bounds. NaN (NULL) cells remain NaN.
+    """
+    table = numpy.asarray(table, dtype=numpy.float64)
+    segments = len(table) - 1
+    position = (numpy.asarray(array) - low) * (segments / float(high - low))
+    with numpy.errstate(invalid='ignore'):
+        position = numpy.clip(position, 0, segments)
+    index = numpy.minimum(numpy.nan_to_num(position).astype(int),
+                          segments - 1)
+    fraction = position - index
+    return table[index] + fraction * (table[index + 1] - table[index])
+
+
+def bit_depth_range(minimum, maximum):
+    """
+    Return the (lowest, highest) integers of the bit depth of values ranging
+    from `minimum` to `maximum`, i.e. (0, 2047) for an 11-bit image.
+    """
+    magnitude = int(numpy.ceil(max(abs(minimum), abs(maximum))))
+    bits = max(magnitude.bit_length(), 1)
+    if minimum < 0:
+        return -2 ** bits, 2 ** bits - 1
+    return 0, 2 ** bits - 1
+
+
+def round_clamp(array, low, high):
+    """
+    Round an `array` to the nearest integers, halves away from zero as the
+    round() function of r.mapcalc, and clamp it to the range from `low` to
+    `high`. NaN (NULL) cells remain NaN.
+    """
+    array = numpy.asarray(array)
+    return numpy.clip(numpy.trunc(array + numpy.copysign(0.5, array)), low,
+                      high)
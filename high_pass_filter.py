@@ -6,7 +6,57 @@
 """
 
 import os
-from constants import MATRIX_PROPERTIES, CENTER_CELL, MODULATOR, MODULATOR_2, FILTER_TEMPLATE
+from bisect import bisect_right
+from collections import namedtuple
+
+try:
+    import numpy
+except ImportError:  # required by the kernel arrays, batch lookups, `fuse()`
+    numpy = None
+
+from constants import RATIO_RANGES, RATIO_BOUNDS, KERNEL_SIZES, LEVELS
+from constants import CENTER_CELL, MODULATOR, MODULATOR_2, FILTER_TEMPLATE
+from constants import SECOND_PASS_RATIO
+
+
+def get_ratio_index(ratio):
+    """
+    Return the index of the range of `RATIO_RANGES` in which `ratio` falls,
+    via bisection.
+
+    Raises
+    ------
+    ValueError: If `ratio` is lower than the lowest range.
+    """
+    if ratio < RATIO_RANGES[0][0]:
+        raise ValueError("Ratio must be >= %r, not <%r>"
+                         % (RATIO_RANGES[0][0], ratio))
+    return bisect_right(RATIO_BOUNDS, ratio)
+
+
+def get_ratio_indices(ratios):
+    """
+    Return the indices of the ranges of `RATIO_RANGES` in which each of the
+    `ratios`, an array, falls.
+    """
+    ratios = numpy.asarray(ratios, dtype=numpy.float64)
+    if (ratios < RATIO_RANGES[0][0]).any():
+        raise ValueError("Ratios must be >= %r" % RATIO_RANGES[0][0])
+    return numpy.searchsorted(RATIO_BOUNDS, ratios, side='right')
+
+
+def get_size_index(kernel_size):
+    """
+    Return the index of `kernel_size` in `KERNEL_SIZES`.
+
+    Raises
+    ------
+    ValueError: If `kernel_size` is not one of `KERNEL_SIZES`.
+    """
+    index = bisect_right(KERNEL_SIZES, kernel_size) - 1
+    if index < 0 or KERNEL_SIZES[index] != kernel_size:
+        raise ValueError("%r is not one of %r" % (kernel_size, KERNEL_SIZES))
+    return index
 
 
 def get_kernel_size(ratio):
@@ -15,8 +65,15 @@ def get_kernel_size(ratio):
     Based on a float ratio, ranging in (1.0, 10.0).
     Returns a single integer
     """
-    kernel_size = [k for ((lo, hi), k) in MATRIX_PROPERTIES if lo <= ratio < hi][0]
-    return kernel_size
+    return KERNEL_SIZES[get_ratio_index(ratio)]
+
+
+def get_kernel_sizes(ratios):
+    """
+    Batch variant of `get_kernel_size`: returns an array of kernel sizes for
+    an array of `ratios`.
+    """
+    return numpy.asarray(KERNEL_SIZES)[get_ratio_indices(ratios)]
 
 
 def get_center_cell(level, kernel_size):
@@ -25,9 +82,7 @@ def get_center_cell(level, kernel_size):
     cell value.
     """
     level = level.capitalize()
-    kernel_size_idx = [k for ((lo, hi), k) in MATRIX_PROPERTIES].index(kernel_size)
-    center = [cc for cc in CENTER_CELL[level]][kernel_size_idx]
-    return center
+    return CENTER_CELL[level][get_size_index(kernel_size)]
 
 
 def get_modulator_factor(modulation, ratio):
@@ -50,13 +105,20 @@ def get_modulator_factor(modulation, ratio):
     modulation_factor: float
 
     """
-    kernel_size = get_kernel_size(ratio)
-    kernel_size_idx = [k for ((lo, hi), k) in MATRIX_PROPERTIES].index(kernel_size)
     modulation = modulation.capitalize()
-    modulation_factor = [mf for mf in MODULATOR[modulation]][kernel_size_idx]
+    modulation_factor = MODULATOR[modulation][get_ratio_index(ratio)]
     return modulation_factor
 
 
+def get_modulator_factors(modulation, ratios):
+    """
+    Batch variant of `get_modulator_factor`: returns an array of modulation
+    factors for an array of `ratios`.
+    """
+    modulation = modulation.capitalize()
+    return numpy.asarray(MODULATOR[modulation])[get_ratio_indices(ratios)]
+
+
 def get_modulator_factor2(modulation):
     """
     Return the modulation factor for the second pass of the
@@ -114,7 +176,7 @@ def get_kernel(size, level):
     if size % 2 != 1:
         raise ValueError("Size must be an odd integer, not <%r>" % size)
     center = get_center_cell(level, size)
-    kernel = [get_row(size)] * size
+    kernel = [get_row(size) for _ in range(size)]
     kernel[size // 2] = get_mid_row(size, center)
     return kernel
 
@@ -137,11 +199,144 @@ def get_high_pass_filter(ratio, level='Low', divisor=1, type='P'):
 
     """
     size = get_kernel_size(ratio)
-    kernel = get_kernel(size, level)
+    if divisor == 1 and type == 'P':
+        return get_kernel_properties(size, level).filter
+    return format_filter(get_kernel(size, level), divisor, type)
+
+
+def format_filter(kernel, divisor=1, type='P'):
+    """
+    Return the r.mfilter filter file contents for a `kernel`, a list of
+    lists.
+    """
     filter = FILTER_TEMPLATE.format(
         kernel=matrix_to_string(kernel),
         divisor=divisor,
         type=type,
-        size=size,
+        size=len(kernel),
     )
     return filter
+
+
+KernelProperties = namedtuple(
+    'KernelProperties', 'size level center array filter coefficients')
+KernelProperties.__doc__ = """
+Ready-made properties of a kernel:
+
+- size, level, center: kernel size, center cell level and value
+- array: read-only NumPy array of the kernel, or None without NumPy
+- filter: r.mfilter filter file contents (divisor 1, parallel)
+- coefficients: (pixel, box sum) coefficients of the equivalent box-sum
+  filter, i.e. `(center + 1) * pixel - box_sum(window)`
+"""
+
+
+def _compile_kernel(size, level):
+    kernel = get_kernel(size, level)
+    array = None
+    if numpy is not None:
+        array = numpy.array(kernel, dtype=numpy.int32)
+        array.flags.writeable = False
+    center = get_center_cell(level, size)
+    return KernelProperties(size=size, level=level, center=center,
+                            array=array, filter=format_filter(kernel),
+                            coefficients=(center + 1, -1))
+
+
+# Immutable table of all kernel sizes x levels, indexed by size, then level
+KERNEL_TABLE = tuple(tuple(_compile_kernel(size, level) for level in LEVELS)
+                     for size in KERNEL_SIZES)
+
+
+def get_kernel_properties(size, level):
+    """
+    Return the precomputed `KernelProperties` of the kernel of `size` and
+    center cell `level`.
+    """
+    level = level.capitalize()
+    return KERNEL_TABLE[get_size_index(size)][LEVELS.index(level)]
+
+
+def get_kernels(level, ratios):
+    """
+    Batch variant of `get_kernel_properties`: returns the precomputed
+    `KernelProperties` (kernel array, filter and box-sum coefficients) of
+    center cell `level` for each of the `ratios`, an array.
+    """
+    column = LEVELS.index(level.capitalize())
+    return [KERNEL_TABLE[index][column]
+            for index in get_ratio_indices(ratios).ravel()]
+
+
+def get_center_cells(level, kernel_sizes):
+    """
+    Batch variant of `get_center_cell`: returns an array of center cell
+    values for an array of `kernel_sizes`.
+    """
+    kernel_sizes = numpy.asarray(kernel_sizes)
+    indices = numpy.searchsorted(KERNEL_SIZES, kernel_sizes)
+    indices = numpy.minimum(indices, len(KERNEL_SIZES) - 1)
+    if (numpy.asarray(KERNEL_SIZES)[indices] != kernel_sizes).any():
+        raise ValueError("Kernel sizes must be one of %r" % (KERNEL_SIZES,))
+    column = LEVELS.index(level.capitalize())
+    centers = numpy.array([row[column].center for row in KERNEL_TABLE])
+    return centers[indices]
+
+
+def get_weight(msx_sd, hpf_sd, modulator):
+    """
+    Return the weight of a High Pass Filtered image: the ratio of the
+    standard deviation of the Multi-Spectral image, `msx_sd`, to the one of
+    the High Pass Filtered image, `hpf_sd`, times the `modulator` factor.
+    """
+    return msx_sd / hpf_sd * modulator
+
+
+def fuse(pan, msx_bands, ratio, center='low', modulation='mid',
+         second_pass=False, center2='low', modulation2='mid',
+         histogram_match=False):
+    """Fuse in-memory arrays via the HPFA, without a GRASS GIS session"""
+    # NumPy based modules, imported here so that the module does not
+    # require NumPy otherwise
+    from box_filter import high_pass_centers
+    from fusion import add_weighted, match_linear
+    from moments import Moments
+    from upsample import upsample_bilinear
+
+    pan = numpy.asarray(pan, dtype=numpy.float64)
+    size = get_kernel_size(ratio)
+    levels = [center]
+    if second_pass and ratio > SECOND_PASS_RATIO:
+        levels.append(center2)
+    hpfs = high_pass_centers(pan, size, [get_center_cell(level, size)
+                                         for level in levels])
+    hpf_sds = [Moments.from_array(hpf).stddev for hpf in hpfs]
+    modulators = [get_modulator_factor(modulation, ratio),
+                  get_modulator_factor2(modulation2)][:len(hpfs)]
+
+    fused_bands = []
+    for msx in msx_bands:
+        msx = numpy.asarray(msx, dtype=numpy.float64)
+        if msx.shape == pan.shape:
+            upsampled = msx
+        else:
+            factor = int(round(ratio))
+            if abs(ratio - factor) > 1e-6:
+                raise ValueError("Upsampling requires an integer ratio, not "
+                                 "<%r>" % ratio)
+            upsampled = upsample_bilinear(msx, factor, *pan.shape)
+
+        statistics = Moments.from_array(msx)
+        terms = [(upsampled, 1)]
+        for hpf, hpf_sd, modulator in zip(hpfs, hpf_sds, modulators):
+            terms.append((hpf, get_weight(statistics.stddev, hpf_sd,
+                                          modulator)))
+        fused = add_weighted(terms)
+
+        if histogram_match:
+            fused_statistics = Moments.from_array(fused)
+            fused = match_linear(fused, fused_statistics.mean,
+                                 fused_statistics.stddev, statistics.mean,
+                                 statistics.stddev)
+        fused_bands.append(fused)
+    return fused_bands
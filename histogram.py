@@ -0,0 +1,127 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Histogram matching of NumPy arrays via lookup tables.
+
+Values are counted in bins of a fixed width, the quantum, anchored at 0, so
+that histograms of tiles, accumulated independently (and in parallel), are
+merged by adding their counts. The range of the bins grows with the values.
+
+Matching maps a value to the one of the source image at the same quantile:
+the cumulative distribution functions (CDF) of both histograms, linear
+within each bin, are turned into a lookup table, a piecewise linear function
+sampled at `TABLE_SIZE` + 1 evenly spaced values spanning the range of the
+matched image. Applying it costs a single table lookup per cell, see
+`fusion.match_histogram`, or a `graph()` function of r.mapcalc.
+"""
+
+from __future__ import division
+
+import numpy
+
+BINS_PER_SD = 64  # bins per standard deviation of the source image
+TABLE_SIZE = 256  # segments of the lookup table
+DIGITS = 7  # significant digits of the values of the lookup table
+
+
+def histogram_quantum(sd, bins_per_sd=BINS_PER_SD):
+    """
+    Return the width of the bins of histograms of images whose standard
+    deviation is (in the order of) `sd`.
+    """
+    return sd / bins_per_sd if sd > 0 else 1.0
+
+
+class Histogram(object):
+    """
+    Accumulator of the counts of values in bins of width `quantum`, updated
+    tile by tile
+    """
+    def __init__(self, quantum, offset=0, counts=None):
+        self.quantum = quantum
+        self.offset = offset  # index of the first bin
+        self.counts = (numpy.zeros(0, dtype=numpy.int64) if counts is None
+                       else counts)
+
+    @classmethod
+    def from_array(cls, array, quantum, valid=None):
+        """Return the histogram of the non-NaN cells of an array, which are
+        not NaN in the `valid` array either, if given"""
+        values = numpy.asarray(array, dtype=numpy.float64)
+        mask = ~numpy.isnan(values)
+        if valid is not None:
+            mask &= ~numpy.isnan(valid)
+        values = values[mask]
+        if not values.size:
+            return cls(quantum)
+        bins = numpy.floor(values / quantum).astype(numpy.int64)
+        offset = int(bins.min())
+        return cls(quantum, offset, numpy.bincount(bins - offset))
+
+    def merge(self, other):
+        """Merge the counts of `other`, of the same quantum, into these
+        ones"""
+        if not other.count:
+            return self
+        if not self.count:
+            self.offset, self.counts = other.offset, other.counts.copy()
+            return self
+        first = min(self.offset, other.offset)
+        last = max(self.offset + len(self.counts),
+                   other.offset + len(other.counts))
+        counts = numpy.zeros(last - first, dtype=numpy.int64)
+        for histogram in (self, other):
+            start = histogram.offset - first
+            counts[start:start + len(histogram.counts)] += histogram.counts
+        self.offset, self.counts = first, counts
+        return self
+
+    def update(self, array, valid=None):
+        """Accumulate the histogram of an array (tile), see `from_array`"""
+        return self.merge(Histogram.from_array(array, self.quantum, valid))
+
+    @property
+    def count(self):
+        return int(self.counts.sum())
+
+    def edges(self):
+        """Return the edges of the bins"""
+        return (self.offset + numpy.arange(len(self.counts) + 1)) * \
+            self.quantum
+
+    def cdf(self):
+        """Return the fraction of values below each edge of the bins"""
+        cumulative = numpy.concatenate(([0], numpy.cumsum(self.counts)))
+        return cumulative / float(self.count)
+
+    def quantiles(self, probabilities):
+        """Return the values at `probabilities` of the CDF, linear within
+        each bin, skipping empty bins"""
+        nonzero = numpy.flatnonzero(self.counts)
+        edges, cdf = self.edges(), self.cdf()
+        values = numpy.column_stack((edges[nonzero], edges[nonzero + 1]))
+        fractions = numpy.column_stack((cdf[nonzero], cdf[nonzero + 1]))
+        return numpy.interp(probabilities, fractions.ravel(), values.ravel())
+
+
+def matching_table(source, target, size=TABLE_SIZE):
+    """
+    Return the lookup table matching the histogram of an image, `target`, to
+    the one of a `source` image, or None if either is empty.
+
+    Returns
+    -------
+    matching: dict
+        `low` and `high` bounds of the range of the target image and the
+        `table` of the `size` + 1 matched values of evenly spaced values
+        from `low` to `high`.
+    """
+    if not source.count or not target.count:
+        return None
+    edges = target.edges()
+    positions = numpy.linspace(edges[0], edges[-1], size + 1)
+    values = source.quantiles(numpy.interp(positions, edges, target.cdf()))
+    return dict(low=float(edges[0]), high=float(edges[-1]),
+                table=[float('{v:.{d}g}'.format(v=value, d=DIGITS))
+                       for value in values])
@@ -75,18 +75,33 @@
 #%  description: Match color table of Pan-Sharpened output to Multi-Spectral input
 #%end
 
+#%flag
+#%  key: s
+#%  description: Stream the High-Pass-Filtered image(s), recomputing them while fusing, instead of writing them (engine=numpy)
+#%end
+
+#%flag
+#%  key: w
+#%  description: Serve fusion jobs, JSON lines read from standard input (scenes as in a manifest, optionally with an id and an extent), writing a JSON line of results and timings per job
+#%end
+
+#%flag
+#%  key: p
+#%  description: Profile the Python side of the module (cProfile, tracemalloc), writing the profile next to the report, or in the current directory
+#%end
+
 #%option G_OPT_R_INPUT
 #% key: pan
 #% key_desc: filename
 #% description: High resolution Panchromatic image
-#% required : yes
+#% required : no
 #%end
 
 #%option G_OPT_R_INPUTS
 #% key: msx
 #% key_desc: filename(s)
 #% description: Low resolution Multi-Spectral image(s)
-#% required: yes
+#% required: no
 #% multiple: yes
 #%end
 
@@ -167,6 +182,18 @@
 #% multiple : no
 #%end
 
+#%option
+#% key: match
+#% key_desc: string
+#% type: string
+#% label: Histogram matching method (use -l flag)
+#% description: Match linearly the mean and standard deviation of the Pan-Sharpened image(s) to the ones of the Multi-Spectral image(s), or their entire histograms via a lookup table
+#% options: linear,histogram
+#% answer: linear
+#% required: no
+#% guisection: Crispness
+#%end
+
 #%option
 #% key: trim
 #% key_desc: rational number
@@ -177,14 +204,116 @@
 #% required: no
 #%end
 
+#%option
+#% key: tile_size
+#% key_desc: megabytes
+#% type: integer
+#% label: Tile size (MB)
+#% description: Memory used by the numpy engine, which filters and fuses images tile by tile
+#% answer: 256
+#% required: no
+#% guisection: High Pass Filter
+#%end
+
+#%option
+#% key: nprocs
+#% key_desc: integer
+#% type: integer
+#% label: Number of parallel processes
+#% description: Number of Multi-Spectral images to fuse, or of tiles to compute statistics of (statistics=tiles), in parallel
+#% answer: 1
+#% required: no
+#%end
+
+#%option
+#% key: sample
+#% key_desc: fraction
+#% type: double
+#% label: Fraction of cells sampled for the weighting statistics
+#% description: Estimate the standard deviations weighting the HPF image(s) from a stratified sample of this fraction of cells (e.g. 0.01), instead of scanning all cells
+#% options: 0.0-1.0
+#% required: no
+#% guisection: Crispness
+#%end
+
+#%option
+#% key: statistics
+#% key_desc: string
+#% type: string
+#% label: Statistics engine
+#% description: Engine computing the statistics weighting the HPF image(s) and, if matching histograms (-l), the ones of the fused image(s)
+#% descriptions: univar;A single r.univar pass per image;tiles;Moments of tiles computed in-process by nprocs processes and merged (Chan et al., 1979), unless fusing images in parallel
+#% options: univar,tiles
+#% answer: univar
+#% required: no
+#% guisection: Crispness
+#%end
+
+#%option G_OPT_R_TYPE
+#% label: Cell type of the output(s) and intermediate images
+#% description: DCELL (8 bytes per cell), FCELL (4 bytes) or CELL, rounded and clamped to the bit depth of the Multi-Spectral image(s); intermediate images are FCELL unless DCELL
+#% answer: DCELL
+#% required: no
+#%end
+
+#%option G_OPT_F_INPUT
+#% key: manifest
+#% label: Manifest of scenes to fuse in a batch (CSV or JSON)
+#% description: Scenes of a pan and msx image(s), optionally overriding suffix, ratio, center(2), modulation(2), trim, sample, type, match and the l, 2, c flags
+#% required: no
+#%end
+
+#%option
+#% key: update
+#% key_desc: n,s,e,w
+#% type: double
+#% label: Changed extent to fuse again (n,s,e,w)
+#% description: Fuse again only the extent of changed input(s), expanded by the cells depending on it, and patch it into the existing output(s)
+#% multiple: yes
+#% required: no
+#%end
+
+#%option G_OPT_F_OUTPUT
+#% key: report
+#% label: Report of timings and resources (JSON)
+#% description: Wall and CPU time, pixels, throughput, peak memory and temporary disk per stage and external command, for the run and for each image, along with its weights and statistics
+#% required: no
+#%end
+
+#%rules
+#% required: pan,manifest,-w
+#% exclusive: pan,manifest,-w
+#% exclusive: update,manifest,-w
+#% collective: pan,msx
+#%end
+
+#%option
+#% key: engine
+#% key_desc: string
+#% type: string
+#% label: High Pass Filtering engine
+#% description: Engine applying the High-Pass-Filter on the Panchromatic image
+#% descriptions: mfilter;Convolution via r.mfilter, fusion via r.mapcalc;numpy;In-process, tiled, box-sum filtering (whose cost does not depend on the kernel size) and fusion
+#% options: mfilter,numpy
+#% answer: mfilter
+#% required: no
+#% guisection: High Pass Filter
+#% multiple : no
+#%end
+
 # StdLib
 import os
+import glob
+import json
 import sys
 import atexit
+from collections import OrderedDict, namedtuple
+from contextlib import contextmanager
+from multiprocessing import Pool, current_process
 
 # check if within a GRASS session?
 if "GISBASE" not in os.environ:
-    print "You must be in GRASS GIS to run this program."
+    print("You must be in GRASS GIS to run this program.")
     sys.exit(1)
 
 # PyGRASS
@@ -201,47 +330,292 @@ sys.path.append(path)
 
 # import modules from "etc"
 from high_pass_filter import get_high_pass_filter, get_modulator_factor, get_modulator_factor2
+from high_pass_filter import get_kernel_size, get_center_cell, get_weight
+from constants import SECOND_PASS_RATIO
+from fingerprint import fingerprint, history_entry, find_fingerprint
+from fingerprint import parameters_entry, find_parameters
+import instrumentation
+from instrumentation import report, stage, staged, note
+from manifest import read_manifest, parse_job, scene_flags
+from profiling import profiled, tracemalloc
+from tiling import rows_per_tile, tiles, inner_tile
+
+# in-process filtering, fusion and statistics (engine=numpy, statistics=tiles,
+# sample, type=CELL, match=histogram and -s), which require NumPy
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+if numpy is not None:
+    from accelerated import BACKEND
+    from box_filter import high_pass_centers_tiles
+    from fusion import add_weighted, match_linear, match_histogram
+    from fusion import bit_depth_range, round_clamp
+    from histogram import Histogram, histogram_quantum, matching_table
+    from moments import Moments, merge_pairwise
+    from null_index import NullIndex, null_tile, expand
+    from raster_blocks import set_region, RowReader, FilteredRowReader
+    from raster_blocks import RowWriter, UpsampledRowReader
+    from sampling import stratified_sample, row_runs, run_length
+    from sampling import rows_fraction, stddev_error, weight_error
+    from upsample import integer_ratio
+else:
+    BACKEND = None
+
+
+# Stages of raster commands record the cells of the region, except while
+# profiling (-p flag), which would profile a g.region query per stage
+count_pixels = True
+
+
+def region_cells():
+    """Number of cells of the current region"""
+    region = grass.region()
+    return region['rows'] * region['cols']
+
+
+def stage_cells():
+    """Number of cells of the current region, processed by a stage, or None
+    while profiling (see `count_pixels`)"""
+    return region_cells() if count_pixels else None
 
 
 def run(cmd, **kwargs):
     """Pass arbitrary number of key-word arguments to grass commands and the
-    "quiet" flag by default."""
-    grass.run_command(cmd, quiet=True, **kwargs)
+    "quiet" flag by default. Raster commands are recorded as stages of the
+    active report, along with the number of cells of the region, see
+    `count_pixels`."""
+    with stage(cmd, pixels=stage_cells if cmd.startswith('r.') else None):
+        grass.run_command(cmd, quiet=True, **kwargs)
 
 
 def cleanup():
-    """Clean up temporary maps"""
-    pattern = 'tmp.{pid}*'.format(pid=os.getpid())
-    run('g.remove', flags="f", type="raster", pattern=pattern)
+    """Clean up temporary maps and regions, and forget the statistics
+    memoized for the former (by later jobs of the worker mode)"""
+    prefix = 'tmp.{pid}.'.format(pid=os.getpid())
+    run('g.remove', flags="f", type="raster,region", pattern=prefix + '*')
+    for key in list(univar_cache):
+        if isinstance(key[0], str) and key[0].startswith(prefix):
+            del univar_cache[key]
+
+
+@contextmanager
+def use_region(name):
+    """Operate on the saved region `name`, if any, instead of the current
+    region"""
+    previous = os.environ.get('WIND_OVERRIDE')
+    if name:
+        os.environ['WIND_OVERRIDE'] = name
+    try:
+        yield
+    finally:
+        if previous:
+            os.environ['WIND_OVERRIDE'] = previous
+        else:
+            os.environ.pop('WIND_OVERRIDE', None)
+
+
+@contextmanager
+def private_region(name):
+    """Operate on a copy, named `name`, of the current region. Modifying it
+    does not affect the region of concurrently running processes."""
+    run('g.region', save=name, overwrite=True)
+    try:
+        with use_region(name):
+            yield
+    finally:
+        run('g.remove', flags='f', type='region', name=name)
+
+
+def trimmed_extent(region, trimming_factor, msx_nsres, msx_ewres):
+    """Extent, a dictionary of n, s, e, w, of the `region` trimmed by
+    `trimming_factor` times the resolution of the Multi-Spectral image"""
+    return dict(n=region['n'] - trimming_factor * msx_nsres,
+                s=region['s'] + trimming_factor * msx_nsres,
+                e=region['e'] - trimming_factor * msx_ewres,
+                w=region['w'] + trimming_factor * msx_ewres)
+
+
+@contextmanager
+def cropped_region(name, extent, halo=0):
+    """Operate on a copy, named `name`, of the current region cropped to the
+    `extent`, a dictionary of n, s, e, w, expanded by `halo` cells within the
+    current region. Yields the number of cells (top, bottom, left, right)
+    expanding the extent. Operate on the current region if `extent` is
+    None."""
+    if not extent:
+        yield None
+        return
+    region = grass.region()
+    n = min(extent['n'] + halo * region['nsres'], region['n'])
+    s = max(extent['s'] - halo * region['nsres'], region['s'])
+    e = min(extent['e'] + halo * region['ewres'], region['e'])
+    w = max(extent['w'] - halo * region['ewres'], region['w'])
+    margins = (int(round((n - extent['n']) / region['nsres'])),
+               int(round((extent['s'] - s) / region['nsres'])),
+               int(round((extent['w'] - w) / region['ewres'])),
+               int(round((e - extent['e']) / region['ewres'])))
+    with private_region(name):
+        run('g.region', n=n, s=s, e=e, w=w)
+        yield margins
+
+
+# Univariate statistics of raster maps, memoized per map, modification time
+# and region
+univar_cache = {}
+
+# Properties of the input raster maps, memoized as their statistics
+info_cache = {}
+
+# Tile size and processes computing statistics tile by tile, keyword
+# arguments of `tiled_moments`, if not None, instead of r.univar
+# (statistics=tiles), see `tiled_settings`
+tiled_statistics = None
+
+
+def tiled_settings(options):
+    """Tile size and number of processes computing statistics tile by tile,
+    keyword arguments of `tiled_moments`, or None (statistics=univar)"""
+    if options['statistics'] != 'tiles':
+        return None
+    return dict(tile_size=int(options['tile_size']),
+                procs=int(options['nprocs']))
+
+
+def map_key(img):
+    """Identifying a raster map by its fully qualified name and the
+    modification time of its header"""
+    found = grass.find_file(img, element='cellhd')
+    if not found['file']:
+        grass.fatal(_("Raster map <{m}> not found").format(m=img))
+    return found['fullname'], os.path.getmtime(found['file'])
+
+
+def image_info(img):
+    """Retrieving the properties (pygrass `Info`) of a raster map, read once
+    per `map_key`, i.e. once across the jobs of the worker mode (-w)"""
+    key = map_key(img)
+    if key not in info_cache:
+        name, mapset = key[0].split('@')
+        info_cache[key] = Info(name, mapset)
+        info_cache[key].read()
+    return info_cache[key]
+
+
+def statistics_key(img):
+    """Identifying the statistics of an image within the current region: its
+    `map_key` (or the image itself and the modification time of the
+    Panchromatic image, if filtered on the fly) along with the extent and
+    resolution of the region"""
+    region = grass.region()
+    if isinstance(img, Filtered):
+        key = (img,) + map_key(img.pan)[1:]
+    else:
+        key = map_key(img)
+    return key + tuple(region[name] for name in
+                       ('n', 's', 'e', 'w', 'nsres', 'ewres'))
+
+
+def univar(img):
+    """Retrieving univariate statistics (n, null_cells, min, max, range,
+    mean, stddev, ...) of input image in a single r.univar pass. Results are
+    memoized by the fully qualified map name, the modification time of its
+    header and the current region, so that a map which has not changed is
+    never rescanned, not even by later jobs of the worker mode (-w)."""
+    key = statistics_key(img)
+    if key not in univar_cache:
+        if tiled_statistics:
+            moments = tiled_moments([(key[0], 1)], **tiled_statistics)
+            univar_cache[key] = dict(
+                n=moments.count, mean=moments.mean, stddev=moments.stddev,
+                variance=moments.variance, min=moments.minimum,
+                max=moments.maximum)
+        else:
+            with stage('r.univar', pixels=stage_cells):
+                uni = grass.parse_command("r.univar", map=key[0], flags='g')
+            univar_cache[key] = dict((k, float(v)) for k, v in uni.items())
+    return univar_cache[key]
+
+
+@staged('sampling')
+def sampled_univar(img, fraction):
+    """Retrieving univariate statistics of input image (a raster map or an
+    image High Pass Filtered on the fly) from a deterministic, stratified
+    sample of a `fraction` of its cells. Memoized as in `univar`. Rows of a
+    filtered image are sampled in runs sharing the halo of the kernel."""
+    key = statistics_key(img) + (fraction,)
+    if key not in univar_cache:
+        set_region()
+        moments = Moments()
+        halo = img.size // 2 if isinstance(img, Filtered) else 0
+        with open_term(img) as reader:
+            sample = stratified_sample(reader.rows, reader.cols, fraction,
+                                       run=run_length(halo))
+            for start, stop, columns in row_runs(sample):
+                block = reader.read(start, stop)
+                for row, sampled in zip(block, columns):
+                    moments.update(row[sampled])
+        univar_cache[key] = moments
+    return univar_cache[key]
+
+
+def statistics(img, fraction=None):
+    """Retrieving Average, Standard Deviation and the standard error of the
+    latter: exact (error 0) if computed over all cells, or estimated from a
+    sample of a `fraction` of them"""
+    if fraction:
+        moments = sampled_univar(img, fraction)
+        error = stddev_error(moments.stddev, moments.count)
+        return moments.mean, moments.stddev, error
+    uni = univar(img)
+    return uni['mean'], uni['stddev'], 0
 
 
 def avg(img):
     """Retrieving Average of input image"""
-    uni = grass.parse_command("r.univar", map=img, flags='g')
-    avg = float(uni['mean'])
-    return avg
+    return univar(img)['mean']
 
 
 def stddev(img):
     """Retrieving Standard Deviation of input image"""
-    uni = grass.parse_command("r.univar", map=img, flags='g')
-    sd = float(uni['stddev'])
-    return sd
+    return univar(img)['stddev']
+
+
+def written_statistics(terms, output):
+    """Retrieving Average and Standard Deviation of the sum of weighted
+    `terms`, (image, weight) pairs, written in the temporary map `output`:
+    exact statistics over the cells of the fused image, i.e. those which are
+    not NULL in any of the terms, for lack of the in-process engine. The
+    averages of the terms, each over its own cells, would not do, as their
+    NULL cells differ (edges of the upsampled image, collars)."""
+    with stage('r.mapcalc', pixels=stage_cells):
+        grass.mapcalc('{out} = {fusion}'.format(
+            out=output, fusion=fusion_expression(terms)), overwrite=True)
+    uni = univar(output)
+    run('g.remove', flags='f', type='raster', name=output)
+    return uni['mean'], uni['stddev']
 
 
-def hpf_weight(low_sd, hpf_sd, mod, pss):
+def hpf_weight(low_sd, hpf_sd, mod, pss, low_sd_error=0, hpf_sd_error=0):
     """Returning an appropriate weighting value for the
     High Pass Filtered image. The required inputs are:
     - low_sd:   StdDev of Low resolution image
     - hpf_sd:   StdDev of High Pass Filtered image
     - mod:      Appropriate Modulating Factor determining image crispness
-    - pss:      Number of Pass (1st or 2nd)"""
-    wgt = low_sd / hpf_sd * mod  # mod: modulator
+    - pss:      Number of Pass (1st or 2nd)
+    Optionally, the standard errors of StdDevs estimated from a sample:
+    - low_sd_error, hpf_sd_error"""
+    wgt = get_weight(low_sd, hpf_sd, mod)  # mod: modulator
     msg = '   >> '
     if pss == 2:
         msg += '2nd Pass '
     msg += 'Weighting = {l:.{dec}f} / {h:.{dec}f} * {m:.{dec}f} = {w:.{dec}f}'
-    msg = msg.format(l=low_sd, h=hpf_sd, m=mod, w=wgt, dec=3)
+    error = 0
+    if low_sd_error or hpf_sd_error:
+        msg += ' +/- {e:.{dec}f} (sampled)'
+        error = weight_error(wgt, low_sd, low_sd_error, hpf_sd, hpf_sd_error)
+    msg = msg.format(l=low_sd, h=hpf_sd, m=mod, w=wgt, e=error, dec=3)
     g.message(msg, flags='v')
     return wgt
 
@@ -259,152 +633,516 @@ def hpf_ascii(center, filter, tmpfile, second_pass):
         asciif.write(filter)
 
 
-# main program
-
-def main():
+class Filtered(namedtuple('Filtered', 'pan size center')):
+    """The Panchromatic image, High Pass Filtered on the fly (-s flag)
+    instead of being written to and read from a temporary raster map"""
+    __slots__ = ()
+
+    def __str__(self):
+        return 'hpf({p}, {s}x{s}, {c})'.format(p=self.pan, s=self.size,
+                                                c=self.center)
+
+
+class Upsampled(namedtuple('Upsampled', 'msx ratio')):
+    """The Multi-Spectral image, upsampled bilinearly on the fly by an
+    integer ratio, instead of being written by r.resamp.interp to and read
+    from a temporary raster map"""
+    __slots__ = ()
+
+    def __str__(self):
+        return 'bilinear({m}, {r}x)'.format(m=self.msx, r=self.ratio)
+
+
+def upsampled_term(msx):
+    """Returning the Multi-Spectral image upsampled on the fly, if each of
+    its cells consists of an integer number of cells of the current region
+    (and it does not extend beyond the region), or None"""
+    info = Info(msx)
+    info.read()
+    coarse = dict(n=info.north, s=info.south, e=info.east, w=info.west,
+                  nsres=info.nsres, ewres=info.ewres)
+    ratio = integer_ratio(coarse, grass.region())
+    return Upsampled(msx, ratio) if ratio else None
+
+
+def open_term(term):
+    """Opening a fusion term, a raster map, an image High Pass Filtered or
+    upsampled on the fly, for reading tiles"""
+    if isinstance(term, Filtered):
+        return FilteredRowReader(term.pan, term.size, term.center)
+    if isinstance(term, Upsampled):
+        return UpsampledRowReader(term.msx, term.ratio)
+    return RowReader(term)
+
+
+@staged('numpy filtering', pixels=stage_cells)
+def hpf_numpy(pan, ratio, levels, outputs, second_passes, tile_size,
+              mtype='DCELL', margins=None):
+    """High Pass Filtering the Panchromatic image in-process, via box sums,
+    tile by tile, with the kernel of each center level in `levels`, all of
+    the same size, in a single read of the image. Each filtered image is
+    written in its `outputs` raster map, of type `mtype`, unless the latter
+    is None. Returns the statistics of each filtered image, accumulated while
+    filtering, except for the `margins` (top, bottom, left, right), if any,
+    of cells around them, and the index of their NULL cells along with the
+    region of the latter (see `null_index`)"""
+    size = get_kernel_size(ratio)
+    centers = [get_center_cell(level, size) for level in levels]
 
-    pan = options['pan']
-    msxlst = options['msx'].split(',')
-    outputsuffix = options['suffix']
-    custom_ratio = options['ratio']
-    center = options['center']
-    center2 = options['center2']
-    modulation = options['modulation']
-    modulation2 = options['modulation2']
-
-    if options['trim']:
-        trimming_factor = float(options['trim'])
+    # structure informative message
+    for center, second_pass in zip(centers, second_passes):
+        msg = "   > {m}Filter Properties: size: {s}, center: {c}"
+        msg_pass = '2nd Pass ' if second_pass else ''
+        msg = msg.format(m=msg_pass, s=size, c=center)
+        g.message(msg, flags='v')
+
+    region = set_region()
+    moments = [Moments() for center in centers]
+    writers = []
+    try:
+        for output in outputs:
+            writers.append(RowWriter(output, mtype) if output else None)
+        with RowReader(pan) as reader:
+            index = NullIndex(reader.rows, reader.cols)
+            tile_rows = rows_per_tile(tile_size, reader.cols * len(centers),
+                                      halo=size // 2)
+            for start, stop, filtered in high_pass_centers_tiles(
+                    reader.read, reader.rows, size, centers, tile_rows):
+                index.update(start, filtered[0])  # same NULLs for all
+                for tile, accumulated, writer in zip(filtered, moments,
+                                                     writers):
+                    inner = inner_tile(tile, start, reader.rows, margins)
+                    if inner is not None:
+                        accumulated.update(inner)
+                    if writer:
+                        writer.write(tile)
+    finally:
+        for writer in writers:
+            if writer:
+                writer.close()
+    return moments, (index, dict(n=region.north, w=region.west,
+                                 nsres=region.nsres, ewres=region.ewres))
+
+
+def null_index(valid):
+    """Returning the index of the NULL cells of the HPF image(s), `valid`, an
+    (index, region) pair returned by `hpf_numpy`, within the current region,
+    or None if the latter is not a window of the indexed region"""
+    if not valid:
+        return None
+    index, indexed = valid
+    region = grass.region()
+    for resolution in ('nsres', 'ewres'):
+        if abs(region[resolution] - indexed[resolution]) > \
+                1e-6 * indexed[resolution]:
+            return None
+    row = int(round((indexed['n'] - region['n']) / region['nsres']))
+    col = int(round((region['w'] - indexed['w']) / region['ewres']))
+    if (row < 0 or col < 0 or row + region['rows'] > index.rows or
+            col + region['cols'] > index.cols):
+        return None
+    return index.window(row, col, region['rows'], region['cols'])
+
+
+def fused_tiles(terms, tile_size, index=None, rows=None, source=False):
+    """Yielding tiles of the sum of weighted `terms`, (image, weight) pairs,
+    computed in-process in the region set via `set_region()`, within the
+    (start, stop) range of `rows`, if given, along with the tile of the first
+    term, if `source`. Given the `index` of the NULL cells of the sum, tiles
+    of NULL cells only are not read and the others are computed within the
+    columns holding valid cells."""
+    readers = [open_term(term) for term, _ in terms]
+    try:
+        first_row, last_row = rows or (0, readers[0].rows)
+        cols = readers[0].cols
+        tile_rows = rows_per_tile(tile_size, cols)
+        for start, stop in tiles(last_row - first_row, tile_rows):
+            start, stop = start + first_row, stop + first_row
+            span = index.span(start, stop) if index else (0, cols)
+            if span is None:
+                tile = null_tile(stop - start, cols)
+                yield (tile, tile) if source else tile
+                continue
+            first, last = span
+            blocks = [readers[0].read(start, stop)[:, first:last]]
+            weighted = [(blocks[0], terms[0][1])]
+            filtered = []  # HPF terms (-s), following the ones of maps
+            for reader, (_, wgt) in zip(readers[1:], terms[1:]):
+                if isinstance(reader, FilteredRowReader):
+                    filtered.append((reader, wgt))
+                else:
+                    weighted.append((reader.read(start, stop)[:, first:last],
+                                     wgt))
+            fused = add_weighted(weighted)
+            for reader, wgt in filtered:  # added to the sum as filtered
+                reader.add(fused, start, stop, wgt, span)
+            if (first, last) != (0, cols):
+                fused = expand(fused, first, cols)
+                blocks[0] = expand(blocks[0], first, cols)
+            yield (fused, blocks[0]) if source else fused
+    finally:
+        for reader in readers:
+            reader.close()
+
+
+def moments_job(job):
+    """Returning the statistics of the sum of weighted `terms`, within the
+    range of rows `start` to `stop`, for a `job`: a (terms, tile size, index,
+    start, stop) tuple, see `fused_tiles`"""
+    terms, tile_size, index, start, stop = job
+    moments = Moments()
+    for fused in fused_tiles(terms, tile_size, index, (start, stop)):
+        moments.update(fused)
+    return moments
+
+
+def histograms_job(job):
+    """Returning the histograms, of bins of width `quantum`, of the first of
+    the weighted `terms` and of their sum, over the cells which are not NULL
+    in the sum, within the range of rows `start` to `stop`, for a `job`: a
+    (terms, tile size, index, start, stop, quantum) tuple"""
+    terms, tile_size, index, start, stop, quantum = job
+    first, fused = Histogram(quantum), Histogram(quantum)
+    for tile, first_tile in fused_tiles(terms, tile_size, index,
+                                        (start, stop), source=True):
+        fused.update(tile)
+        first.update(first_tile, valid=tile)
+    return first, fused
+
+
+def map_tiles(function, terms, tile_size, procs, index=None, extra=()):
+    """Returning the results of `function` for each tile of the sum of
+    weighted `terms`, in order, see `moments_job`, computed by `procs`
+    processes, each using `tile_size` / `procs` megabytes, or in a single
+    pass over all tiles, sequentially. Tiles are processed sequentially
+    inside a worker process, i.e. when fusing images in parallel. The `extra`
+    arguments are appended to the job of each tile."""
+    region = set_region()
+    if current_process().daemon:  # workers may not have processes of their own
+        procs = 1
+    if procs > 1:
+        tile_size = max(tile_size // procs, 1)
+        tile_rows = rows_per_tile(tile_size, region.cols)
+    else:  # a single pass over all tiles
+        tile_rows = region.rows
+    jobs = [(terms, tile_size, index, start, stop) + tuple(extra)
+            for start, stop in tiles(region.rows, tile_rows)]
+    if len(jobs) > 1:
+        pool = Pool(min(procs, len(jobs)), initializer=set_region)
+        try:
+            return pool.map(function, jobs)
+        finally:
+            pool.close()
+            pool.join()
+    return [function(job) for job in jobs]
+
+
+@staged('tiled statistics', pixels=stage_cells)
+def tiled_moments(terms, tile_size, procs, index=None):
+    """Retrieving the statistics of the sum of weighted `terms`, (image,
+    weight) pairs, without writing the sum: the moments of each tile are
+    computed in parallel, see `map_tiles`, and merged pairwise. Given the
+    `index` of the NULL cells of the sum, tiles of NULL cells only are
+    skipped."""
+    return merge_pairwise(map_tiles(moments_job, terms, tile_size, procs,
+                                    index))
+
+
+@staged('tiled histograms', pixels=stage_cells)
+def fused_histograms(terms, tile_size, quantum, valid=None):
+    """Retrieving the histograms, of bins of width `quantum`, of the
+    upsampled Multi-Spectral image, the first of the weighted `terms`, and of
+    their sum, over the cells which are not NULL in the sum, without writing
+    the latter, in parallel if requested (statistics=tiles), skipping the
+    NULL cells of the HPF image(s), `valid` (see `null_index`)"""
+    procs = tiled_statistics['procs'] if tiled_statistics else 1
+    source, fused = Histogram(quantum), Histogram(quantum)
+    for first, tile in map_tiles(histograms_job, terms, tile_size, procs,
+                                 null_index(valid), (quantum,)):
+        source.merge(first)
+        fused.merge(tile)
+    return source, fused
+
+
+def fused_statistics_numpy(terms, tile_size, valid=None):
+    """Retrieving Average and Standard Deviation of the sum of weighted
+    `terms`, accumulated tile by tile without writing the sum, in parallel if
+    requested (statistics=tiles), skipping the NULL cells of the HPF
+    image(s), `valid` (see `null_index`)"""
+    procs = tiled_statistics['procs'] if tiled_statistics else 1
+    moments = tiled_moments(terms, tile_size, procs, null_index(valid))
+    return moments.mean, moments.stddev
+
+
+def fuse_numpy(terms, matching, output, tile_size, mtype='DCELL',
+               limits=None, valid=None):
+    """Fusing images in-process, tile by tile: adding the weighted `terms`,
+    (image, weight) pairs, and optionally `matching` linearly the sum's
+    (mean, stddev) to the Multi-Spectral image's (mean, stddev), or its
+    histogram via a lookup table (a dictionary, see `matching_table`). The `output`
+    is of type `mtype`: CELL values are rounded and clamped to `limits`. The
+    NULL cells of the HPF image(s), `valid`, are skipped (see
+    `null_index`)."""
+    set_region()
+    with RowWriter(output, mtype) as writer:
+        for fused in fused_tiles(terms, tile_size, null_index(valid)):
+            if isinstance(matching, dict):  # lookup table
+                fused = match_histogram(fused, **matching)
+            elif matching:
+                fused = match_linear(fused, *matching)
+            if mtype == 'CELL':
+                fused = round_clamp(fused, *limits)
+            writer.write(fused)
+
+
+@staged('5 Fusion')
+def compute_fusion(expression, terms, matching, output, engine, tile_size,
+                   mtype='DCELL', limits=None, valid=None):
+    """Writing the fused image, of type `mtype`, via r.mapcalc or in-process
+    (numpy engine, skipping the NULL cells of the HPF images, `valid`). The
+    `expression` is cast to `mtype` (see `typed_expression`) by the
+    caller."""
+    if engine == 'numpy':
+        with stage('numpy fusion', pixels=stage_cells):
+            fuse_numpy(terms, matching, output, tile_size, mtype, limits,
+                       valid)
     else:
-        trimming_factor = False
-
-    histogram_match = flags['l']
-    second_pass = flags['2']
-    color_match = flags['c']
-
-#    # Check & warn user about "ns == ew" resolution of current region ======
-#    region = grass.region()
-#    nsr = region['nsres']
-#    ewr = region['ewres']
-#
-#    if nsr != ewr:
-#        msg = ('>>> Region's North:South ({ns}) and East:West ({ew}) '
-#               'resolutions do not match!')
-#        msg = msg.format(ns=nsr, ew=ewr)
-#        g.message(msg, flags='w')
-
-    mapset = grass.gisenv()['MAPSET']  # Current Mapset?
-    region = grass.region()  # and region settings
-
-    # List images and their properties
-
-    imglst = [pan]
-    imglst.extend(msxlst)  # List of input imagery
-
-    images = {}
-    for img in imglst:  # Retrieving Image Info
-        images[img] = Info(img, mapset)
-        images[img].read()
-
-    panres = images[pan].nsres  # Panchromatic resolution
-
-    grass.use_temp_region()  # to safely modify the region
-    run('g.region', res=panres)  # Respect extent, change resolution
-    g.message("|! Region's resolution matched to Pan's ({p})".format(p=panres))
-
-    # Loop Algorithm over Multi-Spectral images
-
-    for msx in msxlst:
-        g.message("\nProcessing image: {m}".format(m=msx))
-
-        # Tracking command history -- Why don't do this all r.* modules?
-        cmd_history = []
-
-        #
-        # 1. Compute Ratio
-        #
-
-        g.message("\n|1 Determining ratio of low to high resolution")
-
-        # Custom Ratio? Skip standard computation method.
-        if custom_ratio:
-            ratio = float(custom_ratio)
-            g.message('Using custom ratio, overriding standard method!',
-                      flags='w')
-
-        # Multi-Spectral resolution(s), multiple
-        else:
-            # Image resolutions
-            g.message("   > Retrieving image resolutions")
-
-            msxres = images[msx].nsres
-
-            # check
-            if panres == msxres:
-                msg = ("The Panchromatic's image resolution ({pr}) "
-                       "equals to the Multi-Spectral's one ({mr}). "
-                       "Something is probably not right! "
-                       "Please check your input images.")
-                msg = msg.format(pr=panres, mr=msxres)
-                grass.fatal(_(msg))
-
-            # compute ratio
-            ratio = msxres / panres
-            msg_ratio = ('   >> Resolution ratio '
-                         'low ({m:.{dec}f}) to high ({p:.{dec}f}): {r:.1f}')
-            msg_ratio = msg_ratio.format(m=msxres, p=panres, r=ratio, dec=3)
-            g.message(msg_ratio)
-
-        # 2nd Pass requested, yet Ratio < 5.5
-        if second_pass and ratio < 5.5:
-            g.message("   >>> Resolution ratio < 5.5, skipping 2nd pass.\n"
-                      "   >>> If you insist, force it via the <ratio> option!",
-                      flags='i')
-            second_pass = bool(0)
-
-        #
-        # 2. High Pass Filtering
-        #
-
-        g.message('\n|2 High Pass Filtering the Panchromatic Image')
-
-        tmpfile = grass.tempfile()  # Temporary file - replace with os.getpid?
-        tmp = 'tmp.' + grass.basename(tmpfile)  # use its basenam
-        tmp_pan_hpf = '{tmp}_pan_hpf'.format(tmp=tmp)  # HPF image
-        tmp_msx_blnr = '{tmp}_msx_blnr'.format(tmp=tmp)  # Upsampled MSx
-        tmp_msx_hpf = '{tmp}_msx_hpf'.format(tmp=tmp)  # Fused image
-        tmp_hpf_matrix = grass.tempfile()  # ASCII filter
-
-        # Construct and apply Filter
-        hpf = get_high_pass_filter(ratio, center)
-        hpf_ascii(center, hpf, tmp_hpf_matrix, second_pass)
-        run('r.mfilter', input=pan, filter=tmp_hpf_matrix,
-            output=tmp_pan_hpf,
-            title='High Pass Filtered Panchromatic image',
-            overwrite=True)
-
-        # 2nd pass
-        if second_pass and ratio > 5.5:
-            # Temporary files
-            tmp_pan_hpf_2 = '{tmp}_pan_hpf_2'.format(tmp=tmp)  # 2nd Pass HPF image
-            tmp_hpf_matrix_2 = grass.tempfile()  # 2nd Pass ASCII filter
-            # Construct and apply 2nd Filter
-            hpf_2 = get_high_pass_filter(ratio, center2)
-            hpf_ascii(center2, hpf_2, tmp_hpf_matrix_2, second_pass)
-            run('r.mfilter',
-                input=pan,
-                filter=tmp_hpf_matrix_2,
-                output=tmp_pan_hpf_2,
-                title='2-High-Pass Filtered Panchromatic Image',
-                overwrite=True)
+        with stage('r.mapcalc', pixels=stage_cells):
+            grass.mapcalc(expression)
+
+
+def fusion_expression(terms, matching=None):
+    """Expression for r.mapcalc adding the weighted `terms`, (image, weight)
+    pairs, and optionally `matching` linearly the sum's (mean, stddev) to the
+    Multi-Spectral image's (mean, stddev), or its histogram via a lookup
+    table (see `matching_table`), interpolated by graph()"""
+    fusion = ' + '.join('{img} * {wgt}'.format(img=img, wgt=wgt)
+                        for img, wgt in terms)
+    if isinstance(matching, dict):
+        low, high, table = (matching[key] for key in ('low', 'high', 'table'))
+        step = (high - low) / float(len(table) - 1)
+        points = ', '.join('{x!r}, {y!r}'.format(x=low + index * step, y=value)
+                           for index, value in enumerate(table))
+        fusion = 'graph({hpf}, {points})'.format(hpf=fusion, points=points)
+    elif matching:
+        lhm = '({hpf} - {hpfavg}) / {hpfsd} * {msxsd} + {msxavg}'
+        hpfavg, hpfsd, msxavg, msxsd = matching
+        fusion = lhm.format(hpf=fusion, hpfavg=hpfavg, hpfsd=hpfsd,
+                            msxsd=msxsd, msxavg=msxavg)
+    return fusion
+
+
+def typed_expression(expression, mtype, limits=None):
+    """Casting an r.mapcalc `expression` to the cell type `mtype`: FCELL via
+    float(), CELL rounded and clamped to `limits`, (lowest, highest)"""
+    if mtype == 'FCELL':
+        return 'float({e})'.format(e=expression)
+    if mtype == 'CELL':
+        low, high = limits
+        return 'round(max(min({e}, {h}), {l}))'.format(e=expression, h=high,
+                                                       l=low)
+    return expression
+
+
+def intermediate_type(mtype):
+    """Cell type of the intermediate images written for outputs of type
+    `mtype`: FCELL, unless DCELL, since High Pass Filtered values may be
+    fractional"""
+    return 'DCELL' if mtype == 'DCELL' else 'FCELL'
+
+
+def cell_limits(msx, mtype):
+    """Range, (lowest, highest), of the integers of the bit depth of an
+    integer Multi-Spectral image, for outputs of type CELL, or None"""
+    if mtype != 'CELL':
+        return None
+    return bit_depth_range(*image_info(msx).range)
+
+
+@staged('2 High Pass Filtering')
+def filter_pan(pan, ratio, levels, tmp, engine, tile_size, hpf_images,
+               stream=False, sample=None, mtype='DCELL', extent=None):
+    """High Pass Filtering the Panchromatic image once per kernel, i.e. per
+    (kernel size, center level) pair, for each of the center `levels` of the
+    first and, optionally, second pass. Returns, per level, the name of the
+    HPF image (or the description of the filter, if `stream`ed), its
+    standard deviation and the latter's standard error, if estimated from a
+    `sample` fraction of cells, and the index of their NULL cells (numpy
+    engine, see `null_index`) or None. Results are cached in `hpf_images`
+    for subsequent requests. The numpy engine filters with all kernels in a
+    single read of the Panchromatic image and writes the HPF images as
+    `mtype` (r.mfilter as DCELL). Given the trimmed `extent` of the output,
+    images are filtered only within the extent and the halo of the kernel,
+    and their statistics are computed within the extent (not `stream`ed)"""
+    size = get_kernel_size(ratio)
+    pending = []  # (level, second pass) pairs not filtered before
+    for index, level in enumerate(levels):
+        if (size, level) in hpf_images:
+            msg = "   > Reusing HPF image (kernel size: {s}, center: {c})"
+            g.message(msg.format(s=size, c=level), flags='v')
+        elif level not in dict(pending):
+            pending.append((level, index > 0))
+
+    def tmp_pan_hpf(level):
+        return '{tmp}_pan_hpf_{s}_{c}'.format(tmp=tmp, s=size, c=level)
+
+    if engine == 'numpy' and stream and sample and \
+            rows_fraction(sample, size // 2) >= 1:
+        msg = ("Sampling {f} of the cells reads all rows of the HPF images "
+               "(kernel size: {s}), computing exact statistics instead")
+        g.message(msg.format(f=sample, s=size), flags='v')
+        sample = None
+
+    if engine == 'numpy' and stream and sample:
+        for level, second_pass in pending:
+            filtered = Filtered(pan, size, get_center_cell(level, size))
+            _, hpf_sd, hpf_sd_error = statistics(filtered, sample)
+            hpf_images[(size, level)] = (filtered, hpf_sd, hpf_sd_error,
+                                         None)
+
+    elif engine == 'numpy' and pending:
+        pending_levels = [level for level, _ in pending]
+        if stream:
+            images = [Filtered(pan, size, get_center_cell(level, size))
+                      for level in pending_levels]
+            outputs = [None for level in pending_levels]
+        else:  # statistics accumulated while filtering, at no cost
+            images = outputs = [tmp_pan_hpf(level)
+                                for level in pending_levels]
+        with cropped_region('{tmp}_region'.format(tmp=tmp), extent,
+                            size // 2) as margins:
+            moments, valid = hpf_numpy(pan, ratio, pending_levels, outputs,
+                                       [second_pass
+                                        for _, second_pass in pending],
+                                       tile_size, mtype, margins)
+        for level, image, accumulated in zip(pending_levels, images,
+                                             moments):
+            hpf_images[(size, level)] = (image, accumulated.stddev, 0, valid)
+
+    elif engine != 'numpy':
+        for level, second_pass in pending:
+            tmp_hpf_matrix = grass.tempfile()  # ASCII filter
+            hpf = get_high_pass_filter(ratio, level)
+            hpf_ascii(level, hpf, tmp_hpf_matrix, second_pass)
+            title = '{p}High Pass Filtered Panchromatic image'
+            title = title.format(p='2nd Pass ' if second_pass else '')
+            with cropped_region('{tmp}_region'.format(tmp=tmp), extent,
+                                size // 2):
+                run('r.mfilter', input=pan, filter=tmp_hpf_matrix,
+                    output=tmp_pan_hpf(level), title=title, overwrite=True)
+
+            with cropped_region('{tmp}_region'.format(tmp=tmp), extent):
+                _, hpf_sd, hpf_sd_error = statistics(tmp_pan_hpf(level),
+                                                     sample)
+            hpf_images[(size, level)] = (tmp_pan_hpf(level), hpf_sd,
+                                         hpf_sd_error, None)
+
+    return [hpf_images[(size, level)] for level in levels]
+
+
+def band_fingerprint(pan, msx, region, ratio, scene, second_pass, engine):
+    """Fingerprinting the fusion of a Multi-Spectral image: the identity and
+    modification time of the input images, the region and all parameters
+    affecting the fused values"""
+    properties = dict(
+        pan=map_key(pan), msx=map_key(msx),
+        region=[region[key] for key in ('n', 's', 'e', 'w', 'nsres', 'ewres')],
+        ratio=ratio, center=scene['center'], modulation=scene['modulation'],
+        center2=scene['center2'] if second_pass else None,
+        modulation2=scene['modulation2'] if second_pass else None,
+        histogram_match=scene['histogram_match'],
+        color_match=scene['color_match'],
+        trim=scene['trimming_factor'], sample=scene['sample'], engine=engine,
+        cell_type=scene['cell_type'])
+    if scene['histogram_match'] and scene['match'] == 'histogram':
+        properties['match'] = scene['match']
+    return fingerprint(properties)
+
+
+def fused_fingerprint(output):
+    """Retrieving the fingerprint recorded in the history of an existing
+    `output` image in the current mapset, if any"""
+    found = grass.find_file(output, element='cell', mapset='.')
+    if not found['file']:
+        return None
+    history = grass.read_command('r.info', flags='h', map=found['fullname'])
+    return find_fingerprint(history)
+
+
+def fuse_band(msx, ratio, msx_nsres, msx_ewres, region, tmp, hpf, hpf_2,
+              center, center2, modulation, modulation2, histogram_match, color_match,
+              trimming_factor, engine, tile_size, sample, cell_type='DCELL',
+              match='linear'):
+    """Fusing a Multi-Spectral image with the (shared) High Pass Filtered
+    Panchromatic image(s) into an image of type `cell_type`, matching its
+    histogram to the one of the Multi-Spectral image as per `match`, if
+    `histogram_match`. All temporary maps and the region modified by this
+    function are named after `tmp`, which is unique per image, so that
+    images can be processed concurrently. Returns the name of the fused
+    image, its history entries and the parameters of the fusion."""
+    g.message("\nProcessing image: {m}".format(m=msx))
+
+    # Tracking command history -- Why don't do this all r.* modules?
+    cmd_history = []
+
+    tmp_msx_blnr = '{tmp}_msx_blnr'.format(tmp=tmp)  # Upsampled MSx
+    tmp_msx_hpf = '{tmp}_msx_hpf'.format(tmp=tmp)  # Fused image
+    tmp_pan_hpf, hpf_sd, hpf_sd_error, valid = hpf
+
+    #
+    # Optional. Trim to remove black border effect (rectangular only)
+    #
+
+    extent = None
+    if trimming_factor:
+
+        tf = trimming_factor
+        n, s, e, w = region['n'], region['s'], region['e'], region['w']
+
+        # communicate
+        msg = '\n|* Trimming output image border pixels by '
+        msg += '{factor} times the low resolution\n'.format(factor=tf)
+        nsew = '   > Input extent: n: {n}, s: {s}, e: {e}, w: {w}'
+        nsew = nsew.format(n=n, s=s, e=e, w=w)
+        msg += nsew
+
+        g.message(msg)
+
+        # re-set borders
+        extent = trimmed_extent(region, tf, msx_nsres, msx_ewres)
+
+        # communicate
+        msg = '   > Output extent: n: {n}, s: {s}, e: {e}, w: {w}'
+        msg = msg.format(**extent)
+        g.message(msg)
+
+    # compute within the trimmed extent, if any, of a region private to this
+    # image: upsampling, statistics and fusion skip the trimmed border
+    with cropped_region('{tmp}_region'.format(tmp=tmp), extent):
 
         #
         # 3. Upsampling low resolution image
         #
 
-        g.message("\n|3 Upsampling (bilinearly) low resolution image")
+        # in-process (numpy engine), for an integer ratio, unless trimming:
+        # the Multi-Spectral image then extends beyond the trimmed region
+        upsampled = None
+        if engine == 'numpy' and not trimming_factor:
+            upsampled = upsampled_term(msx)
+        elif engine == 'numpy':
+            g.message("   > Trimming, upsampling via r.resamp.interp instead "
+                      "of on the fly", flags='v')
+
+        if upsampled:
+            msg = "\n|3 Upsampling (bilinearly) low resolution image, {r}x, " \
+                "on the fly while fusing"
+            g.message(msg.format(r=upsampled.ratio))
+        else:
+            g.message("\n|3 Upsampling (bilinearly) low resolution image")
 
-        run('r.resamp.interp',
-            method='bilinear', input=msx, output=tmp_msx_blnr, overwrite=True)
+            with stage('3 Upsampling'):
+                run('r.resamp.interp', method='bilinear', input=msx,
+                    output=tmp_msx_blnr, overwrite=True)
 
         #
         # 4. Weighting the High Pass Filtered image(s)
@@ -417,13 +1155,16 @@ def main():
             "Modulating Factor"
         g.message(msg_w)
 
-        # StdDev of Multi-Spectral Image(s)
-        msx_avg = avg(msx)
-        msx_sd = stddev(msx)
-        g.message("   >> StdDev of <{m}>: {sd:.3f}".format(m=msx, sd=msx_sd))
+        # StdDev of Multi-Spectral Image(s), exact or estimated from a sample
+        with stage('4 Weighting'):
+            msx_avg, msx_sd, msx_sd_error = statistics(msx, sample)
+        note(statistics=dict(msx_mean=msx_avg, msx_stddev=msx_sd,
+                             msx_stddev_error=msx_sd_error, hpf_stddev=hpf_sd,
+                             hpf_stddev_error=hpf_sd_error))
+        g.message("   >> StdDev of <{m}>: {sd:.3f}".format(m=msx,
+                                                        sd=msx_sd))
 
-        # StdDev of HPF Image
-        hpf_sd = stddev(tmp_pan_hpf)
+        # StdDev of HPF Image, computed once per kernel
         g.message("   >> StdDev of HPFi: {sd:.3f}".format(sd=hpf_sd))
 
         # Modulating factor
@@ -431,23 +1172,24 @@ def main():
         g.message("   >> Modulating Factor: {m:.2f}".format(m=modulator))
 
         # weighting HPFi
-        weighting = hpf_weight(msx_sd, hpf_sd, modulator, 1)
+        weighting = hpf_weight(msx_sd, hpf_sd, modulator, 1,
+                               msx_sd_error, hpf_sd_error)
 
         #
         # 5. Adding weighted HPF image to upsampled Multi-Spectral band
         #
 
         g.message("\n|5 Adding weighted HPFi to upsampled image")
-        fusion = '{hpf} = {msx} + {pan} * {wgt}'
-        fusion = fusion.format(hpf=tmp_msx_hpf, msx=tmp_msx_blnr,
-                               pan=tmp_pan_hpf, wgt=weighting)
-        grass.mapcalc(fusion)
+
+        # Terms of the fused image, combined in a single r.mapcalc pass
+        terms = [(upsampled or tmp_msx_blnr, 1), (tmp_pan_hpf, weighting)]
 
         # command history
         hst = 'Weigthing applied: {msd:.3f} / {hsd:.3f} * {mod:.3f}'
         cmd_history.append(hst.format(msd=msx_sd, hsd=hpf_sd, mod=modulator))
 
-        if second_pass and ratio > 5.5:
+        if hpf_2:
+            tmp_pan_hpf_2, hpf_2_sd, hpf_2_sd_error = hpf_2[:3]
 
             #
             # 4+ 2nd Pass Weighting the High Pass Filtered image
@@ -455,8 +1197,7 @@ def main():
 
             g.message("\n|4+ 2nd Pass Weighting the HPFi")
 
-            # StdDev of HPF Image #2
-            hpf_2_sd = stddev(tmp_pan_hpf_2)
+            # StdDev of HPF Image #2, computed once per kernel
             g.message("   >> StdDev of 2nd HPFi: {h:.3f}".format(h=hpf_2_sd))
 
             # Modulating factor #2
@@ -465,7 +1206,8 @@ def main():
             g.message(msg.format(m=modulator_2))
 
             # 2nd Pass weighting
-            weighting_2 = hpf_weight(msx_sd, hpf_2_sd, modulator_2, 2)
+            weighting_2 = hpf_weight(msx_sd, hpf_2_sd, modulator_2, 2,
+                                     msx_sd_error, hpf_2_sd_error)
 
             #
             # 5+ Adding weighted HPF image to upsampled Multi-Spectral band
@@ -474,102 +1216,844 @@ def main():
             g.message("\n|5+ Adding small-kernel-based weighted 2nd HPFi "
                       "back to fused image")
 
-            add_back = '{final} = {msx_hpf} + {pan_hpf} * {wgt}'
-            add_back = add_back.format(final=tmp_msx_hpf, msx_hpf=tmp_msx_hpf,
-                                       pan_hpf=tmp_pan_hpf_2, wgt=weighting_2)
-            grass.mapcalc(add_back)
+            terms.append((tmp_pan_hpf_2, weighting_2))
 
             # 2nd Pass history entry
             hst = "2nd Pass Weighting: {m:.3f} / {h:.3f} * {mod:.3f}"
-            cmd_history.append(hst.format(m=msx_sd, h=hpf_2_sd, mod=modulator_2))
+            cmd_history.append(hst.format(m=msx_sd, h=hpf_2_sd,
+                                          mod=modulator_2))
 
-        if color_match:
-            g.message("\n|* Matching output to input color table")
-            run('r.colors', map=tmp_msx_hpf, raster=msx)
+        matching = None
 
         #
         # 6. Stretching linearly the HPF-Sharpened image(s) to match the Mean
         #     and Standard Deviation of the input Multi-Sectral image(s)
         #
 
-        if histogram_match:
+        if histogram_match and match == 'histogram':
+
+            # adapt output histogram to the one of the (upsampled) input
+            g.message("\n|+ Matching histogram of Pansharpened image "
+                      "to %s via a lookup table" % (msx), flags='v')
+
+            # Quantised histograms of the upsampled Multi-Spectral and of the
+            # fused image, accumulated in-process over the fused tiles
+            with stage('6 Histogram matching statistics'):
+                source, fused = fused_histograms(
+                    terms, tile_size, histogram_quantum(msx_sd), valid)
+            matching = matching_table(source, fused)
+
+            # update history string
+            if matching:
+                hst = ('Histogram Matching: lookup table of {n} values, '
+                       'from {l} to {h}')
+                cmd_history.append(hst.format(n=len(matching['table']),
+                                              l=matching['low'],
+                                              h=matching['high']))
+
+        elif histogram_match:
 
             # adapt output StdDev and Mean to the input(ted) ones
             g.message("\n|+ Matching histogram of Pansharpened image "
                       "to %s" % (msx), flags='v')
 
-            # Collect stats for linear histogram matching
-            msx_hpf_avg = avg(tmp_msx_hpf)
-            msx_hpf_sd = stddev(tmp_msx_hpf)
+            # Stats for linear histogram matching, over the cells of the
+            # fused image: accumulated in-process over the fused tiles, without
+            # writing them, or scanning the fused image written without NumPy
+            with stage('6 Histogram matching statistics'):
+                if BACKEND is not None:
+                    msx_hpf_avg, msx_hpf_sd = fused_statistics_numpy(
+                        terms, tile_size, valid)
+                else:
+                    msx_hpf_avg, msx_hpf_sd = written_statistics(
+                        terms, '{tmp}_fused'.format(tmp=tmp))
 
-            # expression for mapcalc
-            lhm = '{out} = ({hpf} - {hpfavg}) / {hpfsd} * {msxsd} + {msxavg}'
-            lhm = lhm.format(out=tmp_msx_hpf, hpf=tmp_msx_hpf,
-                             hpfavg=msx_hpf_avg, hpfsd=msx_hpf_sd,
-                             msxsd=msx_sd, msxavg=msx_avg)
-
-            # compute
-            grass.mapcalc(lhm, quiet=True, overwrite=True)
+            matching = (msx_hpf_avg, msx_hpf_sd, msx_avg, msx_sd)
 
             # update history string
+            lhm = fusion_expression(terms, matching)
             cmd_history.append("Linear Histogram Matching: %s" % lhm)
 
+        # expression for mapcalc, cast to the output type
+        limits = cell_limits(msx, cell_type)
+        fusion = fusion_expression(terms, matching)
+        fusion = '{out} = {fusion}'.format(out=tmp_msx_hpf,
+                                           fusion=typed_expression(fusion,
+                                                                   cell_type,
+                                                                   limits))
+        if limits:
+            hst = 'Rounded and clamped to {l}..{h}'
+            cmd_history.append(hst.format(l=limits[0], h=limits[1]))
+
+        # parameters of the fusion, to re-fuse part of the image consistently
+        parameters = dict(
+            ratio=ratio, center=center, center2=center2,
+            weights=[wgt for img, wgt in terms[1:]], matching=matching,
+            region=[region[key] for key in ('n', 's', 'e', 'w')])
+
+        compute_fusion(fusion, terms, matching, tmp_msx_hpf, engine,
+                       tile_size, cell_type, limits, valid)
+
+    if color_match:
+        g.message("\n|* Matching output to input color table")
+        run('r.colors', map=tmp_msx_hpf, raster=msx)
+
+    #
+    # End of Algorithm
+
+    # remove temporary files of this image
+    if not upsampled:
+        run('g.remove', flags='f', type='raster', name=tmp_msx_blnr)
+
+    return tmp_msx_hpf, cmd_history, parameters
+
+
+def fuse_band_job(job, region=None):
+    """Run `fuse_band` for a single job, possibly inside a worker process and
+    in the saved `region` of its scene. Returns the results of `fuse_band`
+    and the report of the fusion, or None if not reporting. Errors are
+    re-raised as exceptions the process pool can pass on."""
+    pixels = job['region']['rows'] * job['region']['cols']
+    try:
+        with use_region(region):
+            with report(msx=job['msx'], pixels=pixels) as band:
+                fused = fuse_band(**job)
+                note(**fused[2])  # parameters: ratio, weights, matching...
+        return fused + (band.as_dict() if band else None,)
+    except SystemExit:
+        raise RuntimeError("Fusing <{m}> failed".format(m=job['msx']))
+
+
+def scene_settings(options, flags):
+    """Parsing the options and flags of a scene, as returned by
+    `grass.parser()` or read from a manifest. Raises ValueError for invalid
+    values, which the parser would have rejected."""
+    choices = {'center': ('low', 'mid', 'high'),
+               'center2': ('low', 'mid', 'high'),
+               'modulation': ('min', 'mid', 'max'),
+               'modulation2': ('min', 'mid', 'max'),
+               'type': ('CELL', 'FCELL', 'DCELL'),
+               'match': ('linear', 'histogram')}
+    for key, values in choices.items():
+        if options[key] not in values:
+            msg = "Invalid value <{v}> of option <{k}>"
+            raise ValueError(msg.format(v=options[key], k=key))
+
+    if BACKEND is None:
+        in_process = [name for name, used in (
+            ('sample', options['sample']),
+            ('type=CELL', options['type'] == 'CELL'),
+            ('match=histogram', flags['l'] and options['match'] == 'histogram'))
+            if used]
+        if in_process:
+            raise ValueError("Option(s) {o} require NumPy".format(
+                o=', '.join(in_process)))
+
+    return dict(
+        pan=options['pan'],
+        msxlst=options['msx'].split(','),
+        suffix=options['suffix'],
+        custom_ratio=float(options['ratio']) if options['ratio'] else None,
+        center=options['center'],
+        center2=options['center2'],
+        modulation=options['modulation'],
+        modulation2=options['modulation2'],
+        trimming_factor=float(options['trim']) if options['trim'] else False,
+        sample=float(options['sample']) if options['sample'] else None,
+        cell_type=options['type'],
+        histogram_match=flags['l'],
+        match=options['match'],
+        second_pass=flags['2'],
+        color_match=flags['c'])
+
+
+def prepare_scene(scene, engine, tile_size, stream, tmp):
+    """Matching the resolution of the current region to the one of the
+    Panchromatic image of a `scene`, determining the ratio(s) of low to high
+    resolution and High Pass Filtering the Panchromatic image. All temporary
+    maps are named after `tmp`. Multi-Spectral images already fused, whose
+    output's fingerprint matches, are skipped. Returns the jobs fusing the
+    other images, (output name, fingerprint, `fuse_band` arguments) tuples,
+    in input order, and the (msx, output) pairs skipped."""
+    pan = scene['pan']
+    msxlst = scene['msxlst']
+    custom_ratio = scene['custom_ratio']
+    second_pass = scene['second_pass']
+
+    # List images and their properties
+
+    imglst = [pan]
+    imglst.extend(msxlst)  # List of input imagery
+
+    images = {}
+    for img in imglst:  # Retrieving Image Info
+        images[img] = image_info(img)
+
+    # Integer outputs hold the values of integer Multi-Spectral images only
+    if scene['cell_type'] == 'CELL':
+        floating = [msx for msx in msxlst if images[msx].mtype != 'CELL']
+        if floating:
+            msg = ("Output type CELL requires integer Multi-Spectral images, "
+                   "not floating point ones: {m}")
+            grass.fatal(_(msg.format(m=', '.join(floating))))
+
+    panres = images[pan].nsres  # Panchromatic resolution
+
+    run('g.region', res=panres)  # Respect extent, change resolution
+    g.message("|! Region's resolution matched to Pan's ({p})".format(p=panres))
+    region = grass.region()  # region settings
+
+    #
+    # 1. Compute Ratio(s)
+    #
+
+    g.message("\n|1 Determining ratio of low to high resolution")
+
+    # Custom Ratio? Skip standard computation method.
+    if custom_ratio:
+        g.message('Using custom ratio, overriding standard method!',
+                  flags='w')
+
+    # Group Multi-Spectral images sharing the same ratio
+    groups = OrderedDict()
+    for msx in msxlst:
+        if custom_ratio:
+            ratio = custom_ratio
+
+        # Multi-Spectral resolution(s), multiple
+        else:
+            # Image resolutions
+            g.message("   > Retrieving resolution of <{m}>".format(m=msx))
+
+            msxres = images[msx].nsres
+
+            # check
+            if panres == msxres:
+                msg = ("The Panchromatic's image resolution ({pr}) "
+                       "equals to the Multi-Spectral's one ({mr}). "
+                       "Something is probably not right! "
+                       "Please check your input images.")
+                msg = msg.format(pr=panres, mr=msxres)
+                grass.fatal(_(msg))
+
+            # compute ratio
+            ratio = msxres / panres
+            msg_ratio = ('   >> Resolution ratio '
+                         'low ({m:.{dec}f}) to high ({p:.{dec}f}): {r:.1f}')
+            msg_ratio = msg_ratio.format(m=msxres, p=panres, r=ratio, dec=3)
+            g.message(msg_ratio)
+
+        groups.setdefault(ratio, []).append(msx)
+
+    # Filter only within the trimmed extent, the largest one of all images,
+    # if trimming. Streamed HPF images would be filtered within the trimmed
+    # extent, lacking its halo: they are written instead.
+    extent = None
+    if scene['trimming_factor']:
+        extent = trimmed_extent(region, scene['trimming_factor'],
+                                min(images[msx].nsres for msx in msxlst),
+                                min(images[msx].ewres for msx in msxlst))
+        if stream:
+            g.message("   > Trimming, writing the HPF image(s) instead of "
+                      "streaming them", flags='v')
+            stream = False
+
+    # HPF images, one per kernel, shared among all Multi-Spectral images
+    tmp_pan = '{tmp}.pan'.format(tmp=tmp)
+    hpf_images = {}
+    jobs = []
+    skipped = []
+
+    # Loop Algorithm over groups of Multi-Spectral images
+
+    for ratio, msx_group in groups.items():
+
+        # 2nd Pass requested, yet Ratio < 5.5
+        group_second_pass = second_pass and ratio > SECOND_PASS_RATIO
+        if second_pass and ratio < SECOND_PASS_RATIO:
+            g.message("   >>> Resolution ratio < 5.5, skipping 2nd pass.\n"
+                      "   >>> If you insist, force it via the <ratio> option!",
+                      flags='i')
+
+        # Skip images fused before, from the same inputs and parameters
+        pending = []
+        for msx in msx_group:
+            output = "{base}.{suffix}".format(base=msx.split('@')[0],
+                                              suffix=scene['suffix'])
+            digest = band_fingerprint(pan, msx, region, ratio, scene,
+                                      group_second_pass, engine)
+            if fused_fingerprint(output) == digest:
+                msg = "   > <{o}> is up to date, skipping <{m}>"
+                g.message(msg.format(o=output, m=msx))
+                skipped.append((msx, output))
+            else:
+                pending.append((msx, output, digest))
+        if not pending:
+            continue
+
         #
-        # Optional. Trim to remove black border effect (rectangular only)
+        # 2. High Pass Filtering
         #
 
-        if trimming_factor:
+        g.message('\n|2 High Pass Filtering the Panchromatic Image '
+                  '(ratio {r:.1f})'.format(r=ratio))
+
+        hpf_type = intermediate_type(scene['cell_type'])
+        # 2nd pass, filtered along with the 1st one
+        levels = [scene['center']]
+        if group_second_pass:
+            levels.append(scene['center2'])
+        hpfs = filter_pan(pan, ratio, levels, tmp_pan, engine, tile_size,
+                          hpf_images, stream=stream, sample=scene['sample'],
+                          mtype=hpf_type, extent=extent)
+        hpf = hpfs[0]
+        hpf_2 = hpfs[1] if group_second_pass else None
+
+        for msx, output, digest in pending:
+            index = msxlst.index(msx)
+            jobs.append((output, digest, dict(
+                msx=msx, ratio=ratio, msx_nsres=images[msx].nsres,
+                msx_ewres=images[msx].ewres, region=dict(region),
+                tmp='{tmp}.{i}'.format(tmp=tmp, i=index),
+                hpf=hpf, hpf_2=hpf_2, center=scene['center'],
+                center2=scene['center2'] if group_second_pass else None,
+                modulation=scene['modulation'],
+                modulation2=scene['modulation2'],
+                histogram_match=scene['histogram_match'],
+                color_match=scene['color_match'],
+                trimming_factor=scene['trimming_factor'], engine=engine,
+                tile_size=tile_size, sample=scene['sample'],
+                cell_type=scene['cell_type'], match=scene['match'])))
+
+    jobs.sort(key=lambda job: msxlst.index(job[2]['msx']))
+    return jobs, skipped
+
+
+def finish_job(output, digest, tmp_msx_hpf, cmd_history, parameters,
+               band=None):
+    """Adding the history entry, along with the `parameters` of the fusion
+    and its fingerprint `digest`, to a fused image and renaming it to its
+    final `output` name. Returns the report of the fusion, `band`, if any,
+    completed with the output name."""
+    run("r.support", map=tmp_msx_hpf, history="\n".join(cmd_history))
+    # one call per record, as r.support splits long entries in lines
+    for entry in (parameters_entry(parameters), history_entry(digest)):
+        run("r.support", map=tmp_msx_hpf, history=entry)
+    run("g.rename", raster=(tmp_msx_hpf, output))
+    if band:
+        band['output'] = output
+    return band
+
+
+def update_band(pan, msx, output, parameters, extent, engine, tile_size,
+                stream, tmp):
+    """Fusing again the part of an existing `output` image depending on the
+    changed `extent` (n, s, e, w) of its inputs and patching it into the
+    image. Cells depend on input cells within the halo of the High Pass
+    Filter (kernel size // 2 cells) and within the support of the bilinear
+    upsampling (one Multi-Spectral cell). The image is fused, via the
+    recorded `parameters` of its fusion, within the affected extent expanded
+    by the same margin, as cells of the type of the image. Temporary maps are
+    named after `tmp`."""
+    g.message("\nUpdating image: {o}".format(o=output))
+
+    ratio = parameters['ratio']
+    halo = get_kernel_size(ratio) // 2
+    msx_info = Info(msx)
+    msx_info.read()
+    output_info = Info(output)
+    output_info.read()
+    mtype = output_info.mtype
+    limits = cell_limits(msx, mtype)
+
+    run('g.region', raster=output)  # extent and resolution of the output
+    region = grass.region()
+    margin_ns = max(halo * region['nsres'], msx_info.nsres)
+    margin_ew = max(halo * region['ewres'], msx_info.ewres)
+
+    # cells depending on the changed ones
+    north, south, east, west = extent
+    n = min(north + margin_ns, region['n'])
+    s = max(south - margin_ns, region['s'])
+    e = min(east + margin_ew, region['e'])
+    w = max(west - margin_ew, region['w'])
+    if n <= s or e <= w:
+        g.message("   > Changed extent outside of <{o}>, skipping".format(
+            o=output))
+        return
+
+    msg = '   > Affected extent: n: {n}, s: {s}, e: {e}, w: {w}'
+    g.message(msg.format(n=n, s=s, e=e, w=w))
+
+    tmp_msx_blnr = '{tmp}_msx_blnr'.format(tmp=tmp)
+    tmp_window = '{tmp}_window'.format(tmp=tmp)
+    tmp_patched = '{tmp}_patched'.format(tmp=tmp)
+
+    # input cells the affected ones depend on, within the region fused before
+    fused_n, fused_s, fused_e, fused_w = parameters['region']
+    with private_region('{tmp}_region'.format(tmp=tmp)):
+        run('g.region', n=min(n + margin_ns, fused_n),
+            s=max(s - margin_ns, fused_s), e=min(e + margin_ew, fused_e),
+            w=max(w - margin_ew, fused_w), align=output)
+
+        run('r.resamp.interp', method='bilinear', input=msx,
+            output=tmp_msx_blnr, overwrite=True)
+
+        terms = [(tmp_msx_blnr, 1)]
+        levels = [parameters['center']]
+        if parameters['center2']:
+            levels.append(parameters['center2'])
+        hpfs = filter_pan(pan, ratio, levels, '{tmp}.pan'.format(tmp=tmp),
+                          engine, tile_size, {}, stream=stream,
+                          mtype=intermediate_type(mtype))
+        for hpf, weight in zip(hpfs, parameters['weights']):
+            terms.append((hpf[0], weight))
+
+        matching = parameters['matching']
+        fusion = typed_expression(fusion_expression(terms, matching), mtype,
+                                  limits)
+        fusion = '{out} = {fusion}'.format(out=tmp_window, fusion=fusion)
+        compute_fusion(fusion, terms, matching, tmp_window, engine, tile_size,
+                       mtype, limits, hpfs[0][3])
+
+    # patch the affected cells into the output
+    patch = ('{new} = if(y() < {n} && y() > {s} && x() < {e} && x() > {w}, '
+             '{window}, {old})')
+    grass.mapcalc(patch.format(new=tmp_patched, n=n, s=s, e=e, w=w,
+                               window=tmp_window, old=output))
+    run('r.colors', map=tmp_patched, raster=output)
+
+    # no fingerprint: the next regular run fuses the image again entirely
+    hst = 'Updated extent: n: {n}, s: {s}, e: {e}, w: {w}'
+    for entry in (hst.format(n=n, s=s, e=e, w=w),
+                  parameters_entry(parameters)):
+        run("r.support", map=tmp_patched, history=entry)
+    run("g.rename", raster=(tmp_patched, output), overwrite=True)
+
+    # remove temporary maps of this image
+    run('g.remove', flags='f', type='raster',
+        pattern='{tmp}[._]*'.format(tmp=tmp))
+
+
+def update_scene(scene, extent, engine, tile_size, stream, tmp):
+    """Fusing again only the part of the existing outputs of a `scene` which
+    depends on the changed `extent`, (n, s, e, w), of its inputs, see
+    `update_band`. The weights of the HPF image(s) and the histogram
+    matching, as well as the ratio and center cell levels, are the ones
+    recorded in the history of each output: they stem from the statistics of
+    the entire images, before the change. Outputs lacking them have to be
+    fused entirely."""
+    for index, msx in enumerate(scene['msxlst']):
+        output = "{base}.{suffix}".format(base=msx.split('@')[0],
+                                          suffix=scene['suffix'])
+        found = grass.find_file(output, element='cell', mapset='.')
+        if not found['file']:
+            msg = "Image <{o}> not found, fuse <{m}> entirely first"
+            grass.fatal(_(msg.format(o=output, m=msx)))
+        history = grass.read_command('r.info', flags='h',
+                                     map=found['fullname'])
+        parameters = find_parameters(history)
+        if parameters is None:
+            msg = ("No fusion parameters in the history of <{o}>, "
+                   "fuse <{m}> entirely instead")
+            grass.fatal(_(msg.format(o=output, m=msx)))
+
+        with stage('Update <{o}>'.format(o=output)):
+            update_band(scene['pan'], msx, output, parameters, extent,
+                        engine, tile_size, stream,
+                        '{tmp}.{i}'.format(tmp=tmp, i=index))
+
+
+def prepare_scene_job(options, flags, engine, tile_size, stream, tmp):
+    """Run `prepare_scene` for a scene of a batch, possibly inside a worker
+    process, in a region named after `tmp` and set to the extent of the
+    scene's Panchromatic image. Returns the name of the region along with
+    the jobs fusing the scene's Multi-Spectral images and the ones skipped,
+    see `prepare_scene`, and the report of the preparation, if any."""
+    scene = scene_settings(options, flags)
+    region = '{tmp}.region'.format(tmp=tmp)
+    try:
+        with report(pan=scene['pan']) as preparation:
+            run('g.region', flags='u', raster=scene['pan'], save=region,
+                overwrite=True)
+            with use_region(region):
+                jobs, skipped = prepare_scene(scene, engine, tile_size,
+                                              stream, tmp)
+        return (region, jobs, skipped,
+                preparation.as_dict() if preparation else None)
+    except SystemExit:
+        raise RuntimeError("Preparing <{p}> failed".format(p=scene['pan']))
+
+
+class Deferred(object):
+    """A call deferred until its result is requested, standing in for the
+    `AsyncResult` of a process pool when processing sequentially"""
+    def __init__(self, function, *args):
+        self.function = function
+        self.args = args
+
+    def get(self):
+        return self.function(*self.args)
+
+
+def fuse_batch(scenes, engine, tile_size, stream, nprocs):
+    """Fusing a batch of `scenes`, (options, flags) pairs, on a single pool of
+    `nprocs` processes. The preparation of a scene (High Pass Filtering its
+    Panchromatic image) and the fusion of each of its Multi-Spectral images
+    are separate jobs, so that workers move on to the next scene(s) while
+    the images of the previous one are being fused. Up to `nprocs` scenes are
+    prepared ahead, bounding the temporary maps in existence. A failing job
+    does not stop the batch, which may be resumed: images fused by a
+    previous run are skipped. Returns the status of every image:
+    (scene number, pan, msx, output, status, error message), where status is
+    'done', 'skipped' or 'failed', along with the reports, if any, of the
+    preparation of each scene and of the fusion of each image."""
+    pool = Pool(nprocs) if nprocs > 1 else None
+
+    def submit(function, *args):
+        if pool:
+            return pool.apply_async(function, args)
+        return Deferred(function, *args)
+
+    def prepare(number):
+        options, flags = scenes[number - 1]
+        tmp = 'tmp.{pid}.{n}'.format(pid=os.getpid(), n=number)
+        return submit(prepare_scene_job, options, flags, engine, tile_size,
+                      stream, tmp)
+
+    statuses = []
+    preparations_reports = []
+    bands = []
+
+    def collect(number, fusions):
+        """Waiting for the fusions of a scene, finishing them in order"""
+        for pan, msx, output, digest, result in fusions:
+            try:
+                band = finish_job(output, digest, *result.get())
+            except Exception as error:
+                msg = "Scene {n}: fusing <{m}> failed: {e}"
+                g.message(msg.format(n=number, m=msx, e=error), flags='w')
+                statuses.append((number, pan, msx, output, 'failed',
+                                 str(error)))
+            else:
+                statuses.append((number, pan, msx, output, 'done', ''))
+                if band:
+                    band['scene'] = number
+                    bands.append(band)
+        pattern = 'tmp.{pid}.{n}.*'.format(pid=os.getpid(), n=number)
+        run('g.remove', flags="f", type="raster,region", pattern=pattern)
+
+    try:
+        ahead = max(nprocs, 1)
+        preparations = [prepare(number) for number in
+                        range(1, min(ahead, len(scenes)) + 1)]
+        previous = None
+        for number, (options, flags) in enumerate(scenes, 1):
+            preparation = preparations.pop(0)
+            if number + ahead <= len(scenes):
+                preparations.append(prepare(number + ahead))
+
+            g.message("\n|> Scene {n} of {t}: <{p}>".format(
+                n=number, t=len(scenes), p=options['pan']))
+            fusions = []
+            try:
+                region, jobs, skipped, prepared = preparation.get()
+            except Exception as error:
+                msg = "Scene {n}: preparing <{p}> failed: {e}"
+                g.message(msg.format(n=number, p=options['pan'], e=error),
+                          flags='w')
+                for msx in options['msx'].split(','):
+                    statuses.append((number, options['pan'], msx, '',
+                                     'failed', str(error)))
+            else:
+                if prepared:
+                    prepared['scene'] = number
+                    preparations_reports.append(prepared)
+                for msx, output in skipped:
+                    statuses.append((number, options['pan'], msx, output,
+                                     'skipped', ''))
+                fusions = [(options['pan'], job['msx'], output, digest,
+                            submit(fuse_band_job, job, region))
+                           for output, digest, job in jobs]
+
+            # finish the previous scene while this one is being fused
+            if previous:
+                collect(*previous)
+            previous = (number, fusions)
+        if previous:
+            collect(*previous)
+    finally:
+        if pool:
+            pool.close()
+            pool.join()
+
+    return statuses, preparations_reports, bands
+
+
+def fuse_scene(scene, engine, tile_size, stream, nprocs):
+    """Fusing the Multi-Spectral images of a single `scene`, in parallel if
+    requested. Returns the reports, if any, of the fusion of each image,
+    along with the (msx, output) pairs of the images skipped."""
+    jobs, skipped = prepare_scene(scene, engine, tile_size, stream,
+                                  'tmp.{pid}'.format(pid=os.getpid()))
+
+    # Fuse Multi-Spectral images, in parallel if requested, and finish each
+    # one (history entry, rename) as soon as it is fused, in order, so that
+    # an interrupted run resumes from the last finished image
+    fusions = [job for output, digest, job in jobs]
+    bands = []
+    pool = None
+    if nprocs > 1 and len(jobs) > 1:
+        pool = Pool(min(nprocs, len(jobs)))
+        results = pool.imap(fuse_band_job, fusions)
+    else:
+        results = (fuse_band_job(job) for job in fusions)
+    try:
+        for index, result in enumerate(results):
+            output, digest, job = jobs[index]
+            bands.append(finish_job(output, digest, *result))
+    finally:
+        if pool:
+            pool.close()
+            pool.join()
+    return bands, skipped
+
+
+def serve(jobs, results, options, flags, engine, tile_size, stream, nprocs):
+    """Serving fusion jobs, one JSON line each read from the file `jobs`
+    (see `manifest.parse_job`), until its end. Each job is a scene, whose
+    options and flags default to the ones of the run, fused in the extent of
+    its Panchromatic image, or within the given one. The process, along with
+    the GRASS session, the imported modules and the memoized statistics,
+    remains warm between jobs. Writes a JSON line per job in the file
+    `results`: its number and identifier, its status ('done' or 'failed'),
+    the error message, the status of each image and the report of the job
+    (wall and CPU time per stage). Returns the reports of the fusion of each
+    image."""
+    bands = []
+    # readline(), unlike iterating, does not wait for further lines (Python 2)
+    for number, line in enumerate(iter(jobs.readline, ''), 1):
+        if not line.strip():
+            continue
+        result = dict(job=number, id=number, status='done', error='',
+                      images=[])
+        try:
+            with report(job=number) as job_report:
+                identifier, extent, scene_options, overrides = \
+                    parse_job(line, number)
+                result['id'] = identifier
+                note(id=identifier)
+                scene = scene_settings(dict(options, **scene_options),
+                                       scene_flags(flags, overrides))
+                g.message("\n|> Job {n}: <{p}>".format(n=number,
+                                                       p=scene['pan']))
+                region = 'tmp.{pid}.job'.format(pid=os.getpid())
+                with private_region(region):
+                    run('g.region', raster=scene['pan'])
+                    if extent:
+                        north, south, east, west = extent
+                        run('g.region', n=north, s=south, e=east, w=west,
+                            align=scene['pan'])
+                    fused, skipped = fuse_scene(scene, engine, tile_size,
+                                                stream, nprocs)
+            for band in fused:
+                band['job'] = number
+                bands.append(band)
+                result['images'].append(dict(msx=band['msx'],
+                                             output=band['output'],
+                                             status='done'))
+            for msx, output in skipped:
+                result['images'].append(dict(msx=msx, output=output,
+                                             status='skipped'))
+        except (Exception, SystemExit) as error:
+            # grass.fatal() exits, after printing the error message
+            message = ("See the error message(s)"
+                       if isinstance(error, SystemExit) else str(error))
+            g.message("Job {n} failed: {e}".format(n=number, e=message),
+                      flags='w')
+            result.update(status='failed', error=message)
+        finally:
+            cleanup()  # of the HPF images of the job
+        if job_report:
+            result['report'] = job_report.as_dict()
+        results.write(json.dumps(result, sort_keys=True) + '\n')
+        results.flush()
+    return bands
+
+
+def temporary_disk_usage():
+    """Returning a function measuring the disk used by the temporary maps and
+    regions of this run, and by maps being written, in bytes"""
+    env = grass.gisenv()
+    mapset = os.path.join(env['GISDBASE'], env['LOCATION_NAME'],
+                          env['MAPSET'])
+    patterns = [os.path.join(mapset, '*',
+                             'tmp.{pid}.*'.format(pid=os.getpid())),
+                os.path.join(mapset, '.tmp', '*', '*')]
+
+    def usage():
+        total = 0
+        for pattern in patterns:
+            for path in glob.glob(pattern):
+                names = [path]
+                for root, dirs, files in os.walk(path):  # i.e. cell_misc
+                    names.extend(os.path.join(root, name) for name in files)
+                for name in names:
+                    try:
+                        if os.path.isfile(name):
+                            total += os.path.getsize(name)
+                    except OSError:  # removed meanwhile
+                        pass
+        return total
+
+    return usage
+
+
+def write_report(filename, run_report, scenes, bands):
+    """Writing the JSON report of the run, of the preparation of each scene
+    (in batch mode) and of the fusion of each image"""
+    document = run_report.as_dict()
+    document['scenes'] = [scene for scene in scenes if scene]
+    document['images'] = [band for band in bands if band]
+    with open(filename, 'w') as output:
+        json.dump(document, output, indent=2, sort_keys=True)
 
-            tf = trimming_factor
 
-            # communicate
-            msg = '\n|* Trimming output image border pixels by '
-            msg += '{factor} times the low resolution\n'.format(factor=tf)
-            nsew = '   > Input extent: n: {n}, s: {s}, e: {e}, w: {w}'
-            nsew = nsew.format(n=region.n, s=region.s, e=region.e, w=region.w)
-            msg += nsew
+# main program
 
-            g.message(msg)
+def main():
 
-            # re-set borders
-            region.n -= tf * images[msx].nsres
-            region.s += tf * images[msx].nsres
-            region.e -= tf * images[msx].ewres
-            region.w += tf * images[msx].ewres
+    global tiled_statistics
 
-            # communicate and act
-            msg = '   > Output extent: n: {n}, s: {s}, e: {e}, w: {w}'
-            msg = msg.format(n=region.n, s=region.s, e=region.e, w=region.w)
-            g.message(msg)
+    engine = options['engine']
+    nprocs = int(options['nprocs'])
+    tile_size = int(options['tile_size'])
+    stream = flags['s']
+    tiled_statistics = tiled_settings(options)
 
-            # modify only the extent
-            run('g.region',
-                n=region.n, s=region.s, e=region.e, w=region.w)
-            trim = "{out} = {input}".format(out=tmp_msx_hpf, input=tmp_msx_hpf)
-            grass.mapcalc(trim)
+    if stream and engine != 'numpy':
+        grass.fatal(_("Streaming the HPF image(s) (-s) requires engine=numpy"))
+    if BACKEND is None and (engine == 'numpy' or tiled_statistics):
+        grass.fatal(_("The numpy engine and statistics=tiles require NumPy"))
 
-        #
-        # End of Algorithm
+#    # Check & warn user about "ns == ew" resolution of current region ======
+#    region = grass.region()
+#    nsr = region['nsres']
+#    ewr = region['ewres']
+#
+#    if nsr != ewr:
+#        msg = ('>>> Region's North:South ({ns}) and East:West ({ew}) '
+#               'resolutions do not match!')
+#        msg = msg.format(ns=nsr, ew=ewr)
+#        g.message(msg, flags='w')
+
+    # Timings and resources per stage, per run and per image
+    if options['report']:
+        instrumentation.enable(disk=temporary_disk_usage())
+    elif flags['w']:
+        instrumentation.enable()  # timings per job
+
+    scenes = []
+    bands = []
+    failed = []
+    if engine == 'numpy':
+        g.message("|! In-process filtering and fusion via {b}".format(
+            b=BACKEND), flags='v')
+
+    with report(options=dict(options), flags=dict(flags),
+                backend=BACKEND) as run_report:
+
+        # Batch of scenes, each one in the extent of its Panchromatic image
+        if options['manifest']:
+            try:
+                manifest = read_manifest(options['manifest'])
+            except (IOError, ValueError) as error:
+                grass.fatal(_("Invalid manifest <{f}>: {e}").format(
+                    f=options['manifest'], e=error))
+            batch = [(dict(options, **scene_options),
+                      scene_flags(flags, scene_flags_overrides))
+                     for scene_options, scene_flags_overrides in manifest]
+
+            statuses, scenes, bands = fuse_batch(batch, engine, tile_size,
+                                                 stream, nprocs)
+
+            # status per image: scene|pan|msx|output|status
+            for status in statuses:
+                sys.stdout.write('{0}|{1}|{2}|{3}|{4}\n'.format(*status))
+            failed = [status for status in statuses if status[4] == 'failed']
+
+        # Jobs served until the end of the standard input
+        elif flags['w']:
+            g.message("|! Serving fusion jobs from the standard input")
+            bands = serve(sys.stdin, sys.stdout, options, flags, engine,
+                          tile_size, stream, nprocs)
 
-        # history entry
-        run("r.support", map=tmp_msx_hpf, history="\n".join(cmd_history))
+        else:
+            try:
+                scene = scene_settings(options, flags)
+            except ValueError as error:
+                grass.fatal(error)
+
+            grass.use_temp_region()  # to safely modify the region
+
+            # Fuse again only the part depending on a changed extent
+            if options['update']:
+                extent = [float(value)
+                          for value in options['update'].split(',')]
+                if len(extent) != 4:
+                    grass.fatal(_("Option <update> requires four values: "
+                                  "n,s,e,w"))
+                update_scene(scene, extent, engine, tile_size, stream,
+                             'tmp.{pid}'.format(pid=os.getpid()))
+            else:
+                bands = fuse_scene(scene, engine, tile_size, stream,
+                                   nprocs)[0]
+
+            # remove shared HPF images
+            cleanup()
+
+            # visualising-related information
+            grass.del_temp_region()  # restoring previous region settings
+            g.message("\n|! Original Region restored")
+            g.message("\n>>> Hint, rebalancing colors (via i.colors.enhance) "
+                      "may improve appearance of RGB composites!",
+                      flags='i')
 
-        # add suffix to basename & rename end product
-        msx_name = "{base}.{suffix}"
-        msx_name = msx_name.format(base=msx.split('@')[0], suffix=outputsuffix)
-        run("g.rename", raster=(tmp_msx_hpf, msx_name))
+    if options['report']:
+        write_report(options['report'], run_report, scenes, bands)
 
-        # remove temporary files
-        cleanup()
+    if failed:
+        grass.fatal(_("Fusing {f} of {t} image(s) failed").format(
+            f=len(failed), t=len(statuses)))
+
+
+def profile_basename():
+    """Base name of the profile files: next to the report, if any, or in the
+    current directory"""
+    if options['report']:
+        directory = os.path.dirname(os.path.abspath(options['report']))
+    else:
+        directory = os.getcwd()
+    name = 'i.fusion.hpf.{pid}'.format(pid=os.getpid())
+    return os.path.join(directory, name)
 
-    # visualising-related information
-    grass.del_temp_region()  # restoring previous region settings
-    g.message("\n|! Original Region restored")
-    g.message("\n>>> Hint, rebalancing colors (via i.colors.enhance) "
-              "may improve appearance of RGB composites!",
-              flags='i')
 
 if __name__ == "__main__":
     options, flags = grass.parser()
     atexit.register(cleanup)
+    if flags['p']:
+        count_pixels = False
+        try:
+            with profiled(profile_basename()) as profiler:
+                # sample the memory traced per stage (of this process)
+                instrumentation.callbacks.append(profiler.sample)
+                instrumentation.enable()
+                status = main()
+        finally:
+            g.message("Profile written in <{b}.prof> and <{b}.txt>".format(
+                b=profile_basename()))
+            if tracemalloc is None:
+                g.message("Memory allocations not traced, which requires "
+                          "Python >= 3.4", flags='w')
+        sys.exit(status)
     sys.exit(main())
@@ -0,0 +1,178 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Instrumentation of the stages of a fusion: wall and CPU time, pixels
+processed, peak memory (resident set size) and temporary disk in use.
+
+Stages are recorded in the active report of the process, if any, as long as
+instrumentation is `enable`d. Otherwise, recording costs nothing:
+
+    enable()
+    with report(msx='Red') as band:
+        with stage('Upsampling', pixels=rows * cols):
+            ...
+    band.as_dict()
+
+Stages may be nested: the name of a nested stage is prefixed by the names of
+the stages enclosing it, i.e. 'Upsampling/r.resamp.interp'. The CPU time
+includes the one of child processes (i.e. GRASS GIS modules) the stage waited
+for. Peak memory figures are high-water marks of the process and of its
+largest child process, up to the end of the stage. Functions appended to
+`callbacks` are called with the record of each stage, at its end, and may
+add to it (i.e. samples of a profiler).
+"""
+
+from __future__ import division
+
+import os
+import sys
+import timeit
+from contextlib import contextmanager
+from functools import wraps
+
+try:
+    import resource
+except ImportError:  # i.e. on Windows
+    resource = None
+
+enabled = False
+temporary_disk = None  # callable returning the bytes of temporary data
+reports = []  # stack of active reports of this process
+callbacks = []  # called with the record of each stage
+
+
+def enable(disk=None):
+    """Enable instrumentation, measuring temporary disk via `disk()`, if
+    given. Processes forked afterwards inherit the setting."""
+    global enabled, temporary_disk
+    enabled = True
+    temporary_disk = disk
+
+
+def cpu_time():
+    """Return the CPU time (user and system) of this process and the child
+    processes it waited for, in seconds"""
+    times = os.times()
+    return times[0] + times[1] + times[2] + times[3]
+
+
+def peak_rss():
+    """Return the peak resident set size of this process and of its largest
+    child process, in bytes, or (None, None) if unknown"""
+    if resource is None:
+        return None, None
+    unit = 1 if sys.platform == 'darwin' else 1024  # bytes vs. kilobytes
+    return (resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * unit,
+            resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss * unit)
+
+
+def throughput(pixels, seconds):
+    """Return the throughput in megapixels per second, or None"""
+    if not pixels or not seconds:
+        return None
+    return pixels / 1e6 / seconds
+
+
+class Report(object):
+    """
+    Stages recorded along with arbitrary `details` (i.e. the image, its
+    weights and statistics) of a run or of a single image
+    """
+    def __init__(self, **details):
+        self.details = details
+        self.stages = []
+        self.names = []  # of the stages in progress
+        self.start = timeit.default_timer()
+        self.cpu = cpu_time()
+        self.wall = None
+
+    def note(self, **details):
+        """Add `details` to the report"""
+        self.details.update(details)
+
+    @contextmanager
+    def stage(self, name, pixels=None):
+        """Record the stage `name`. `pixels` may be a callable, only called
+        (at the start of the stage) when recording."""
+        if callable(pixels):
+            pixels = pixels()
+        self.names.append(name)
+        start, cpu = timeit.default_timer(), cpu_time()
+        try:
+            yield
+        finally:
+            wall = timeit.default_timer() - start
+            rss, rss_children = peak_rss()
+            record = dict(
+                stage='/'.join(self.names),
+                wall=wall,
+                cpu=cpu_time() - cpu,
+                pixels=pixels,
+                throughput=throughput(pixels, wall),
+                peak_rss=rss,
+                peak_rss_children=rss_children,
+                temporary_disk=temporary_disk() if temporary_disk else None)
+            for callback in callbacks:
+                callback(record)
+            self.stages.append(record)
+            self.names.pop()
+
+    def close(self):
+        self.wall = timeit.default_timer() - self.start
+        self.cpu = cpu_time() - self.cpu
+
+    def as_dict(self):
+        """Return the report as a JSON serialisable dictionary"""
+        report = dict(self.details)
+        pixels = report.get('pixels')
+        rss, rss_children = peak_rss()
+        report.update(wall=self.wall, cpu=self.cpu,
+                      throughput=throughput(pixels, self.wall),
+                      peak_rss=rss, peak_rss_children=rss_children,
+                      stages=self.stages)
+        return report
+
+
+@contextmanager
+def report(**details):
+    """Make a new report, with `details`, the active one of this process
+    until the end of the block. Yields the report, or None if instrumentation
+    is not enabled."""
+    if not enabled:
+        yield None
+        return
+    active = Report(**details)
+    reports.append(active)
+    try:
+        yield active
+    finally:
+        active.close()
+        reports.pop()
+
+
+@contextmanager
+def stage(name, pixels=None):
+    """Record the stage `name` in the active report, if any"""
+    if not reports:
+        yield
+        return
+    with reports[-1].stage(name, pixels):
+        yield
+
+
+def note(**details):
+    """Add `details` to the active report, if any"""
+    if reports:
+        reports[-1].note(**details)
+
+
+def staged(name, pixels=None):
+    """Decorator recording every call of a function as the stage `name`"""
+    def decorator(function):
+        @wraps(function)
+        def wrapper(*args, **kwargs):
+            with stage(name, pixels):
+                return function(*args, **kwargs)
+        return wrapper
+    return decorator
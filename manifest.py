@@ -0,0 +1,137 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Reading manifests of scenes, pairs of a Panchromatic and Multi-Spectral
+images, to fuse in a single batch.
+
+A manifest is either a JSON file, a list of objects, or a CSV file with a
+header row. Each scene requires a `pan` image and a list of `msx` images (a
+JSON list, or a comma separated string), and may override any of the
+options in `SCENE_OPTIONS` and the flags in `SCENE_FLAGS`. For example:
+
+    pan,msx,ratio,flags
+    Pan_1,"Red_1,Green_1,Blue_1",,l
+    Pan_2,"Red_2,Green_2,Blue_2",4,l2
+
+The jobs of the worker mode are scenes as well, one JSON object per line,
+which may identify the job by an `id` and restrict it to an `extent`:
+
+    {"id": "aoi-7", "pan": "Pan_1", "msx": ["Red_1"], "extent": [n, s, e, w]}
+"""
+
+import csv
+import json
+
+try:
+    basestring
+except NameError:  # Python 3
+    basestring = str
+
+SCENE_OPTIONS = ('pan', 'msx', 'suffix', 'ratio', 'center', 'center2',
+                 'modulation', 'modulation2', 'trim', 'sample', 'type',
+                 'match')
+SCENE_FLAGS = 'l2c'
+
+
+def text(value):
+    """Return `value` as a string, leaving (unicode) strings, as decoded
+    from JSON on Python 2, as they are"""
+    return value if isinstance(value, basestring) else str(value)
+
+
+def parse_scene(entry, number):
+    """
+    Return the options of a scene, a dictionary of strings as parsed by
+    `grass.script.parser()`, and its flags (or None if not given) out of a
+    manifest `entry`.
+
+    Raises
+    ------
+    ValueError: If `entry` lacks the `pan` or `msx` images, or holds unknown
+    keys or flags.
+    """
+    options = {}
+    flags = None
+    for key, value in entry.items():
+        if value is None or value == '':
+            continue
+        if key == 'flags':
+            flags = text(value)
+            unknown = set(flags) - set(SCENE_FLAGS)
+            if unknown:
+                msg = "Scene {n}: unknown flag(s) <{f}>"
+                raise ValueError(msg.format(n=number,
+                                            f=''.join(sorted(unknown))))
+        elif key in SCENE_OPTIONS:
+            if isinstance(value, (list, tuple)):
+                value = ','.join(text(item) for item in value)
+            options[key] = text(value).strip()
+        else:
+            raise ValueError("Scene {n}: unknown option <{k}>".format(
+                n=number, k=key))
+
+    for key in ('pan', 'msx'):
+        if not options.get(key):
+            raise ValueError("Scene {n}: missing <{k}>".format(n=number, k=key))
+    options['msx'] = ','.join(msx.strip() for msx in options['msx'].split(','))
+    return options, flags
+
+
+def parse_job(line, number):
+    """
+    Return the identifier (by default, `number`), the extent (a list of n,
+    s, e, w coordinates, or None), the options and the flags of a job of the
+    worker mode, a JSON object on a single `line`, see `parse_scene`.
+
+    Raises
+    ------
+    ValueError: If `line` is not a JSON object, or holds an invalid extent or
+    scene.
+    """
+    entry = json.loads(line)
+    if not isinstance(entry, dict):
+        raise ValueError("Job {n}: not a JSON object".format(n=number))
+    identifier = entry.pop('id', number)
+    extent = entry.pop('extent', None)
+    if extent is None or extent == '':
+        extent = None
+    else:
+        if not isinstance(extent, (list, tuple)):
+            extent = text(extent).split(',')
+        try:
+            extent = [float(value) for value in extent]
+        except (TypeError, ValueError):
+            extent = []
+        if (len(extent) != 4 or extent[0] <= extent[1] or
+                extent[2] <= extent[3]):
+            raise ValueError("Job {n}: the extent requires four values: "
+                             "n,s,e,w".format(n=number))
+    options, flags = parse_scene(entry, number)
+    return identifier, extent, options, flags
+
+
+def read_manifest(filename):
+    """
+    Return the scenes of a JSON (`.json` extension) or CSV manifest as a
+    list of (options, flags) pairs, see `parse_scene`.
+    """
+    with open(filename) as manifest:
+        if filename.lower().endswith('.json'):
+            entries = json.load(manifest)
+            if not isinstance(entries, list):
+                raise ValueError("The manifest must hold a list of scenes")
+        else:
+            entries = list(csv.DictReader(manifest))
+    return [parse_scene(entry, number)
+            for number, entry in enumerate(entries, 1)]
+
+
+def scene_flags(flags, overrides):
+    """Return a copy of `flags` in which the `SCENE_FLAGS` are set as per
+    the `overrides` string, if any"""
+    flags = dict(flags)
+    if overrides is not None:
+        for key in SCENE_FLAGS:
+            flags[key] = key in overrides
+    return flags
@@ -0,0 +1,89 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Univariate statistics (count, mean, standard deviation, minimum, maximum)
+of NumPy arrays, accumulated tile by tile while streaming over an image.
+
+Each tile contributes its count, mean and sum of squared deviations from its
+mean (M2), which are merged with those of the tiles accumulated so far
+(Chan et al., 1979). NULL cells, expressed as NaN, are ignored. Merging is
+exact up to rounding, whatever the order of the tiles, hence tiles may be
+accumulated in parallel and merged afterwards, see `merge_pairwise`.
+"""
+
+import math
+
+import numpy
+
+
+class Moments(object):
+    """
+    Accumulator of univariate statistics, updated tile by tile
+    """
+    def __init__(self, count=0, mean=0.0, m2=0.0, minimum=float('inf'),
+                 maximum=float('-inf')):
+        self.count = count
+        self.mean = mean
+        self.m2 = m2
+        self.minimum = minimum
+        self.maximum = maximum
+
+    @classmethod
+    def from_array(cls, array):
+        """Return the statistics of the non-NaN cells of an array"""
+        values = numpy.asarray(array, dtype=numpy.float64)
+        values = values[~numpy.isnan(values)]
+        if not values.size:
+            return cls()
+        mean = values.mean()
+        deviations = values - mean
+        return cls(count=values.size, mean=float(mean),
+                   m2=float(numpy.dot(deviations, deviations)),
+                   minimum=float(values.min()), maximum=float(values.max()))
+
+    def merge(self, other):
+        """Merge the statistics of `other` into these ones"""
+        if not other.count:
+            return self
+        count = self.count + other.count
+        delta = other.mean - self.mean
+        self.mean += delta * other.count / count
+        self.m2 += other.m2 + delta * delta * self.count * other.count / count
+        self.count = count
+        self.minimum = min(self.minimum, other.minimum)
+        self.maximum = max(self.maximum, other.maximum)
+        return self
+
+    def update(self, array):
+        """Accumulate the statistics of an array (tile)"""
+        return self.merge(Moments.from_array(array))
+
+    @property
+    def variance(self):
+        """Population variance, as reported by r.univar"""
+        return self.m2 / self.count if self.count else float('nan')
+
+    @property
+    def stddev(self):
+        """Population standard deviation, as reported by r.univar"""
+        return math.sqrt(self.variance)
+
+
+def merge_pairwise(partials):
+    """
+    Return the statistics merging `partials`, e.g. the ones of the tiles of
+    an image, pairwise, as a balanced tree: rounding errors grow with the
+    logarithm of the number of partials rather than linearly. The partials
+    are not modified.
+    """
+    merged = [Moments().merge(partial) for partial in partials]
+    if not merged:
+        return Moments()
+    while len(merged) > 1:
+        pairs = [merged[index].merge(merged[index + 1])
+                 for index in range(0, len(merged) - 1, 2)]
+        if len(merged) % 2:
+            pairs.append(merged[-1])
+        merged = pairs
+    return merged[0]
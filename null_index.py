@@ -0,0 +1,85 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Indexing the NULL cells of images, so that tiles of NULL cells only are
+skipped and the others are processed within the range of columns holding
+valid cells.
+
+Images rotated within the region, i.e. orbit strips, are surrounded by a
+collar of NULL cells. Cells of the High Pass Filtered and of the fused image
+are NULL wherever the Panchromatic image is: the index of the former, built
+while filtering, delimits the cells worth computing in every later step.
+"""
+
+import numpy
+
+
+def valid_columns(array):
+    """
+    Return the range, (first, last) with `last` exclusive, of the columns of
+    a 2D `array` holding valid (not NaN) cells, or None if all of its cells
+    are NaN.
+    """
+    columns = numpy.flatnonzero(~numpy.isnan(array).all(axis=0))
+    if not columns.size:
+        return None
+    return int(columns[0]), int(columns[-1]) + 1
+
+
+def null_tile(rows, cols):
+    """Return a tile of `rows` x `cols` NULL (NaN) cells"""
+    return numpy.full((rows, cols), numpy.nan)
+
+
+def expand(block, first, cols):
+    """Return a tile of `cols` columns holding a 2D `block` of its columns,
+    starting at column `first`, and NULL cells elsewhere"""
+    tile = null_tile(block.shape[0], cols)
+    tile[:, first:first + block.shape[1]] = block
+    return tile
+
+
+class NullIndex(object):
+    """
+    Index of the NULL cells of an image of `rows` x `cols` cells: the range of
+    columns holding valid cells in each row. Rows not recorded via `update`
+    are considered valid entirely.
+    """
+    def __init__(self, rows, cols):
+        self.rows = rows
+        self.cols = cols
+        self.first = numpy.zeros(rows, dtype=numpy.int64)
+        self.last = numpy.full(rows, cols, dtype=numpy.int64)
+
+    def update(self, start, block):
+        """Record the valid cells of the rows of a 2D `block` of the image,
+        starting at row `start`"""
+        valid = ~numpy.isnan(block)
+        any_valid = valid.any(axis=1)
+        stop = start + len(block)
+        self.first[start:stop] = numpy.where(any_valid, valid.argmax(axis=1),
+                                             self.cols)
+        self.last[start:stop] = numpy.where(
+            any_valid, block.shape[1] - valid[:, ::-1].argmax(axis=1), 0)
+
+    def span(self, start, stop):
+        """Return the range, (first, last), of the columns holding valid
+        cells in rows `start` to `stop` (exclusive), or None if all of them
+        are NULL"""
+        first = self.first[start:stop].min()
+        last = self.last[start:stop].max()
+        if first >= last:
+            return None
+        return int(first), int(last)
+
+    def window(self, row, col, rows, cols):
+        """Return the index of a window of `rows` x `cols` cells of the
+        image, starting at `row`, `col`"""
+        index = NullIndex(rows, cols)
+        first = numpy.clip(self.first[row:row + rows] - col, 0, cols)
+        last = numpy.clip(self.last[row:row + rows] - col, 0, cols)
+        null = first >= last
+        index.first = numpy.where(null, cols, first)
+        index.last = numpy.where(null, 0, last)
+        return index
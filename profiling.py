@@ -0,0 +1,106 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Profiling of the Python side of the module: function calls via cProfile and
+memory allocations via tracemalloc (Python >= 3.4, skipped otherwise).
+
+    with profiled('/tmp/i.fusion.hpf.1234') as profiler:
+        main()
+
+writes the profile of all calls, for `pstats` or any profile viewer, in
+`/tmp/i.fusion.hpf.1234.prof` and a summary in `/tmp/i.fusion.hpf.1234.txt`:
+the top functions by cumulative time, the top lines by allocated memory and,
+if given via `sample`, the memory traced at the end of each stage.
+"""
+
+from __future__ import division
+from __future__ import print_function
+
+import cProfile
+import pstats
+from contextlib import contextmanager
+
+try:
+    import tracemalloc
+except ImportError:  # Python 2
+    tracemalloc = None
+
+TOP = 25  # functions and lines reported in the summary
+FRAMES = 1  # of the traceback stored per allocation
+
+
+class Profiler(object):
+    """
+    Profile calls and memory allocations, writing the results in files named
+    after `basename`
+    """
+    def __init__(self, basename, top=TOP):
+        self.basename = basename
+        self.top = top
+        self.profile = cProfile.Profile()
+        self.samples = []
+
+    def start(self):
+        if tracemalloc:
+            tracemalloc.start(FRAMES)
+        self.profile.enable()
+
+    def stop(self):
+        self.profile.disable()
+        snapshot = None
+        if tracemalloc:
+            snapshot = tracemalloc.take_snapshot()
+            tracemalloc.stop()
+        self.profile.dump_stats(self.basename + '.prof')
+        with open(self.basename + '.txt', 'w') as summary:
+            self.summarise(summary, snapshot)
+
+    def sample(self, record):
+        """Record the memory traced at the end of a stage: a callback for
+        `instrumentation.callbacks`, which adds it to the stage's record"""
+        if not tracemalloc or not tracemalloc.is_tracing():
+            return
+        current, peak = tracemalloc.get_traced_memory()
+        record.update(python_memory=current, python_memory_peak=peak)
+        self.samples.append((record['stage'], current, peak))
+
+    def summarise(self, output, snapshot=None):
+        """Write the top functions by cumulative time, the top lines by
+        allocated memory (of a tracemalloc `snapshot`) and the samples of
+        the memory traced per stage"""
+        print('Top {n} functions by cumulative time'.format(n=self.top),
+              file=output)
+        stats = pstats.Stats(self.profile, stream=output)
+        stats.sort_stats('cumulative').print_stats(self.top)
+
+        if snapshot is None:
+            print('Memory allocations not traced (requires Python >= 3.4)',
+                  file=output)
+        else:
+            print('Top {n} lines by allocated memory'.format(n=self.top),
+                  file=output)
+            for statistic in snapshot.statistics('lineno')[:self.top]:
+                print(statistic, file=output)
+
+        if snapshot is None:
+            print('\nMemory traced per stage not available (requires '
+                  'Python >= 3.4)', file=output)
+        elif self.samples:
+            print('\nMemory traced per stage (current, peak bytes)',
+                  file=output)
+            for stage, current, peak in self.samples:
+                print('{s}: {c} {p}'.format(s=stage, c=current, p=peak),
+                      file=output)
+
+
+@contextmanager
+def profiled(basename, top=TOP):
+    """Profile the block, writing the results in files named after
+    `basename`, even if the block exits with an error"""
+    profiler = Profiler(basename, top)
+    profiler.start()
+    try:
+        yield profiler
+    finally:
+        profiler.stop()
@@ -0,0 +1,157 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Row based reading and writing of GRASS GIS raster maps as NumPy arrays.
+
+All maps are accessed in the current computational region. NULL cells are
+expressed as NaN in the arrays read and written.
+"""
+
+import numpy
+
+import grass.script as grass
+from grass.pygrass.gis.region import Region
+from grass.pygrass.raster import RasterRow
+from grass.pygrass.raster.buffer import Buffer
+
+from box_filter import high_pass_rows, add_high_pass_rows
+from upsample import bilinear_rows
+
+CELL_NULL = numpy.iinfo(numpy.int32).min  # NULL value of integer maps
+DTYPES = {'CELL': numpy.int32, 'FCELL': numpy.float32, 'DCELL': numpy.float64}
+
+
+def set_region():
+    """
+    Synchronise the raster library of this process with the current
+    computational region (which may be a temporary one, modified via
+    `g.region`) and return it.
+    """
+    settings = grass.region()
+    region = Region()
+    region.north = settings['n']
+    region.south = settings['s']
+    region.east = settings['e']
+    region.west = settings['w']
+    region.nsres = settings['nsres']
+    region.ewres = settings['ewres']
+    region.adjust()
+    region.set_raster_region()
+    return region
+
+
+class RowReader(object):
+    """
+    Read blocks of rows of a raster map as floating point arrays
+    """
+    def __init__(self, name):
+        self.raster = RasterRow(name)
+        self.raster.open('r')
+        self.rows = self.raster._rows
+        self.cols = self.raster._cols
+        self.integer = self.raster.mtype == 'CELL'
+
+    def read(self, start, stop):
+        """Return rows `start` to `stop` (exclusive) as a 2D array"""
+        block = numpy.empty((stop - start, self.cols))
+        for index, row in enumerate(range(start, stop)):
+            values = self.raster.get_row(row)
+            if self.integer:
+                block[index] = numpy.where(values == CELL_NULL, numpy.nan,
+                                           values)
+            else:
+                block[index] = values
+        return block
+
+    def close(self):
+        self.raster.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+class FilteredRowReader(RowReader):
+    """
+    Read blocks of rows of a raster map High Pass Filtered on the fly
+    """
+    def __init__(self, name, size, center):
+        super(FilteredRowReader, self).__init__(name)
+        self.size = size
+        self.center = center
+
+    def read(self, start, stop):
+        """Return rows `start` to `stop` (exclusive), filtered, as a 2D array"""
+        read = super(FilteredRowReader, self).read
+        return high_pass_rows(read, self.rows, start, stop, self.size,
+                              self.center)
+
+    def add(self, out, start, stop, weight, columns=None):
+        """Add rows `start` to `stop` (exclusive), filtered, times `weight`,
+        to `out`, within the range of `columns`, if given, without storing
+        them (see `box_filter.add_high_pass_rows`)"""
+        read = super(FilteredRowReader, self).read
+        return add_high_pass_rows(out, read, self.rows, start, stop,
+                                  self.size, [self.center], [weight], columns)
+
+
+class UpsampledRowReader(RowReader):
+    """
+    Read blocks of rows of a raster map upsampled bilinearly on the fly. The
+    map's resolution is `ratio` times coarser than the region's and each of
+    its cells consists of `ratio` x `ratio` cells of the region (see
+    `upsample.integer_ratio`).
+    """
+    def __init__(self, name, ratio):
+        super(UpsampledRowReader, self).__init__(name)
+        self.ratio = ratio
+        self.coarse_rows = -(-self.rows // ratio)
+
+    def read_coarse(self, first, last):
+        """Return rows `first` to `last` (exclusive) of the map, at its own
+        resolution: every `ratio`-th row and column of the region"""
+        read = super(UpsampledRowReader, self).read
+        return numpy.vstack([read(row * self.ratio,
+                                  row * self.ratio + 1)[:, ::self.ratio]
+                             for row in range(first, last)])
+
+    def read(self, start, stop):
+        """Return rows `start` to `stop` (exclusive), upsampled, as a 2D
+        array"""
+        return bilinear_rows(self.read_coarse, self.coarse_rows, self.ratio,
+                             start, stop, self.cols)
+
+
+class RowWriter(object):
+    """
+    Write blocks of rows, in sequence, to a new raster map of type `mtype`.
+    Values written to an integer (CELL) map are expected to be rounded.
+    """
+    def __init__(self, name, mtype='DCELL', overwrite=True):
+        self.raster = RasterRow(name)
+        self.raster.open('w', mtype=mtype, overwrite=overwrite)
+        self.cols = self.raster._cols
+        self.mtype = mtype
+
+    def write(self, block):
+        """Append the rows of a 2D array to the raster map"""
+        dtype = DTYPES[self.mtype]
+        for values in numpy.atleast_2d(block):
+            if self.mtype == 'CELL':
+                values = numpy.where(numpy.isnan(values), CELL_NULL, values)
+            row = Buffer((self.cols,), mtype=self.mtype,
+                         buffer=numpy.ascontiguousarray(values, dtype=dtype))
+            self.raster.put_row(row)
+
+    def close(self):
+        self.raster.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
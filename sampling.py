@@ -0,0 +1,134 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Deterministic, spatially stratified sampling of the cells of an image, for
+estimating statistics (i.e. standard deviations for the weighting of the HPF
+image) without reading every cell.
+
+Reading a row of an image High Pass Filtered on the fly requires reading its
+halo, `size // 2` rows above and below it, as well. Sampling runs of
+consecutive rows, which share a single halo, keeps the rows read a fraction
+of the rows of the image, see `run_length` and `rows_fraction`.
+"""
+
+import math
+
+import numpy
+
+SEED = 2008  # fixed, so that repeated runs draw the same sample
+
+
+def sampling_step(fraction):
+    """Return the side, in cells, of the strata sampling `fraction` of the
+    cells of a grid"""
+    return max(int(round(1 / math.sqrt(fraction))), 1)
+
+
+def run_length(halo):
+    """Return the number of consecutive rows sampled per band of an image
+    whose rows are read along with `halo` rows above and below them: as many
+    as the rows of the halo, which then costs as much as the sampled rows"""
+    return max(2 * halo, 1)
+
+
+def rows_fraction(fraction, halo):
+    """
+    Return the fraction of the rows of an image read, along with their
+    `halo`, for sampling `fraction` of its cells in runs of `run_length`
+    rows, see `stratified_sample`. Sampling does not pay off if about 1.
+    """
+    step = sampling_step(fraction)
+    run = run_length(halo)
+    return min((run + 2 * halo) / float(step * run), 1.0)
+
+
+def stratified_sample(rows, cols, fraction, seed=SEED, run=1):
+    """
+    Return a sample of about `fraction` of the cells of a `rows` x `cols`
+    grid, as a list of (row, columns) pairs.
+
+    The grid is split in bands of `step` x `run` rows, where
+    `step = round(1 / sqrt(fraction))`, and the strata of each row of a
+    randomly drawn run of `run` consecutive rows of a band are `step` cells
+    wide, one cell being drawn from each stratum. Hence, a single run of rows
+    is read per band.
+
+    Parameters
+    ----------
+    rows, cols: int
+        Dimensions of the grid.
+    fraction: float
+        Fraction of cells to sample, in (0, 1].
+    seed: int
+        Seed of the pseudo-random number generator.
+    run: int
+        Number of consecutive rows sampled per band, see `run_length`.
+
+    Returns
+    -------
+    sample: list
+        Pairs of a row index and an array of column indices.
+
+    Raises
+    ------
+    ValueError: If `fraction` is not in (0, 1].
+    """
+    if not 0 < fraction <= 1:
+        raise ValueError("Fraction must be in (0, 1], not <%r>" % fraction)
+
+    step = sampling_step(fraction)
+    random = numpy.random.RandomState(seed)
+    starts = numpy.arange(0, cols, step)
+    widths = numpy.minimum(step, cols - starts)
+
+    sample = []
+    band = step * run
+    for start in range(0, rows, band):
+        height = min(band, rows - start)
+        length = min(run, height)
+        first = start + random.randint(height - length + 1)
+        for row in range(first, first + length):
+            offsets = (random.random_sample(len(starts)) * widths).astype(int)
+            sample.append((row, starts + offsets))
+    return sample
+
+
+def row_runs(sample):
+    """
+    Yield the runs of consecutive rows of a `sample`, see
+    `stratified_sample`, as (start, stop, columns) tuples, where `columns`
+    lists the columns sampled in each row of the run.
+    """
+    start, columns = None, []
+    for row, sampled in sample:
+        if columns and row != start + len(columns):
+            yield start, start + len(columns), columns
+            columns = []
+        if not columns:
+            start = row
+        columns.append(sampled)
+    if columns:
+        yield start, start + len(columns), columns
+
+
+def stddev_error(stddev, count):
+    """
+    Return the standard error of a standard deviation estimated from `count`
+    sampled values (normal approximation).
+    """
+    if count < 2:
+        return float('inf')
+    return stddev / math.sqrt(2 * (count - 1))
+
+
+def weight_error(weight, msx_sd, msx_sd_error, hpf_sd, hpf_sd_error):
+    """
+    Return the standard error of a `weight`, proportional to the ratio of
+    two standard deviations, `msx_sd` and `hpf_sd`, given their standard
+    errors. Standard deviations of 0 (i.e. of a constant image) add no error.
+    """
+    relative = [error / sd for sd, error in ((msx_sd, msx_sd_error),
+                                             (hpf_sd, hpf_sd_error))
+                if error and sd]
+    return abs(weight) * math.sqrt(sum(term ** 2 for term in relative))
@@ -0,0 +1,109 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+""" Test the compiled loops against their NumPy equivalents.  """
+
+from __future__ import division
+from __future__ import print_function
+from __future__ import absolute_import
+
+import numpy
+import pytest
+
+import accelerated
+import box_filter
+import fusion
+
+
+@pytest.fixture
+def numpy_backend(monkeypatch):
+    monkeypatch.setattr(accelerated, 'BACKEND', 'numpy')
+
+
+def scene(seed, rows=23, cols=29):
+    random = numpy.random.RandomState(seed)
+    array = random.randint(0, 2048, size=(rows, cols)).astype(float)
+    array[random.rand(rows, cols) < 0.02] = numpy.nan
+    array[0, 3] = -0.0
+    return array
+
+
+@pytest.mark.parametrize('size, centers', [(3, (8,)), (5, (24, 40)),
+                                           (7, (56,))])
+def test_high_pass_bit_identical(numpy_backend, size, centers):
+    array = scene(size)
+    expected = box_filter.high_pass_centers(array, size, centers)
+    filtered = accelerated.high_pass_centers(array, size, centers)
+    for result, reference in zip(filtered, expected):
+        assert result.tobytes() == reference.tobytes()
+
+
+def fused_expected(base, filtered, weights):
+    return fusion.add_weighted([(base, 1)] + list(zip(filtered, weights)))
+
+
+@pytest.mark.parametrize('size, centers', [(3, (8,)), (5, (24, 40))])
+def test_add_high_pass_bit_identical(numpy_backend, size, centers):
+    array, base = scene(size), scene(size + 10) / 5
+    weights = [0.3, 0.07][:len(centers)]
+    expected = fused_expected(
+        base, box_filter.high_pass_centers(array, size, centers), weights)
+    fused = accelerated.add_high_pass(base * 1, array, size, centers, weights)
+    assert fused.tobytes() == expected.tobytes()
+
+    # a window of the array
+    fused = accelerated.add_high_pass(base[4:15, 6:20] * 1, array, size,
+                                      centers, weights, offset=(4, 6))
+    assert fused.tobytes() == expected[4:15, 6:20].tobytes()
+
+
+def add_high_pass_rows(image, base, start, stop, columns):
+    first, last = columns
+    return box_filter.add_high_pass_rows(
+        base[start:stop, first:last] * 1, lambda a, b: image[a:b],
+        image.shape[0], start, stop, 5, (24, 40), (0.3, 0.07), columns)
+
+
+@pytest.mark.parametrize('backend', ['numpy', 'numba'])
+def test_add_high_pass_rows(monkeypatch, backend):
+    image, base = scene(5, rows=30), scene(6, rows=30) / 5
+    image[:, :4] = numpy.nan  # NULL collar
+    image[20:, 22:] = numpy.nan
+    for start, stop in ((0, 8), (8, 20), (20, 30)):
+        for columns in ((0, 29), (3, 25)):
+            first, last = columns
+            monkeypatch.setattr(accelerated, 'BACKEND', 'numpy')
+            filtered = box_filter.high_pass_centers_rows(
+                lambda a, b: image[a:b], 30, start, stop, 5, (24, 40))
+            expected = fused_expected(
+                base[start:stop, first:last],
+                [tile[:, first:last] for tile in filtered], (0.3, 0.07))
+            monkeypatch.setattr(accelerated, 'BACKEND', backend)
+            fused = add_high_pass_rows(image, base, start, stop, columns)
+            assert fused.tobytes() == expected.tobytes()
+
+
+@pytest.mark.skipif(accelerated.numba is None, reason="requires Numba")
+def test_jitted_loops(monkeypatch):
+    image, base = scene(7, rows=30), scene(8, rows=30) / 5
+    monkeypatch.setattr(accelerated, 'BACKEND', 'numpy')
+    expected = add_high_pass_rows(image, base, 8, 20, (0, 29))
+    monkeypatch.setattr(accelerated, 'BACKEND', 'numba')
+    fused = add_high_pass_rows(image, base, 8, 20, (0, 29))
+    assert fused.tobytes() == expected.tobytes()
+    assert accelerated._high_pass.signatures  # compiled, not Python, loops
+    assert accelerated._add_unfiltered.signatures
+
+
+def test_add_weighted_bit_identical(numpy_backend):
+    terms = [(scene(1), 1), (scene(2) / 7, 0.3), (scene(3) / 3, 0.1)]
+    expected = fusion.add_weighted(terms)
+    assert accelerated.add_weighted(terms).tobytes() == expected.tobytes()
+
+
+def test_backend_dispatch(monkeypatch):
+    monkeypatch.setattr(accelerated, 'BACKEND', 'numba')
+    array = scene(4, rows=12, cols=10)
+    filtered = box_filter.high_pass(array, 5, 24)
+    monkeypatch.setattr(accelerated, 'BACKEND', 'numpy')
+    assert filtered.tobytes() == box_filter.high_pass(array, 5, 24).tobytes()
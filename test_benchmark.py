@@ -0,0 +1,35 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+""" Test the benchmark's synthetic scenes and regression checks.  """
+
+from __future__ import division
+from __future__ import print_function
+from __future__ import absolute_import
+
+import numpy
+
+from benchmark import synthetic_scene, representative_ratios, regressions
+
+
+def test_representative_ratios():
+    ratios = representative_ratios()
+    assert ratios == [2, 3, 4, 6, 8, 10]
+    assert all(isinstance(ratio, int) for ratio in ratios)
+
+
+def test_synthetic_scene():
+    pan, msx = synthetic_scene(64, 4)
+    assert pan.shape == (64, 64)
+    assert msx.shape == (16, 16)
+    assert 0 <= pan.min() and pan.max() <= 2047
+    assert numpy.isclose(msx[0, 0], pan[:4, :4].mean())
+
+
+def test_regressions():
+    baseline = {'scenes': {'a': {'timings': {'filtering': 1.0,
+                                             'fusion': 0.0001}}}}
+    report = {'scenes': {'a': {'timings': {'filtering': 1.5,
+                                           'fusion': 0.0005}}}}
+    assert regressions(report, baseline) == [('a', 'filtering', 1.0, 1.5)]
+    assert regressions(report, baseline, tolerance=1) == []
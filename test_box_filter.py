@@ -0,0 +1,116 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+""" Test box-sum based High Pass Filtering.  """
+
+from __future__ import division
+from __future__ import print_function
+from __future__ import absolute_import
+
+import numpy
+
+from box_filter import box_sum, high_pass, high_pass_tiles
+from box_filter import high_pass_centers_tiles
+
+
+def convolve(array, kernel):
+    """ Brute force r.mfilter replica: NULL windows, unfiltered borders. """
+    size = len(kernel)
+    half = size // 2
+    kernel = numpy.array(kernel, dtype=float)
+    rows, cols = array.shape
+    filtered = array.copy()
+    for row in range(half, rows - half):
+        for col in range(half, cols - half):
+            window = array[row - half:row + half + 1, col - half:col + half + 1]
+            filtered[row, col] = (window * kernel).sum()
+    return filtered
+
+
+def kernel(size, center):
+    matrix = [[-1] * size for _ in range(size)]
+    matrix[size // 2][size // 2] = center
+    return matrix
+
+
+def test_box_sum():
+    array = numpy.arange(42, dtype=float).reshape(6, 7)
+    sums = box_sum(array, 3)
+    assert sums.shape == (4, 5)
+    assert sums[0, 0] == array[:3, :3].sum()
+    assert sums[-1, -1] == array[-3:, -3:].sum()
+
+
+def test_high_pass():
+    random = numpy.random.RandomState(7)
+    array = random.randint(0, 4096, size=(31, 37)).astype(float)
+    for size, center in [(5, 24), (7, 56), (15, 448)]:
+        expected = convolve(array, kernel(size, center))
+        assert numpy.array_equal(high_pass(array, size, center), expected)
+
+
+def test_high_pass_nulls():
+    random = numpy.random.RandomState(11)
+    array = random.randint(0, 256, size=(20, 20)).astype(float)
+    array[10, 4] = numpy.nan
+    filtered = high_pass(array, 5, 24)
+    expected = convolve(array, kernel(5, 24))
+    assert numpy.array_equal(numpy.isnan(filtered), numpy.isnan(expected))
+    valid = ~numpy.isnan(expected)
+    assert numpy.array_equal(filtered[valid], expected[valid])
+
+
+def test_high_pass_tiles():
+    random = numpy.random.RandomState(5)
+    array = random.randint(0, 2048, size=(40, 23)).astype(float)
+    array[17, 9] = numpy.nan
+
+    def read(first, last):
+        return array[first:last]
+
+    for size, center in [(5, 24), (15, 448)]:
+        expected = high_pass(array, size, center)
+        for tile_rows in (1, 4, 13, 40, 64):
+            tiles = high_pass_tiles(read, len(array), size, center, tile_rows)
+            filtered = numpy.vstack([tile for _, _, tile in tiles])
+            assert numpy.array_equal(numpy.isnan(filtered),
+                                     numpy.isnan(expected))
+            valid = ~numpy.isnan(expected)
+            assert numpy.array_equal(filtered[valid], expected[valid])
+
+
+def test_high_pass_centers_tiles():
+    random = numpy.random.RandomState(3)
+    array = random.randint(0, 2048, size=(33, 19)).astype(float)
+    array[8, 12] = numpy.nan
+    reads = []
+
+    def read(first, last):
+        reads.append((first, last))
+        return array[first:last]
+
+    centers = (24, 40)
+    tiles = list(high_pass_centers_tiles(read, len(array), 5, centers, 10))
+    assert len(reads) == len(tiles)  # a single read per tile
+    for index, center in enumerate(centers):
+        expected = high_pass(array, 5, center)
+        filtered = numpy.vstack([tile[index] for _, _, tile in tiles])
+        assert numpy.array_equal(filtered, expected, equal_nan=True)
+
+
+def test_high_pass_tiles_null_collar():
+    random = numpy.random.RandomState(9)
+    array = random.randint(0, 2048, size=(48, 40)).astype(float)
+    rows, cols = numpy.mgrid[0:48, 0:40]
+    array[numpy.abs(rows - cols) > 9] = numpy.nan  # a diagonal strip
+    array[:6] = numpy.nan
+
+    def read(first, last):
+        return array[first:last]
+
+    for size, center in [(3, 8), (7, 56)]:
+        expected = high_pass(array, size, center)
+        for tile_rows in (1, 5, 48):
+            tiles = high_pass_tiles(read, len(array), size, center, tile_rows)
+            filtered = numpy.vstack([tile for _, _, tile in tiles])
+            assert numpy.array_equal(filtered, expected, equal_nan=True)
@@ -0,0 +1,51 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+""" Test fingerprints of fused images.  """
+
+from __future__ import division
+from __future__ import print_function
+from __future__ import absolute_import
+
+from fingerprint import fingerprint, history_entry, find_fingerprint
+from fingerprint import parameters_entry, find_parameters
+
+
+def test_fingerprint():
+    properties = {'pan': ['Pan@PERMANENT', 1.5], 'ratio': 4.0,
+                  'center': 'low', 'sample': None}
+    digest = fingerprint(properties)
+    assert len(digest) == 40
+    assert fingerprint(dict(properties)) == digest
+    assert fingerprint(dict(properties, ratio=4.5)) != digest
+    assert fingerprint(dict(properties, pan=['Pan@PERMANENT', 2])) != digest
+
+
+def test_find_fingerprint():
+    assert find_fingerprint('') is None
+    assert find_fingerprint('Weigthing applied: 1 / 2 * 0.35') is None
+    first = fingerprint({'ratio': 4})
+    second = fingerprint({'ratio': 5})
+    history = '\n'.join(['Weigthing applied: 1 / 2 * 0.35',
+                         history_entry(first),
+                         '', history_entry(second)])
+    assert find_fingerprint(history) == second
+
+
+def test_find_parameters():
+    assert find_parameters('Weigthing applied: 1 / 2 * 0.35') is None
+    parameters = {'ratio': 4.0, 'weights': [0.123456789012345],
+                  'matching': [1.5, 2.5, 3.5, 4.5], 'center2': None}
+    history = '\n'.join(['Weigthing applied: 1 / 2 * 0.35',
+                         parameters_entry({'ratio': 2}),
+                         parameters_entry(parameters)])
+    assert find_parameters(history) == parameters
+
+
+def test_find_split_parameters():
+    parameters = {'ratio': 4.0, 'weights': [0.123456789012345, 0.25],
+                  'matching': [1.5, 2.5, 3.5, 4.5], 'center2': 'mid'}
+    entry = parameters_entry(parameters)
+    lines = [entry[index:index + 71] for index in range(0, len(entry), 71)]
+    history = '\n'.join('   ' + line for line in lines + ['Other entry'])
+    assert find_parameters(history) == parameters
@@ -0,0 +1,53 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+""" Test fusing arrays and casting the result to integers.  """
+
+from __future__ import division
+from __future__ import print_function
+from __future__ import absolute_import
+
+import numpy
+
+from fusion import add_weighted, match_linear, match_histogram
+from fusion import bit_depth_range, round_clamp
+
+
+def test_add_weighted_and_match():
+    msx = numpy.array([[10., 20.], [30., numpy.nan]])
+    hpf = numpy.array([[1., -1.], [2., 0.]])
+    fused = add_weighted([(msx, 1), (hpf, 0.5)])
+    numpy.testing.assert_array_equal(fused, [[10.5, 19.5], [31, numpy.nan]])
+    matched = match_linear(fused, 20, 10, 100, 5)
+    numpy.testing.assert_allclose(matched, [[95.25, 99.75],
+                                            [105.5, numpy.nan]])
+
+
+def test_match_histogram():
+    table = [0., 10., 40.]
+    array = numpy.array([-5., 0., 2.5, 5., 7.5, 10., 12., numpy.nan])
+    matched = match_histogram(array, 0, 10, table)
+    numpy.testing.assert_allclose(matched, [0, 0, 5, 10, 25, 40, 40,
+                                            numpy.nan])
+    inside = numpy.linspace(0, 10, 41)
+    numpy.testing.assert_allclose(match_histogram(inside, 0, 10, table),
+                                  numpy.interp(inside, [0, 5, 10], table))
+
+
+def test_bit_depth_range():
+    assert bit_depth_range(0, 2047) == (0, 2047)
+    assert bit_depth_range(3, 1500) == (0, 2047)
+    assert bit_depth_range(0, 2048) == (0, 4095)
+    assert bit_depth_range(0, 255) == (0, 255)
+    assert bit_depth_range(-100, 200.5) == (-256, 255)
+    assert bit_depth_range(0, 0) == (0, 1)
+
+
+def test_round_clamp():
+    fused = numpy.array([-3.2, 0.4, 1000.6, 2050., numpy.nan])
+    clamped = round_clamp(fused, 0, 2047)
+    numpy.testing.assert_array_equal(clamped, [0, 0, 1001, 2047, numpy.nan])
+    # halves away from zero, as r.mapcalc's round()
+    halves = numpy.array([-2.5, -1.5, -0.5, 0.5, 1.5, 2.5])
+    numpy.testing.assert_array_equal(round_clamp(halves, -10, 10),
+                                     [-3, -2, -1, 1, 2, 3])
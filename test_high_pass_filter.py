@@ -9,7 +9,20 @@ from __future__ import print_function
 from __future__ import absolute_import
 
 
+import numpy
+import pytest
+
+from constants import MATRIX_PROPERTIES, KERNEL_SIZES, LEVELS
 from high_pass_filter import get_row, get_mid_row, get_kernel, get_center_cell
+from high_pass_filter import get_kernel_size, get_kernel_sizes
+from high_pass_filter import get_center_cells, get_modulator_factor
+from high_pass_filter import get_modulator_factors, get_high_pass_filter
+from high_pass_filter import get_kernels
+from high_pass_filter import get_kernel_properties, format_filter
+from high_pass_filter import fuse, get_weight
+from box_filter import high_pass
+from moments import Moments
+from upsample import upsample_bilinear
 
 
 def test_get_row():
@@ -42,3 +55,88 @@ def test_get_kernel():
                 assert row == get_mid_row(size, center)
             else:
                 assert row == get_row(size)
+
+
+def test_get_kernel_size():
+    # lookups do not exhaust the table
+    for _ in range(2):
+        for (low, high), size in MATRIX_PROPERTIES:
+            assert get_kernel_size(low) == size
+            assert get_kernel_size(min(high, 20) - 0.01) == size
+    assert get_kernel_size(2.5) == 7
+    assert get_kernel_size(9.5) == 15
+
+
+def test_batch_lookups():
+    ratios = numpy.array([1, 2.49, 2.5, 4, 6, 8, 9.5, 30])
+    sizes = get_kernel_sizes(ratios)
+    assert list(sizes) == [get_kernel_size(ratio) for ratio in ratios]
+    for level in LEVELS:
+        assert (list(get_center_cells(level, sizes)) ==
+                [get_center_cell(level, size) for size in sizes])
+        for kernel, size in zip(get_kernels(level, ratios), sizes):
+            assert kernel.size == size
+            assert kernel.array.tolist() == get_kernel(size, level)
+            assert kernel.coefficients == (get_center_cell(level, size) + 1,
+                                           -1)
+    for modulation in ("Min", "Mid", "Max"):
+        assert (list(get_modulator_factors(modulation, ratios)) ==
+                [get_modulator_factor(modulation, ratio) for ratio in ratios])
+    with pytest.raises(ValueError):
+        get_kernel_sizes([0.5, 2])
+    with pytest.raises(ValueError):
+        get_center_cells('Low', [5, 6])
+
+
+def test_get_kernel_properties():
+    for size in KERNEL_SIZES:
+        for level in LEVELS:
+            kernel = get_kernel_properties(size, level)
+            assert kernel.array.tolist() == get_kernel(size, level)
+            assert not kernel.array.flags.writeable
+            assert kernel.filter == format_filter(get_kernel(size, level))
+            assert kernel.coefficients == (kernel.center + 1, -1)
+    assert get_high_pass_filter(4, "Mid") == get_kernel_properties(9, "Mid").filter
+
+
+def synthetic_pair(ratio, size=40):
+    random = numpy.random.RandomState(ratio)
+    pan = random.uniform(0, 2047, (size, size))
+    msx = pan.reshape(size // ratio, ratio, size // ratio, ratio)
+    return pan, msx.mean(axis=(1, 3))
+
+
+def test_fuse():
+    pan, msx = synthetic_pair(4)
+    fused, = fuse(pan, [msx], 4, center='mid', modulation='max')
+    size = get_kernel_size(4)
+    hpf = high_pass(pan, size, get_center_cell('mid', size))
+    weight = get_weight(Moments.from_array(msx).stddev,
+                        Moments.from_array(hpf).stddev,
+                        get_modulator_factor('max', 4))
+    expected = upsample_bilinear(msx, 4) + hpf * weight
+    numpy.testing.assert_array_equal(fused, expected)
+
+    # bands at the resolution of pan, histogram matching
+    upsampled = upsample_bilinear(msx, 4)
+    matched, = fuse(pan, [upsampled], 4, histogram_match=True)
+    statistics = Moments.from_array(upsampled)
+    assert numpy.nanmean(matched) == pytest.approx(statistics.mean)
+    assert numpy.nanstd(matched) == pytest.approx(statistics.stddev)
+
+
+def test_fuse_second_pass():
+    pan, msx = synthetic_pair(8)
+    first, = fuse(pan, [msx], 8)
+    both, = fuse(pan, [msx], 8, second_pass=True, center2='high')
+    assert not numpy.array_equal(first, both, equal_nan=True)
+    pan, msx = synthetic_pair(5)
+    assert numpy.array_equal(fuse(pan, [msx], 5)[0],
+                             fuse(pan, [msx], 5, second_pass=True)[0],
+                             equal_nan=True)  # ratio < 5.5, no 2nd pass
+
+
+def test_fuse_non_integer_ratio():
+    pan, msx = synthetic_pair(4)
+    with pytest.raises(ValueError):
+        fuse(pan, [msx], 4.5)
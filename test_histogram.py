@@ -0,0 +1,81 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+""" Test histogram matching via lookup tables.  """
+
+from __future__ import division
+from __future__ import print_function
+from __future__ import absolute_import
+
+import numpy
+
+from fusion import match_histogram
+from histogram import Histogram, histogram_quantum, matching_table
+
+
+def test_histogram_from_array():
+    array = numpy.array([[0.5, 1.5, numpy.nan], [1.7, -0.2, 3.9]])
+    histogram = Histogram.from_array(array, 1.0)
+    assert histogram.offset == -1
+    numpy.testing.assert_array_equal(histogram.counts, [1, 1, 2, 0, 1])
+    assert histogram.count == 5
+    numpy.testing.assert_array_equal(histogram.edges(), [-1, 0, 1, 2, 3, 4])
+    numpy.testing.assert_allclose(histogram.cdf(), [0, .2, .4, .8, .8, 1])
+
+    valid = numpy.array([[1, numpy.nan, 1], [1, 1, numpy.nan]])
+    masked = Histogram.from_array(array, 1.0, valid)
+    numpy.testing.assert_array_equal(masked.counts, [1, 1, 1])
+
+
+def test_histogram_merge():
+    random = numpy.random.RandomState(7)
+    array = random.normal(500, 40, size=(120, 30))
+    whole = Histogram.from_array(array, 2.5)
+    tiles = [Histogram.from_array(array[start:start + 11], 2.5)
+             for start in range(0, len(array), 11)]
+    random.shuffle(tiles)
+    merged = Histogram(2.5)
+    for tile in tiles:
+        merged.merge(tile)
+    assert merged.offset == whole.offset
+    numpy.testing.assert_array_equal(merged.counts, whole.counts)
+    assert merged.merge(Histogram(2.5)).count == array.size
+
+
+def test_histogram_quantiles():
+    histogram = Histogram(1.0, 0, numpy.array([2, 0, 2]))
+    numpy.testing.assert_allclose(histogram.quantiles([0, .25, .75, .875, 1]),
+                                  [0, .5, 2.5, 2.75, 3])  # skipping [1, 2]
+
+
+def test_histogram_quantum():
+    assert histogram_quantum(64.) == 1.
+    assert histogram_quantum(0.) == 1.
+    assert histogram_quantum(float('nan')) == 1.
+
+
+def test_matching_table():
+    random = numpy.random.RandomState(11)
+    source = random.gamma(2., 100., size=(200, 100))
+    target = random.normal(300, 120, size=(300, 70))
+    target[::13, ::7] = numpy.nan
+    quantum = histogram_quantum(source.std())
+    matching = matching_table(Histogram.from_array(source, quantum),
+                              Histogram.from_array(target, quantum))
+    assert len(matching['table']) == 257
+    assert numpy.all(numpy.diff(matching['table']) >= 0)
+
+    matched = match_histogram(target, **matching)
+    assert numpy.array_equal(numpy.isnan(matched), numpy.isnan(target))
+    matched = matched[~numpy.isnan(matched)]
+    percentiles = [1, 10, 25, 50, 75, 90, 99]
+    numpy.testing.assert_allclose(numpy.percentile(matched, percentiles),
+                                  numpy.percentile(source, percentiles),
+                                  rtol=0.02)
+
+
+def test_matching_table_empty():
+    empty = Histogram(1.0)
+    full = Histogram.from_array(numpy.arange(10.), 1.0)
+    assert matching_table(empty, full) is None
+    assert matching_table(full, empty) is None
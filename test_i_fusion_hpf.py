@@ -0,0 +1,125 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+""" Test the functions of the module, within a GRASS GIS session.  """
+
+from __future__ import division
+from __future__ import print_function
+from __future__ import absolute_import
+
+import os
+import time
+
+import numpy
+import pytest
+
+SCRIPT = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                      'i.fusion.hpf.py')
+
+
+@pytest.fixture(scope='module')
+def module():
+    pytest.importorskip('grass.script')
+    if 'GISBASE' not in os.environ:
+        pytest.skip("requires a GRASS GIS session")
+    try:
+        try:
+            from importlib.util import spec_from_file_location
+            from importlib.util import module_from_spec
+        except ImportError:  # Python 2
+            import imp
+            return imp.load_source('i_fusion_hpf', SCRIPT)
+        spec = spec_from_file_location('i_fusion_hpf', SCRIPT)
+        loaded = module_from_spec(spec)
+        spec.loader.exec_module(loaded)
+        return loaded
+    except ImportError as error:  # i.e. the module is not installed
+        pytest.skip(str(error))
+
+
+def test_univar_tiled_settings(module, monkeypatch):
+    received = {}
+
+    def tiled_moments(terms, tile_size, procs, index=None):
+        received.update(terms=terms, tile_size=tile_size, procs=procs)
+        return module.Moments.from_array(numpy.array([[1.0, 3.0]]))
+
+    options = dict(statistics='tiles', tile_size='256', nprocs='1')
+    monkeypatch.setattr(module, 'tiled_statistics',
+                        module.tiled_settings(options))
+    monkeypatch.setattr(module, 'tiled_moments', tiled_moments)
+    monkeypatch.setattr(module, 'statistics_key', lambda img: (img, 0))
+    monkeypatch.setattr(module, 'univar_cache', {})
+    assert module.univar('Red')['mean'] == 2
+    assert received == dict(terms=[('Red', 1)], tile_size=256, procs=1)
+    assert module.tiled_settings(dict(options, statistics='univar')) is None
+
+
+def test_hpf_weight_constant_band(module):
+    assert module.hpf_weight(0, 5, 0.25, 1) == 0
+    assert module.hpf_weight(0, 5, 0.25, 1, 0.0, 0.1) == 0
+    assert module.hpf_weight(10, 5, 0.25, 2, 1, 0.1) == 0.5
+
+
+def test_filtered_statistics_after_rewriting_pan(module):
+    grass = module.grass
+    pan = 'test_i_fusion_hpf_pan'
+    grass.use_temp_region()
+    try:
+        grass.run_command('g.region', n=40, s=0, e=40, w=0, res=1)
+        grass.mapcalc('{p} = rand(0, 100)'.format(p=pan), seed=1,
+                      overwrite=True)
+        filtered = module.Filtered(pan, 5, 24)
+        before = module.sampled_univar(filtered, 0.25)
+        time.sleep(1)  # modification times of a second resolution
+        grass.mapcalc('{p} = rand(0, 1000)'.format(p=pan), seed=2,
+                      overwrite=True)
+        after = module.sampled_univar(filtered, 0.25)
+        assert after is not before
+        assert after.stddev != before.stddev
+    finally:
+        grass.run_command('g.remove', flags='f', type='raster', name=pan)
+        grass.del_temp_region()
+
+
+def test_fused_statistics_mismatched_nulls(module):
+    """Statistics of the fused image, accumulated over its tiles, cover the
+    cells which are not NULL in any term only: the upsampled image has a NULL
+    edge ring, the HPF image of r.mfilter copies raw values in its border."""
+    grass = module.grass
+    msx, hpf = 'test_i_fusion_hpf_msx', 'test_i_fusion_hpf_hpf'
+    grass.use_temp_region()
+    try:
+        grass.run_command('g.region', n=40, s=0, e=50, w=0, res=1)
+        grass.mapcalc('{m} = if(row() <= 2 || row() > 38 || col() <= 2 || '
+                      'col() > 48, null(), rand(200.0, 400.0))'.format(m=msx),
+                      seed=2, overwrite=True)
+        # unfiltered border of Panchromatic values
+        grass.mapcalc('{h} = if(row() <= 3 || row() > 37, 800, '
+                      'rand(-20.0, 20.0))'.format(h=hpf), seed=3,
+                      overwrite=True)
+        module.set_region()
+        arrays = []
+        for name in (msx, hpf):
+            with module.RowReader(name) as reader:
+                arrays.append(reader.read(0, reader.rows))
+        common = ~numpy.isnan(arrays[0]) & ~numpy.isnan(arrays[1])
+        expected = arrays[0][common] + 0.4 * arrays[1][common]
+
+        terms = [(msx, 1), (hpf, 0.4)]
+        tile_size = 0.01  # megabytes, tiles of 3 rows
+        moments = module.moments_job((terms, tile_size, None, 0, 40))
+        assert moments.count == common.sum()
+        assert numpy.isclose(moments.mean, expected.mean())
+        assert numpy.isclose(moments.stddev, expected.std())
+        mean, stddev = module.fused_statistics_numpy(terms, tile_size)
+        assert numpy.isclose(mean, expected.mean())
+        assert numpy.isclose(stddev, expected.std())
+
+        # averages of the terms over their own cells are biased by the border
+        biased = numpy.nanmean(arrays[0]) + 0.4 * numpy.nanmean(arrays[1])
+        assert abs(biased - expected.mean()) > 10
+    finally:
+        grass.run_command('g.remove', flags='f', type='raster',
+                          name=[msx, hpf])
+        grass.del_temp_region()
@@ -0,0 +1,94 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+""" Test instrumentation of stages.  """
+
+from __future__ import division
+from __future__ import print_function
+from __future__ import absolute_import
+
+import json
+
+import pytest
+
+import instrumentation
+from instrumentation import report, stage, note, staged
+
+
+@pytest.fixture
+def enabled(monkeypatch):
+    monkeypatch.setattr(instrumentation, 'enabled', False)
+    monkeypatch.setattr(instrumentation, 'temporary_disk', None)
+    instrumentation.enable(disk=lambda: 1024)
+
+
+def test_disabled(monkeypatch):
+    monkeypatch.setattr(instrumentation, 'enabled', False)
+    calls = []
+    with report(msx='Red') as band:
+        with stage('Upsampling', pixels=lambda: calls.append(1)):
+            note(weights=[0.5])
+    assert band is None
+    assert calls == []
+
+
+def test_report(enabled):
+    with report(msx='Red', pixels=4000000) as band:
+        with stage('Fusion', pixels=lambda: 4000000):
+            with stage('r.mapcalc'):
+                sum(range(1000))
+        note(weights=[0.5])
+    result = band.as_dict()
+    assert result['msx'] == 'Red'
+    assert result['weights'] == [0.5]
+    assert result['wall'] > 0
+    assert result['throughput'] == pytest.approx(4 / result['wall'])
+    assert [record['stage'] for record in result['stages']] == [
+        'Fusion/r.mapcalc', 'Fusion']
+    fusion = result['stages'][1]
+    assert fusion['pixels'] == 4000000
+    assert fusion['wall'] >= result['stages'][0]['wall']
+    assert fusion['temporary_disk'] == 1024
+    json.dumps(result)
+
+
+def test_nested_reports(enabled):
+    with report(run=True) as run:
+        with stage('Filtering'):
+            pass
+        with report(msx='Red') as band:
+            with stage('Upsampling'):
+                pass
+    assert [record['stage'] for record in run.stages] == ['Filtering']
+    assert [record['stage'] for record in band.stages] == ['Upsampling']
+    assert instrumentation.reports == []
+
+
+def test_stage_records_failures(enabled):
+    with report() as failing:
+        with pytest.raises(ValueError):
+            with stage('Failing'):
+                raise ValueError
+    assert failing.stages[0]['stage'] == 'Failing'
+
+
+def test_staged(enabled):
+    @staged('Filtering', pixels=lambda: 100)
+    def filtering(value):
+        return value * 2
+
+    with report() as filtered:
+        assert filtering(2) == 4
+    assert filtering.__name__ == 'filtering'
+    assert filtered.stages[0]['stage'] == 'Filtering'
+    assert filtered.stages[0]['pixels'] == 100
+
+
+def test_callbacks(enabled, monkeypatch):
+    monkeypatch.setattr(instrumentation, 'callbacks', [])
+    instrumentation.callbacks.append(
+        lambda record: record.update(sampled=record['stage']))
+    with report() as sampled:
+        with stage('Upsampling'):
+            pass
+    assert sampled.stages[0]['sampled'] == 'Upsampling'
@@ -0,0 +1,91 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+""" Test reading manifests of scenes.  """
+
+from __future__ import division
+from __future__ import print_function
+from __future__ import absolute_import
+
+import json
+
+import pytest
+
+from manifest import read_manifest, parse_scene, parse_job, scene_flags
+
+
+def test_read_csv_manifest(tmpdir):
+    path = tmpdir.join('scenes.csv')
+    path.write('pan,msx,ratio,flags\n'
+               'Pan_1,"Red_1, Green_1",,l\n'
+               'Pan_2,Red_2,4,\n')
+    scenes = read_manifest(str(path))
+    assert scenes == [
+        ({'pan': 'Pan_1', 'msx': 'Red_1,Green_1'}, 'l'),
+        ({'pan': 'Pan_2', 'msx': 'Red_2', 'ratio': '4'}, None),
+    ]
+
+
+def test_read_json_manifest(tmpdir):
+    path = tmpdir.join('scenes.json')
+    path.write(json.dumps([
+        {'pan': 'Pan_1', 'msx': ['Red_1', 'Green_1'], 'trim': 1.5},
+        {'pan': 'Pan_2', 'msx': 'Red_2', 'flags': '2c'},
+    ]))
+    scenes = read_manifest(str(path))
+    assert scenes == [
+        ({'pan': 'Pan_1', 'msx': 'Red_1,Green_1', 'trim': '1.5'}, None),
+        ({'pan': 'Pan_2', 'msx': 'Red_2'}, '2c'),
+    ]
+
+
+@pytest.mark.parametrize('entry', [
+    {'pan': 'Pan'},
+    {'msx': 'Red'},
+    {'pan': 'Pan', 'msx': 'Red', 'engine': 'numpy'},
+    {'pan': 'Pan', 'msx': 'Red', 'flags': 's'},
+])
+def test_parse_invalid_scene(entry):
+    with pytest.raises(ValueError):
+        parse_scene(entry, 1)
+
+
+def test_parse_job():
+    line = json.dumps({'id': 'aoi-7', 'pan': 'Pan_1', 'msx': ['Red_1'],
+                       'extent': [100, 0, 200, 50], 'flags': 'l'})
+    assert parse_job(line, 3) == ('aoi-7', [100, 0, 200, 50],
+                                  {'pan': 'Pan_1', 'msx': 'Red_1'}, 'l')
+    line = json.dumps({'pan': 'Pan_1', 'msx': 'Red_1',
+                       'extent': '100,0,200,50'})
+    assert parse_job(line, 3)[:2] == (3, [100, 0, 200, 50])
+    line = json.dumps({'pan': 'Pan_1', 'msx': 'Red_1'})
+    assert parse_job(line, 3)[:2] == (3, None)
+
+
+
+def test_parse_non_ascii_job():
+    line = json.dumps({'pan': u'Pan_\u00e9t\u00e9', 'msx': [u'R\u00f6d', 4],
+                       'suffix': u'.fus\u00e9'})
+    _, _, options, _ = parse_job(line, 1)
+    assert options == {'pan': u'Pan_\u00e9t\u00e9', 'msx': u'R\u00f6d,4',
+                       'suffix': u'.fus\u00e9'}
+
+
+@pytest.mark.parametrize('line', [
+    'Pan_1',
+    '["Pan_1", "Red_1"]',
+    '{"pan": "Pan_1", "msx": "Red_1", "extent": [100, 0, 200]}',
+    '{"pan": "Pan_1", "msx": "Red_1", "extent": [0, 100, 200, 50]}',
+    '{"pan": "Pan_1", "msx": "Red_1", "extent": "n,s,e,w"}',
+    '{"pan": "Pan_1", "extent": [100, 0, 200, 50]}',
+])
+def test_parse_invalid_job(line):
+    with pytest.raises(ValueError):
+        parse_job(line, 1)
+
+
+def test_scene_flags():
+    flags = {'l': False, '2': True, 'c': False, 's': True}
+    assert scene_flags(flags, None) == flags
+    assert scene_flags(flags, 'l') == {'l': True, '2': False, 'c': False,
+                                       's': True}
@@ -0,0 +1,68 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+""" Test accumulating statistics tile by tile.  """
+
+from __future__ import division
+from __future__ import print_function
+from __future__ import absolute_import
+
+import numpy
+
+from moments import Moments, merge_pairwise
+
+
+def test_moments_from_array():
+    array = numpy.array([[1, 2, numpy.nan], [4, 5, 6]])
+    moments = Moments.from_array(array)
+    values = array[~numpy.isnan(array)]
+    assert moments.count == 5
+    assert numpy.isclose(moments.mean, values.mean())
+    assert numpy.isclose(moments.stddev, values.std())
+    assert (moments.minimum, moments.maximum) == (1, 6)
+
+
+def test_moments_update():
+    random = numpy.random.RandomState(3)
+    array = random.normal(1000, 25, size=(101, 17))
+    moments = Moments()
+    for start in range(0, len(array), 10):
+        moments.update(array[start:start + 10])
+    assert moments.count == array.size
+    assert numpy.isclose(moments.mean, array.mean())
+    assert numpy.isclose(moments.stddev, array.std())
+    assert moments.minimum == array.min()
+    assert moments.maximum == array.max()
+
+
+def test_moments_empty():
+    moments = Moments().update(numpy.array([numpy.nan]))
+    assert moments.count == 0
+    assert numpy.isnan(moments.stddev)
+
+
+def test_merge_pairwise():
+    random = numpy.random.RandomState(5)
+    array = random.normal(1e6, 3, size=(230, 31))
+    array[17:40, 3] = numpy.nan
+    values = array[~numpy.isnan(array)]
+    partials = [Moments.from_array(array[start:start + 7])
+                for start in range(0, len(array), 7)]
+    counts = [partial.count for partial in partials]
+    merged = merge_pairwise(partials)
+    assert merged.count == values.size
+    assert numpy.isclose(merged.mean, values.mean(), rtol=1e-14)
+    assert numpy.isclose(merged.stddev, values.std(), rtol=1e-9)
+    assert (merged.minimum, merged.maximum) == (values.min(), values.max())
+    assert [partial.count for partial in partials] == counts  # unmodified
+
+    shuffled = list(partials)
+    random.shuffle(shuffled)
+    other = merge_pairwise(shuffled)
+    assert numpy.isclose(other.mean, merged.mean, rtol=1e-14)
+    assert numpy.isclose(other.stddev, merged.stddev, rtol=1e-9)
+
+
+def test_merge_pairwise_empty():
+    assert merge_pairwise([]).count == 0
+    assert merge_pairwise([Moments(), Moments()]).count == 0
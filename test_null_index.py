@@ -0,0 +1,51 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+""" Test indexing NULL cells.  """
+
+from __future__ import division
+from __future__ import print_function
+from __future__ import absolute_import
+
+import numpy
+
+from null_index import valid_columns, NullIndex
+
+
+def strip():
+    array = numpy.ones((8, 10))
+    array[:2] = numpy.nan
+    array[2, :] = numpy.nan
+    array[3, 6:] = numpy.nan
+    array[4:, :3] = numpy.nan
+    array[4:, 8:] = numpy.nan
+    return array
+
+
+def test_valid_columns():
+    array = strip()
+    assert valid_columns(array) == (0, 8)
+    assert valid_columns(array[4:]) == (3, 8)
+    assert valid_columns(array[:3]) is None
+
+
+def test_null_index():
+    array = strip()
+    index = NullIndex(8, 10)
+    assert index.span(0, 8) == (0, 10)  # nothing recorded yet
+    index.update(0, array[:5])
+    index.update(5, array[5:])
+    assert index.span(0, 3) is None
+    assert index.span(3, 4) == (0, 6)
+    assert index.span(2, 8) == (0, 8)
+    assert index.span(5, 8) == (3, 8)
+
+
+def test_null_index_window():
+    index = NullIndex(8, 10)
+    index.update(0, strip())
+    window = index.window(2, 4, 5, 5)
+    assert window.span(0, 1) is None
+    assert window.span(1, 2) == (0, 2)
+    assert window.span(2, 5) == (0, 4)
+    assert index.window(3, 6, 1, 4).span(0, 1) is None
@@ -0,0 +1,52 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+""" Test profiling of the Python side of the module.  """
+
+from __future__ import division
+from __future__ import print_function
+from __future__ import absolute_import
+
+import pstats
+
+import pytest
+
+import profiling
+from profiling import profiled, tracemalloc
+
+
+def allocate():
+    return [list(range(100)) for _ in range(100)]
+
+
+def test_profiled(tmpdir):
+    basename = str(tmpdir.join('i.fusion.hpf.1'))
+    with profiled(basename, top=5) as profiler:
+        allocate()
+        profiler.sample({'stage': 'Allocating'})
+    stats = pstats.Stats(basename + '.prof')
+    assert any(function == 'allocate' for _, _, function in stats.stats)
+    summary = tmpdir.join('i.fusion.hpf.1.txt').read()
+    assert 'Top 5 functions by cumulative time' in summary
+    if tracemalloc:
+        assert 'Top 5 lines by allocated memory' in summary
+        assert 'Allocating: ' in summary
+
+
+def test_profiled_on_error(tmpdir):
+    basename = str(tmpdir.join('failing'))
+    with pytest.raises(SystemExit):
+        with profiled(basename):
+            raise SystemExit(1)
+    assert tmpdir.join('failing.prof').check()
+    assert tmpdir.join('failing.txt').check()
+
+
+def test_profiled_without_tracemalloc(tmpdir, monkeypatch):
+    monkeypatch.setattr(profiling, 'tracemalloc', None)
+    basename = str(tmpdir.join('untraced'))
+    with profiled(basename) as profiler:
+        profiler.sample({'stage': 'Allocating'})
+    summary = tmpdir.join('untraced.txt').read()
+    assert 'Memory allocations not traced' in summary
+    assert 'Memory traced per stage not available' in summary
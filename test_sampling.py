@@ -0,0 +1,70 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+""" Test stratified sampling.  """
+
+from __future__ import division
+from __future__ import print_function
+from __future__ import absolute_import
+
+import numpy
+import pytest
+
+from sampling import stratified_sample, row_runs, run_length, rows_fraction
+from sampling import stddev_error, weight_error
+
+
+def test_stratified_sample():
+    sample = stratified_sample(95, 103, 0.01)
+    assert len(sample) == 10
+    for index, (row, columns) in enumerate(sample):
+        assert index * 10 <= row < min(index * 10 + 10, 95)
+        assert len(columns) == 11
+        assert all(col // 10 == stratum for stratum, col in enumerate(columns))
+        assert columns.max() < 103
+
+
+def test_stratified_sample_is_deterministic():
+    first = stratified_sample(50, 50, 0.04)
+    second = stratified_sample(50, 50, 0.04)
+    for (row, columns), (row2, columns2) in zip(first, second):
+        assert row == row2
+        assert numpy.array_equal(columns, columns2)
+
+
+def test_stratified_sample_fraction():
+    with pytest.raises(ValueError):
+        stratified_sample(10, 10, 0)
+    sample = stratified_sample(10, 10, 1)
+    assert sum(len(columns) for _, columns in sample) == 100
+
+
+def test_stratified_sample_runs():
+    sample = stratified_sample(300, 103, 0.01, run=run_length(7))
+    runs = list(row_runs(sample))
+    assert len(runs) == 3
+    for index, (start, stop, columns) in enumerate(runs):
+        assert stop - start == len(columns) == 14
+        assert index * 140 <= start and stop <= min(index * 140 + 140, 300)
+    assert sum(len(columns) for _, columns in sample) == 3 * 14 * 11
+
+
+def test_rows_fraction():
+    # 1% of the cells, 15x15 kernel: runs of 14 rows per band of 140
+    assert rows_fraction(0.01, 7) == pytest.approx(0.2)
+    assert rows_fraction(0.01, 0) == pytest.approx(0.1)
+    # sampling reads every row (and more, row by row) if 2 * halo >= step
+    assert rows_fraction(0.25, 7) == 1
+
+
+def test_stddev_error():
+    assert stddev_error(10, 51) == 1
+    assert stddev_error(10, 1) == float('inf')
+
+
+def test_weight_error():
+    assert weight_error(2, 10, 1, 5, 0) == pytest.approx(0.2)
+    assert weight_error(2, 10, 1, 5, 0.5) == pytest.approx(2 * 0.1 * 2 ** 0.5)
+    # constant Multi-Spectral image: weight and error 0
+    assert weight_error(0, 0, 0.0, 5, 0.5) == 0
+    assert weight_error(0, 0, float('inf'), 5, 0) == 0
@@ -0,0 +1,67 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+""" Test splitting the region in tiles.  """
+
+from __future__ import division
+from __future__ import print_function
+from __future__ import absolute_import
+
+import numpy
+
+from tiling import rows_per_tile, tiles, halo_range, inner_range
+from tiling import inner_tile
+from moments import Moments
+
+
+def test_rows_per_tile():
+    assert rows_per_tile(1, 1024) == 16
+    assert rows_per_tile(1, 1024, halo=2) == 12
+    assert rows_per_tile(1, 10 ** 9, halo=7) == 1
+
+
+def test_tiles():
+    assert list(tiles(10, 4)) == [(0, 4), (4, 8), (8, 10)]
+    assert list(tiles(8, 4)) == [(0, 4), (4, 8)]
+
+
+def test_halo_range():
+    assert halo_range(0, 4, 2, 10) == (0, 6)
+    assert halo_range(4, 8, 2, 10) == (2, 10)
+    assert halo_range(8, 10, 2, 10) == (6, 10)
+
+
+def test_inner_range():
+    assert inner_range(0, 4, 2, 3, 10) == (2, 4)
+    assert inner_range(4, 8, 2, 3, 10) == (0, 3)
+    first, last = inner_range(8, 10, 2, 3, 10)
+    assert first >= last
+
+
+def test_inner_tile():
+    image = numpy.arange(60.).reshape(10, 6)
+    assert inner_tile(image[:2], 0, 10, (2, 1, 1, 2)) is None
+    assert inner_tile(image[8:], 8, 10, (2, 2, 0, 0)) is None
+    numpy.testing.assert_array_equal(inner_tile(image[:4], 0, 10,
+                                                (2, 1, 1, 2)),
+                                     image[2:4, 1:4])
+    numpy.testing.assert_array_equal(inner_tile(image[8:], 8, 10),
+                                     image[8:])
+
+
+def test_moments_within_trimmed_extent():
+    # statistics accumulated tile by tile over a region expanded by margins
+    # (the halo of a kernel) are the ones of the trimmed extent only
+    image = numpy.random.RandomState(1).normal(size=(23, 17))
+    top, bottom, left, right = 3, 2, 4, 1
+    moments = Moments()
+    for start, stop in tiles(23, 5):
+        inner = inner_tile(image[start:stop], start, 23,
+                           (top, bottom, left, right))
+        if inner is not None:
+            moments.update(inner)
+    trimmed = image[top:23 - bottom, left:17 - right]
+    assert moments.count == trimmed.size
+    assert numpy.isclose(moments.mean, trimmed.mean())
+    assert numpy.isclose(moments.stddev, trimmed.std())
+    assert not numpy.isclose(moments.stddev, image.std())
@@ -0,0 +1,88 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+""" Test bilinear upsampling by integer ratios.  """
+
+from __future__ import division
+from __future__ import print_function
+from __future__ import absolute_import
+
+import math
+
+import numpy
+import pytest
+
+from upsample import integer_ratio, bilinear_rows, upsample_bilinear
+
+
+def reference(array, ratio, rows, cols):
+    """Cell by cell bilinear interpolation, as in r.resamp.interp"""
+    def cell(row, col):
+        if 0 <= row < array.shape[0] and 0 <= col < array.shape[1]:
+            return array[row, col]
+        return numpy.nan
+
+    upsampled = numpy.empty((rows, cols))
+    for row in range(rows):
+        v = (row + 0.5) / ratio - 0.5
+        row0 = int(math.floor(v))
+        v -= row0
+        for col in range(cols):
+            u = (col + 0.5) / ratio - 0.5
+            col0 = int(math.floor(u))
+            u -= col0
+            c0 = u * (cell(row0, col0 + 1) - cell(row0, col0)) + \
+                cell(row0, col0)
+            c1 = u * (cell(row0 + 1, col0 + 1) - cell(row0 + 1, col0)) + \
+                cell(row0 + 1, col0)
+            upsampled[row, col] = v * (c1 - c0) + c0
+    return upsampled
+
+
+@pytest.mark.parametrize('ratio', [1, 2, 3, 4])
+def test_upsample_bilinear(ratio):
+    array = numpy.random.RandomState(ratio).uniform(0, 100, (7, 9))
+    array[3, 4] = numpy.nan
+    upsampled = upsample_bilinear(array, ratio)
+    expected = reference(array, ratio, 7 * ratio, 9 * ratio)
+    numpy.testing.assert_array_equal(numpy.isnan(upsampled),
+                                     numpy.isnan(expected))
+    numpy.testing.assert_allclose(upsampled, expected, rtol=1e-12)
+
+
+def test_upsample_partial_cells():
+    array = numpy.random.RandomState(0).uniform(0, 100, (5, 6))
+    upsampled = upsample_bilinear(array, 4, rows=18, cols=21)
+    numpy.testing.assert_allclose(upsampled, reference(array, 4, 18, 21),
+                                  rtol=1e-12)
+
+
+def test_bilinear_rows_by_blocks():
+    array = numpy.random.RandomState(1).uniform(0, 100, (10, 8))
+    whole = upsample_bilinear(array, 3)
+    reads = []
+
+    def read(first, last):
+        reads.append((first, last))
+        return array[first:last]
+
+    for start, stop in [(0, 1), (1, 7), (7, 16), (16, 30)]:
+        block = bilinear_rows(read, 10, 3, start, stop, 24)
+        numpy.testing.assert_array_equal(block, whole[start:stop])
+    assert all(0 <= first < last <= 10 for first, last in reads)
+
+
+def grid(n, s, e, w, res):
+    return dict(n=n, s=s, e=e, w=w, nsres=res, ewres=res)
+
+
+def test_integer_ratio():
+    fine = grid(1000, 0, 1000, 0, 2.5)
+    assert integer_ratio(grid(1000, 0, 1000, 0, 10), fine) == 4
+    assert integer_ratio(grid(990, 10, 990, 10, 10), fine) == 4
+    # non integer ratio
+    assert integer_ratio(grid(1000, 0, 1000, 0, 7.5 * 1.2), fine) is None
+    # edges of the fine grid do not fall on lines of the coarse grid
+    assert integer_ratio(grid(995, 5, 995, 5, 10), fine) is None
+    # coarse grid extending beyond the fine one
+    assert integer_ratio(grid(1010, 0, 1000, 0, 10), fine) is None
@@ -0,0 +1,65 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Splitting the rows of the computational region in tiles, processed one at a
+time, so that the memory in use is set by the size of a tile rather than by
+the size of the region.
+
+Tiles span entire rows. Filtering a tile requires a few more rows above and
+below it, its halo, which are read along with the tile yet not written.
+"""
+
+BYTES_PER_CELL = 8  # double precision floating point arrays
+ARRAYS_PER_TILE = 8  # input, masks, cumulative sums, output
+
+
+def rows_per_tile(tile_size, cols, halo=0):
+    """
+    Return the number of rows of a tile whose arrays fit in `tile_size`
+    megabytes, excluding the `halo` rows read above and below it. A tile
+    consists of at least one row.
+    """
+    cells = tile_size * 2 ** 20 // (BYTES_PER_CELL * ARRAYS_PER_TILE)
+    return max(int(cells // cols) - 2 * halo, 1)
+
+
+def tiles(rows, tile_rows):
+    """
+    Yield the (start, stop) range of rows of each tile of `tile_rows` rows,
+    covering `rows` rows in sequence.
+    """
+    for start in range(0, rows, tile_rows):
+        yield start, min(start + tile_rows, rows)
+
+
+def halo_range(start, stop, halo, rows):
+    """
+    Return the (first, last) range of rows to read for the tile of rows
+    `start` to `stop`, extended by `halo` rows above and below it, within
+    the `rows` rows of the region.
+    """
+    return max(start - halo, 0), min(stop + halo, rows)
+
+
+def inner_range(start, stop, top, bottom, rows):
+    """
+    Return the (first, last) range of rows, relative to the tile of rows
+    `start` to `stop`, lying within the `rows` rows of the region less `top`
+    and `bottom` rows of margin. The range is empty if `first >= last`.
+    """
+    return max(top - start, 0), min(rows - bottom, stop) - start
+
+
+def inner_tile(tile, start, rows, margins=None):
+    """
+    Return the part of a 2D `tile`, starting at row `start` of the `rows`
+    rows of the region, lying within the `margins`, (top, bottom, left,
+    right) rows and columns around the region (i.e. the halo of a kernel
+    around a trimmed extent), or None if the tile lies within the margins.
+    """
+    top, bottom, left, right = margins or (0, 0, 0, 0)
+    first, last = inner_range(start, start + len(tile), top, bottom, rows)
+    if last <= first:
+        return None
+    return tile[first:last, left:tile.shape[1] - right]
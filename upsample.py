@@ -0,0 +1,123 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Bilinear upsampling of NumPy arrays by integer ratios.
+
+Upsampling a coarse grid by an integer `ratio` splits each of its cells in
+`ratio` x `ratio` fine cells. The center of a fine cell lies at one of
+`ratio` fixed positions between the centers of the coarse cells around it,
+along each axis. Hence, bilinear interpolation is a separable stencil whose
+weights repeat every `ratio` cells.
+
+The interpolation replicates `r.resamp.interp method=bilinear`: columns are
+interpolated before rows, as in `Rast_interp_bilinear`, and fine cells
+depending on a NULL (NaN) coarse cell, including cells beyond the edges of
+the coarse grid, are NULL.
+"""
+
+import numpy
+
+
+def bilinear_positions(start, stop, ratio):
+    """
+    Return the positions of fine cells `start` to `stop` (exclusive) along
+    an axis of the coarse grid: the index of the preceding coarse cell (-1
+    before the first cell) and the weight of the following one.
+    """
+    position = (numpy.arange(start, stop) + 0.5) / ratio - 0.5
+    lower = numpy.floor(position).astype(int)
+    return lower, position - lower
+
+
+def interpolate(lower, upper, weight):
+    """Linear interpolation, as in `Rast_interp_linear`"""
+    return weight * (upper - lower) + lower
+
+
+def integer_ratio(coarse, fine, tolerance=1e-6):
+    """
+    Return the integer ratio of the resolution of a `coarse` grid to the one
+    of a `fine` grid, if every coarse cell consists of `ratio` x `ratio` fine
+    cells and the coarse grid lies within the extent of the fine one, or
+    None otherwise.
+
+    Parameters
+    ----------
+    coarse, fine: dict
+        The extent ('n', 's', 'e', 'w') and resolution ('nsres', 'ewres') of
+        the grids.
+    """
+    ratio = int(round(coarse['nsres'] / fine['nsres']))
+    if ratio < 1:
+        return None
+    for resolution in ('nsres', 'ewres'):
+        if abs(coarse[resolution] / fine[resolution] - ratio) > tolerance:
+            return None
+
+    # the edges of the fine grid are lines of the coarse grid
+    for edge, resolution in (('n', 'nsres'), ('w', 'ewres')):
+        lines = (coarse[edge] - fine[edge]) / coarse[resolution]
+        if abs(lines - round(lines)) > tolerance:
+            return None
+
+    margin = tolerance * fine['nsres']
+    if (coarse['n'] > fine['n'] + margin or coarse['s'] < fine['s'] - margin or
+            coarse['e'] > fine['e'] + margin or
+            coarse['w'] < fine['w'] - margin):
+        return None
+    return ratio
+
+
+def bilinear_rows(read, rows, ratio, start, stop, cols):
+    """
+    Upsample bilinearly rows `start` to `stop` (exclusive) of the fine grid.
+
+    Parameters
+    ----------
+    read: callable
+        `read(first, last)` returns rows `first` to `last` (exclusive) of
+        the coarse grid as a 2D array.
+    rows: int
+        Number of rows of the coarse grid.
+    ratio: int
+        Ratio of the resolution of the coarse grid to the one of the fine
+        grid.
+    start, stop: int
+        Range of rows of the fine grid.
+    cols: int
+        Number of columns of the fine grid.
+
+    Returns
+    -------
+    upsampled: numpy.ndarray
+        Array of `stop - start` rows and `cols` columns.
+    """
+    lower, weight = bilinear_positions(start, stop, ratio)
+    first, last = lower[0], lower[-1] + 2  # coarse rows around the fine ones
+
+    # coarse rows, and a column on either side, NaN beyond the edges
+    valid = read(max(first, 0), min(last, rows))
+    block = numpy.full((last - first, valid.shape[1] + 2), numpy.nan)
+    offset = max(first, 0) - first
+    block[offset:offset + valid.shape[0], 1:-1] = valid
+
+    # columns first, then rows
+    col_lower, col_weight = bilinear_positions(0, cols, ratio)
+    horizontal = interpolate(block[:, col_lower + 1], block[:, col_lower + 2],
+                             col_weight)
+    lower = lower - first
+    return interpolate(horizontal[lower], horizontal[lower + 1],
+                       weight[:, numpy.newaxis])
+
+
+def upsample_bilinear(array, ratio, rows=None, cols=None):
+    """
+    Upsample bilinearly a 2D `array` by an integer `ratio`, to `rows` x
+    `cols` cells (by default, `ratio` times the ones of `array`).
+    """
+    array = numpy.asarray(array, dtype=numpy.float64)
+    rows = array.shape[0] * ratio if rows is None else rows
+    cols = array.shape[1] * ratio if cols is None else cols
+    return bilinear_rows(lambda first, last: array[first:last],
+                         array.shape[0], ratio, 0, rows, cols)